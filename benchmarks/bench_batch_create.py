@@ -0,0 +1,88 @@
+"""
+This is a benchmark of onboarding users in bulk. It compares creating users
+one at a time the way the create handler does (an existence query, an insert
+and a commit per user) with a single call to the batch handler.
+
+Usage: python benchmarks/bench_batch_create.py [COUNT ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+# point the app at a scratch database before it is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DB_PATH
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from yahtzee import create_app, db  # noqa: E402
+from yahtzee.models import User  # noqa: E402
+from yahtzee.swagger_users import create_batch  # noqa: E402
+from yahtzee.users.hashing import UNUSABLE_PASSWORD  # noqa: E402
+
+app = create_app(config={'SQLALCHEMY_ECHO': False})
+
+COUNTS = [1000, 10000]
+
+
+def make_users(prefix, count):
+    return [
+        {
+            'username': f'{prefix}{i}',
+            'first_name': 'First',
+            'last_name': f'Last{i % 5000:04d}',
+            'email': f'{prefix}{i}@example.com',
+        }
+        for i in range(count)
+    ]
+
+
+def per_item(users):
+    """
+    Create users one by one, as the single user create handler does.
+    """
+    for user in users:
+        existing_user = User.query \
+            .filter(User.username == user['username']) \
+            .filter(User.first_name == user['first_name']) \
+            .filter(User.last_name == user['last_name']) \
+            .filter(User.email == user['email']) \
+            .one_or_none()
+        if existing_user is None:
+            db.session.add(User(password=UNUSABLE_PASSWORD, **user))
+            db.session.commit()
+
+
+def batch(users):
+    with app.test_request_context():
+        create_batch(users)
+
+
+def main(counts):
+    with app.app_context():
+        db.create_all()
+
+        print(f"{'users':>8} {'per-item s':>11} {'batch s':>9} "
+              f"{'speedup':>8}")
+        for run, count in enumerate(counts):
+            users = make_users(f'item{run}_', count)
+            started = time.perf_counter()
+            per_item(users)
+            per_item_seconds = time.perf_counter() - started
+
+            users = make_users(f'batch{run}_', count)
+            started = time.perf_counter()
+            batch(users)
+            batch_seconds = time.perf_counter() - started
+
+            print(f'{count:>8} {per_item_seconds:>11.2f} '
+                  f'{batch_seconds:>9.2f} '
+                  f'{per_item_seconds / batch_seconds:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or COUNTS)
@@ -0,0 +1,167 @@
+"""
+This is a benchmark of concurrent writers on a shared game. N threads score
+turns on the scorecards of one game, each thread owning one category of every
+scorecard and scoring it once, and the final scorecards are checked for lost
+turns. It compares
+a blind read-modify-write of the row (the behaviour before version columns),
+a read-modify-write guarded by the version column and retried on conflict,
+and the single UPDATE of UsersGames.set_score.
+
+Usage: python benchmarks/bench_contention.py [WRITERS ...]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+# point the app at a scratch database before it is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DB_PATH
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm.exc import StaleDataError  # noqa: E402
+
+from yahtzee import create_app, db  # noqa: E402
+from yahtzee.models import Game, User, UsersGames  # noqa: E402
+from yahtzee.scoring import (CATEGORIES, SCORE_OPTIONS,  # noqa: E402
+                             SCORECARD_COLUMNS, TOTAL_COLUMNS, score_totals)
+
+app = create_app(config={'SQLALCHEMY_ECHO': False})
+
+WRITERS = [1, 2, 4, 8]
+TURNS = 200
+
+
+def reset(game_id):
+    """
+    Give a new game TURNS empty scorecards, one per turn of each writer.
+
+    :return: ids of the scorecards
+    """
+    db.session.execute(UsersGames.__table__.insert(), [
+        dict(user_id=1, game_id=game_id) for _ in range(TURNS)
+    ])
+    db.session.commit()
+    return [card.users_games_id for card in
+            UsersGames.query.filter(UsersGames.game_id == game_id)]
+
+
+def _rewrite(card_id, category, score):
+    """
+    Load a scorecard, set a category, recompute the totals, write it back.
+    """
+    card = UsersGames.query.get(card_id)
+    setattr(card, category, score)
+    totals = score_totals([[getattr(card, c) or 0
+                            for c in SCORECARD_COLUMNS]])
+    for column, value in zip(TOTAL_COLUMNS, totals[0].tolist()):
+        setattr(card, column, value)
+    return card
+
+
+def blind_write(card_id, category, score):
+    """
+    Write every column of the row back by id, ignoring its version.
+    """
+    card = _rewrite(card_id, category, score)
+    values = {c: getattr(card, c) for c in SCORECARD_COLUMNS + TOTAL_COLUMNS}
+    db.session.rollback()
+    table = UsersGames.__table__
+    db.session.execute(
+        table.update().where(table.c.users_games_id == card_id).values(values)
+    )
+    db.session.commit()
+
+
+def versioned_write(card_id, category, score):
+    """
+    Write the row back through the ORM, only if its version is unchanged.
+    """
+    _rewrite(card_id, category, score)
+    db.session.commit()
+
+
+def single_update(card_id, category, score):
+    UsersGames.set_score(card_id, category, score)
+    db.session.commit()
+
+
+def run(write, writers, game_id):
+    """
+    Run writers threads scoring TURNS turns each on one game.
+
+    :return: (turns per second, retries, lost turns)
+    """
+    with app.app_context():
+        card_ids = reset(game_id)
+    last = {}
+    retries = [0]
+    lock = threading.Lock()
+
+    def writer(category, seed):
+        rng = random.Random(seed)
+        options = sorted(SCORE_OPTIONS[category])
+        with app.app_context():
+            for card_id in rng.sample(card_ids, len(card_ids)):
+                score = rng.choice(options)
+                while True:
+                    try:
+                        write(card_id, category, score)
+                        break
+                    except (StaleDataError, OperationalError):
+                        db.session.rollback()
+                        with lock:
+                            retries[0] += 1
+                last[card_id, category] = score
+            db.session.remove()
+
+    threads = [threading.Thread(target=writer, args=(CATEGORIES[i], i))
+               for i in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    # a turn is lost if its category no longer holds the last score written
+    with app.app_context():
+        cards = {card.users_games_id: card for card in
+                 UsersGames.query.filter(UsersGames.game_id == game_id)}
+        lost = sum(getattr(cards[card_id], category) != score
+                   for (card_id, category), score in last.items())
+    return writers * TURNS / elapsed, retries[0], lost
+
+
+def main(counts):
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='bench', password='!', first_name='B',
+                            last_name='B', email='bench@example.com'))
+        db.session.commit()
+
+    print(f"{'writers':>7} {'method':>16} {'turns/s':>8} {'retries':>8} "
+          f"{'lost':>5}")
+    for writers in counts:
+        for name, write in (('blind rewrite', blind_write),
+                            ('versioned', versioned_write),
+                            ('single UPDATE', single_update)):
+            with app.app_context():
+                game = Game()
+                db.session.add(game)
+                db.session.commit()
+                game_id = game.game_id
+            rate, retries, lost = run(write, writers, game_id)
+            print(f'{writers:>7} {name:>16} {rate:>8.0f} {retries:>8} '
+                  f'{lost:>5}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or WRITERS)
@@ -0,0 +1,137 @@
+"""
+This is a benchmark of the database engine profiles under a concurrent read
+and write load. For each profile reader threads page through users while
+writer threads score turns, for a fixed time, on a fresh SQLite file. It
+compares the old defaults (rollback journal, a connection per checkout) with
+the WAL pragmas of config.Config, unpooled and pooled.
+
+Usage: python benchmarks/bench_engine_profiles.py [SECONDS]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+from sqlalchemy import create_engine, select  # noqa: E402
+from sqlalchemy.engine.url import make_url  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from config import Config  # noqa: E402
+from yahtzee import db  # noqa: E402
+from yahtzee.database import engine_options, set_sqlite_pragmas  # noqa: E402
+from yahtzee.models import Game, User, UsersGames  # noqa: E402
+from yahtzee.scoring import SCORECARD_COLUMNS, TOTAL_COLUMNS  # noqa: E402
+
+SECONDS = 5
+READERS = 4
+WRITERS = 2
+USERS = 10000
+SCORECARDS = 1000
+
+# (name, engine options, pragmas)
+PROFILES = [
+    ('rollback journal', {}, {}),
+    ('WAL', {}, Config.SQLITE_PRAGMAS),
+    ('WAL, pooled', Config.SQLALCHEMY_ENGINE_OPTIONS, Config.SQLITE_PRAGMAS),
+]
+
+
+def make_engine(path, options, pragmas):
+    url = make_url('sqlite:///' + path)
+    engine = create_engine(url, **engine_options(url, options))
+    set_sqlite_pragmas(engine, pragmas)
+    return engine
+
+
+def seed(engine):
+    db.metadata.create_all(engine)
+    zeros = {c: 0 for c in SCORECARD_COLUMNS + TOTAL_COLUMNS}
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [
+            {'username': f'user{i}', 'password': '!', 'first_name': 'F',
+             'last_name': f'Last{i % 1000:04d}',
+             'email': f'user{i}@example.com'}
+            for i in range(USERS)
+        ])
+        conn.execute(Game.__table__.insert(), {'game_id': 1})
+        conn.execute(UsersGames.__table__.insert(), [
+            dict(zeros, user_id=i % USERS + 1, game_id=1)
+            for i in range(SCORECARDS)
+        ])
+
+
+def reader(engine, stop, counts, seed_value):
+    rng = random.Random(seed_value)
+    user = User.__table__.c
+    while not stop.is_set():
+        last_name = f'Last{rng.randrange(1000):04d}'
+        try:
+            with engine.connect() as conn:
+                conn.execute(
+                    select([user.id, user.username, user.last_name])
+                    .where(user.last_name >= last_name)
+                    .order_by(user.last_name, user.id)
+                    .limit(20)
+                ).fetchall()
+            counts['reads'] += 1
+        except OperationalError:
+            counts['errors'] += 1
+
+
+def writer(engine, stop, counts, seed_value):
+    rng = random.Random(seed_value)
+    table = UsersGames.__table__
+    while not stop.is_set():
+        card_id = rng.randint(1, SCORECARDS)
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    table.update()
+                    .where(table.c.users_games_id == card_id)
+                    .values(chance=rng.randint(5, 30),
+                            version_id=table.c.version_id + 1)
+                )
+            counts['writes'] += 1
+        except OperationalError:
+            counts['errors'] += 1
+
+
+def run(name, options, pragmas, seconds):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = make_engine(path, options, pragmas)
+    seed(engine)
+
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    stop = threading.Event()
+    threads = [threading.Thread(target=reader, args=(engine, stop, counts, i))
+               for i in range(READERS)]
+    threads += [threading.Thread(target=writer,
+                                 args=(engine, stop, counts, -i - 1))
+                for i in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    print(f"{name:>16} {counts['reads'] / seconds:>9.0f} "
+          f"{counts['writes'] / seconds:>9.0f} {counts['errors']:>7}")
+
+
+def main(seconds):
+    print(f'{READERS} readers, {WRITERS} writers, {seconds}s per profile')
+    print(f"{'profile':>16} {'reads/s':>9} {'writes/s':>9} {'errors':>7}")
+    for name, options, pragmas in PROFILES:
+        run(name, options, pragmas, seconds)
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else SECONDS)
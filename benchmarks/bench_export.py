@@ -0,0 +1,83 @@
+"""
+This is a benchmark of the streaming bulk export. For each table size it runs
+an export to /dev/null in a fresh process and reports throughput and peak
+RSS, which should stay flat as the table grows.
+
+Usage: python benchmarks/bench_export.py [SIZE ...]
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+SIZES = [10000, 100000, 1000000]
+BATCH = 10000
+
+
+def run_export(db_path, size, fmt):
+    """
+    Fill db_path up to size users, export them and print rows/s and peak RSS.
+    This runs in a child process so ru_maxrss only covers one export.
+    """
+    os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+    os.environ.setdefault('FLASK_ENV', 'testing')
+
+    from yahtzee import create_app, db
+    from yahtzee.export import stream_export
+    from yahtzee.models import User
+
+    app = create_app(config={'SQLALCHEMY_ECHO': False})
+    with app.app_context():
+        db.create_all()
+        count = User.query.count()
+        insert = User.__table__.insert()
+        for start in range(count + 1, size + 1, BATCH):
+            db.session.execute(insert, [
+                {
+                    'username': f'user{i}',
+                    'password': 'x' * 60,
+                    'first_name': 'First',
+                    'last_name': f'Last{i % 5000:04d}',
+                    'email': f'user{i}@example.com',
+                }
+                for i in range(start, min(start + BATCH, size + 1))
+            ])
+        db.session.commit()
+        db.session.remove()
+
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as out:
+            for chunk in stream_export(db.session, 'users', fmt):
+                out.write(chunk)
+        elapsed = time.perf_counter() - started
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(f'{size:>10} {fmt:>7} {size / elapsed:>12.0f} '
+          f'{baseline / 1024:>10.1f} {peak / 1024:>10.1f}')
+
+
+def main(sizes):
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    print(f"{'users':>10} {'format':>7} {'rows/s':>12} "
+          f"{'base MiB':>10} {'peak MiB':>10}")
+    for size in sizes:
+        for fmt in ('ndjson', 'csv'):
+            subprocess.run(
+                [sys.executable, __file__, '--child', db_path,
+                 str(size), fmt],
+                check=True
+            )
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        run_export(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or SIZES)
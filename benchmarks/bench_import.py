@@ -0,0 +1,125 @@
+"""
+This is a benchmark of the cold start of a worker. In fresh processes it reads
+the cumulative import time of the package from python -X importtime, and
+times importing it, create_app and the first request (the login page). It
+fails when the medians exceed their budgets, or when importing the package or
+serving the first page loads modules create_app is meant to defer.
+
+Usage: python benchmarks/bench_import.py [RUNS]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RUNS = 5
+
+# budgets of the medians, in ms
+IMPORT_BUDGET = 1000
+COLD_START_BUDGET = 2000
+
+# loaded by create_app, not by importing the package
+DEFERRED = ('yahtzee.models', 'yahtzee.users.routes', 'yahtzee.main.routes')
+# loaded only once the API scores a turn or ranks players
+NOT_SERVED = ('numpy', 'yahtzee.scoring')
+
+
+def import_time():
+    """
+    Import the package in a fresh process under -X importtime.
+
+    :return: (cumulative ms of the package, names of the modules imported)
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import yahtzee'],
+        cwd=ROOT, env=dict(os.environ, PYTHONDONTWRITEBYTECODE='1'),
+        stderr=subprocess.PIPE, universal_newlines=True, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative) / 1000
+    return modules['yahtzee'], set(modules)
+
+
+def cold_start():
+    """
+    Import the package, create the app and serve the login page, timing each
+    step. This runs in a child process so nothing is imported yet.
+    """
+    started = time.perf_counter()
+    import yahtzee
+    imported = time.perf_counter()
+    app = yahtzee.create_app()
+    created = time.perf_counter()
+    response = app.test_client().get('/login')
+    served = time.perf_counter()
+    assert response.status_code == 200, response.status
+
+    loaded = sorted(name for name in NOT_SERVED if name in sys.modules)
+    print(f'{(imported - started) * 1000:.1f} '
+          f'{(created - started) * 1000:.1f} '
+          f'{(served - started) * 1000:.1f} '
+          f'{",".join(loaded) or "-"}')
+
+
+def main(runs):
+    failures = []
+
+    env = dict(os.environ, FLASK_ENV='testing', SECRET_KEY='bench-import',
+               DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(),
+                                                        'bench.db'))
+    imports = []
+    starts = []
+    for _ in range(runs):
+        ms, modules = import_time()
+        imports.append(ms)
+        eager = sorted(name for name in DEFERRED if name in modules)
+        if eager:
+            failures.append(f'import yahtzee loads {", ".join(eager)}')
+
+        output = subprocess.run(
+            [sys.executable, __file__, '--child'], cwd=ROOT, env=env,
+            stdout=subprocess.PIPE, universal_newlines=True, check=True
+        ).stdout.split()
+        starts.append([float(value) for value in output[:3]])
+        if output[3] != '-':
+            failures.append(f'the first request loads {output[3]}')
+
+    import_ms = statistics.median(imports)
+    import_step, app_step, request_step = (
+        statistics.median(step) for step in zip(*starts))
+
+    print(f"{'step':<28} {'median ms':>10} {'budget ms':>10}")
+    print(f"{'import yahtzee (importtime)':<28} {import_ms:>10.1f} "
+          f'{IMPORT_BUDGET:>10}')
+    print(f"{'import yahtzee':<28} {import_step:>10.1f}")
+    print(f"{'+ create_app':<28} {app_step:>10.1f}")
+    print(f"{'+ first request':<28} {request_step:>10.1f} "
+          f'{COLD_START_BUDGET:>10}')
+
+    if import_ms > IMPORT_BUDGET:
+        failures.append(f'import took {import_ms:.0f} ms')
+    if request_step > COLD_START_BUDGET:
+        failures.append(f'cold start took {request_step:.0f} ms')
+
+    for failure in sorted(set(failures)):
+        print(f'FAIL {failure}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        cold_start()
+    else:
+        sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else RUNS))
@@ -0,0 +1,114 @@
+"""
+This is a benchmark of the leaderboard. For growing numbers of users it
+compares ranking a user and reading the top 10 by aggregating users_games on
+every request, with the user_stats table and the in-memory rank tree.
+
+Usage: python benchmarks/bench_leaderboard.py [USERS ...]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+# point the app at a scratch database before it is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DB_PATH
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from yahtzee import create_app, db  # noqa: E402
+from yahtzee.leaderboard import (get_leaderboard, rebuild_stats,  # noqa: E402
+                                 stats_of, top)
+from yahtzee.models import Game, User, UsersGames  # noqa: E402
+from yahtzee.scoring import SCORECARD_COLUMNS, TOTAL_COLUMNS  # noqa: E402
+
+app = create_app(config={'SQLALCHEMY_ECHO': False})
+
+COUNTS = [1000, 10000, 100000]
+GAMES_PER_USER = 4
+QUERIES = 50
+
+
+def add_users(rng, first_id, count):
+    """
+    Add count users with GAMES_PER_USER finished games each.
+    """
+    finished_at = datetime.utcnow()
+    zeros = {c: 0 for c in SCORECARD_COLUMNS + TOTAL_COLUMNS}
+    db.session.execute(User.__table__.insert(), [
+        {'id': i, 'username': f'user{i}', 'password': '!',
+         'first_name': 'First', 'last_name': 'Last',
+         'email': f'user{i}@example.com'}
+        for i in range(first_id, first_id + count)
+    ])
+    db.session.execute(UsersGames.__table__.insert(), [
+        dict(zeros, user_id=i, game_id=1, finished_at=finished_at,
+             grand_total_score=rng.randint(100, 400))
+        for i in range(first_id, first_id + count)
+        for _ in range(GAMES_PER_USER)
+    ])
+    db.session.commit()
+
+
+def aggregate_rank(user_id):
+    """
+    Rank a user and read the top 10 from users_games alone.
+    """
+    best = db.session.query(
+        UsersGames.user_id,
+        db.func.max(UsersGames.grand_total_score).label('best')
+    ).group_by(UsersGames.user_id).subquery()
+    mine = db.session.query(best.c.best) \
+        .filter(best.c.user_id == user_id).scalar()
+    db.session.query(db.func.count()).select_from(best) \
+        .filter(best.c.best > mine).scalar()
+    db.session.query(best).order_by(best.c.best.desc()).limit(10).all()
+
+
+def stats_rank(user_id):
+    """
+    Rank a user and read the top 10 from user_stats and the rank tree.
+    """
+    stats_of(user_id)
+    top(10)
+
+
+def per_query_ms(fn, user_ids):
+    started = time.perf_counter()
+    for user_id in user_ids:
+        fn(user_id)
+    return (time.perf_counter() - started) * 1000 / len(user_ids)
+
+
+def main(counts):
+    rng = random.Random(1)
+
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        db.session.add(Game())
+        db.session.commit()
+
+        print(f"{'users':>8} {'aggregate ms':>13} {'user_stats ms':>14} "
+              f"{'speedup':>8}")
+        total = 0
+        for count in counts:
+            add_users(rng, total + 1, count - total)
+            total = count
+            rebuild_stats()
+            db.session.commit()
+            get_leaderboard().rank(0)
+
+            user_ids = rng.sample(range(1, total + 1), QUERIES)
+            aggregate = per_query_ms(aggregate_rank, user_ids)
+            stats = per_query_ms(stats_rank, user_ids)
+            print(f'{count:>8} {aggregate:>13.2f} {stats:>14.2f} '
+                  f'{aggregate / stats:>7.0f}x')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or COUNTS)
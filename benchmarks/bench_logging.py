@@ -0,0 +1,181 @@
+"""
+This is a benchmark of the cost of logging on the request thread. It compares
+the synchronous FileHandler formerly attached to the users logger, writing a
+message formatted eagerly with f-strings, to the queue of the log pipeline
+with a structured event, from growing numbers of threads, on the scratch
+disk and on a disk where each flush blocks for SLOW_FLUSH seconds (as when
+the page cache writes back or the log is on a network volume). It then
+floods a small queue to check that records are dropped and counted rather
+than waited for, that the file rotates, and samples an event.
+
+Usage: python benchmarks/bench_logging.py [RECORDS]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+from yahtzee.logs import (BatchFileHandler, JsonFormatter,  # noqa: E402
+                          LogPipeline, QueueHandler, SamplingFilter)
+
+RECORDS = 20000
+THREADS = [1, 4, 16]
+SLOW_FLUSH = 0.0005
+
+
+class User(object):
+    # stands in for the model, its repr was logged before
+    def __init__(self, user_id):
+        self.id = user_id
+        self.username = f'user{user_id}'
+        self.first_name = 'First'
+        self.last_name = 'Last'
+        self.email = f'user{user_id}@example.com'
+        self.image_file = 'default.jpg'
+
+    def __repr__(self):
+        return (f"User('{self.id}', '{self.username}', '{self.first_name}', "
+                f"'{self.last_name}', '{self.email}')")
+
+
+class SlowFile(object):
+    """
+    A file whose flush blocks for SLOW_FLUSH seconds.
+    """
+    def __init__(self, f):
+        self._file = f
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def flush(self):
+        time.sleep(SLOW_FLUSH)
+        self._file.flush()
+
+
+def slow(handler):
+    open_file = handler._open
+    handler._open = lambda: SlowFile(open_file())
+    if handler.stream is not None:
+        handler.stream = SlowFile(handler.stream)
+    return handler
+
+
+def sync_logger(path, slow_disk=False):
+    logger = logging.Logger('sync')
+    handler = logging.FileHandler(path)
+    if slow_disk:
+        slow(handler)
+    handler.setFormatter(
+        logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+    logger.addHandler(handler)
+    return logger
+
+
+def pipeline_logger(path, queue_size, max_bytes=0, sampling=None,
+                    slow_disk=False):
+    handler = BatchFileHandler(path, maxBytes=max_bytes, backupCount=2,
+                               delay=True)
+    if slow_disk:
+        slow(handler)
+    handler.setFormatter(JsonFormatter())
+    pipeline = LogPipeline(handler, queue_size, 256)
+    pipeline.start()
+    queue_handler = QueueHandler(pipeline)
+    queue_handler.addFilter(SamplingFilter(sampling or {}))
+    logger = logging.Logger('pipeline')
+    logger.addHandler(queue_handler)
+    return logger, pipeline
+
+
+def log_sync(logger, user):
+    logger.info(f'User created: "{user}"')
+    logger.info(f"current_user({user.first_name}, {user.last_name}, "
+                f"{user.username}, {user.email}, {user.image_file})")
+
+
+def log_event(logger, user):
+    logger.info('User created', extra={'event': 'user_created',
+                                       'user_id': user.id})
+    logger.info('Account updated', extra={'event': 'account_updated',
+                                          'user_id': user.id,
+                                          'changed': ['last_name']})
+
+
+def per_call(log, logger, threads, records):
+    """
+    Log records from threads at once.
+
+    :return: microseconds per record on the logging threads
+    """
+    user = User(1)
+    per_thread = records // threads // 2
+    elapsed = []
+
+    def run():
+        started = time.perf_counter()
+        for _ in range(per_thread):
+            log(logger, user)
+        elapsed.append(time.perf_counter() - started)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(elapsed) / (per_thread * 2 * threads) * 1e6
+
+
+def main(records):
+    scratch = tempfile.mkdtemp()
+
+    print(f"{'disk':>7} {'threads':>7} {'sync us':>8} {'queued us':>10}")
+    for slow_disk in (False, True):
+        for threads in THREADS:
+            name = f'{slow_disk:d}-{threads}.log'
+            sync = sync_logger(os.path.join(scratch, 'sync' + name),
+                               slow_disk)
+            queued, pipeline = pipeline_logger(
+                os.path.join(scratch, 'queued' + name), records,
+                slow_disk=slow_disk)
+            # fewer records through the slow disk, the sync path is slow
+            count = records // 10 if slow_disk else records
+            sync_us = per_call(log_sync, sync, threads, count)
+            queued_us = per_call(log_event, queued, threads, count)
+            pipeline.stop()
+            print(f"{'slow' if slow_disk else 'scratch':>7} {threads:>7} "
+                  f'{sync_us:>8.2f} {queued_us:>10.2f}')
+
+    # a burst over a small queue, rotating every 64KiB
+    path = os.path.join(scratch, 'burst.log')
+    queued, pipeline = pipeline_logger(path, 100, max_bytes=64 * 1024)
+    us = per_call(log_event, queued, 4, records)
+    pipeline.stop()
+    with open(path) as f:
+        reported = sum('"log_events_dropped"' in line for line in f)
+    files = sorted(name for name in os.listdir(scratch)
+                   if name.startswith('burst'))
+    print(f'\nqueue of 100: {us:.2f} us/record, {pipeline.dropped} of '
+          f'{records} dropped, {reported} drop reports in the last file, '
+          f'files {", ".join(files)}')
+
+    # sampling a tenth of the account updates
+    path = os.path.join(scratch, 'sampled.log')
+    queued, pipeline = pipeline_logger(path, records,
+                                       sampling={'account_updated': 0.1})
+    per_call(log_event, queued, 1, records)
+    pipeline.stop()
+    with open(path) as f:
+        updates = sum('"account_updated"' in line for line in f)
+    print(f'sampled at 0.1: {updates} of {records // 2} account updates '
+          f'written')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else RECORDS)
@@ -0,0 +1,99 @@
+"""
+This is a benchmark of concurrent password checks during a login burst. It
+compares checking bcrypt hashes directly on each request thread with checking
+them on the bounded hashing pool, and reports throughput, latency percentiles
+and how many requests the pool shed with a 503.
+
+Usage: python benchmarks/bench_login.py [THREADS ...]
+"""
+
+import os
+import sys
+import threading
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from yahtzee import create_app, bcrypt  # noqa: E402
+from yahtzee.users import hashing  # noqa: E402
+
+app = create_app()
+
+CONCURRENCY = [1, 4, 16, 64]
+LOGINS_PER_THREAD = 10
+ROUNDS = 10
+PASSWORD = 'abc123'
+
+
+def direct_check(pw_hash):
+    return bcrypt.check_password_hash(pw_hash, PASSWORD)
+
+
+def pooled_check(pw_hash):
+    return hashing.check_password_hash(pw_hash, PASSWORD)
+
+
+def burst(check, threads, pw_hash):
+    """
+    Run a burst of logins from threads request threads.
+
+    :return: (elapsed seconds, sorted latencies, number of 503s)
+    """
+    latencies = []
+    rejected = []
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def request_thread():
+        with app.app_context():
+            start.wait()
+            for _ in range(LOGINS_PER_THREAD):
+                began = time.perf_counter()
+                try:
+                    check(pw_hash)
+                except hashing.HashingPoolBusy:
+                    with lock:
+                        rejected.append(1)
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - began)
+
+    workers = [threading.Thread(target=request_thread)
+               for _ in range(threads)]
+    began = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - began, sorted(latencies), len(rejected)
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(concurrency):
+    app.config['BCRYPT_LOG_ROUNDS'] = ROUNDS
+    pw_hash = bcrypt.generate_password_hash(PASSWORD, ROUNDS).decode('utf-8')
+
+    print(f"pool: {app.config['BCRYPT_POOL_WORKERS']} workers, "
+          f"queue depth {app.config['BCRYPT_QUEUE_DEPTH']}, cost {ROUNDS}")
+    print(f"{'mode':>7} {'threads':>8} {'logins/s':>9} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'503s':>6}")
+    for threads in concurrency:
+        for mode, check in (('direct', direct_check),
+                            ('pooled', pooled_check)):
+            elapsed, latencies, rejected = burst(check, threads, pw_hash)
+            print(f'{mode:>7} {threads:>8} '
+                  f'{len(latencies) / elapsed:>9.1f} '
+                  f'{percentile(latencies, 0.5) * 1e3:>8.1f} '
+                  f'{percentile(latencies, 0.99) * 1e3:>8.1f} '
+                  f'{rejected:>6}')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or CONCURRENCY)
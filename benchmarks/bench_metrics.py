@@ -0,0 +1,109 @@
+"""
+This is a benchmark of the overhead of collecting metrics. It times recording
+a histogram sample and a counter increment, alone and from concurrent
+threads, the SQL timing listeners on a query of an in-memory SQLite engine,
+and rendering /metrics once many series were recorded.
+
+Usage: python benchmarks/bench_metrics.py [SAMPLES]
+"""
+
+import os
+import sys
+import threading
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+
+from yahtzee.metrics import utils  # noqa: E402
+
+SAMPLES = 200000
+THREADS = [1, 4, 16]
+QUERIES = 20000
+
+
+def per_call(fn, samples):
+    started = time.perf_counter()
+    for i in range(samples):
+        fn(i)
+    return (time.perf_counter() - started) / samples * 1e6
+
+
+def threaded(fn, threads, samples):
+    """
+    Call fn from threads at once.
+
+    :return: microseconds per call on the calling threads
+    """
+    elapsed = []
+
+    def run():
+        elapsed.append(per_call(fn, samples // threads))
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(elapsed) / len(elapsed)
+
+
+def query_time(engine, queries):
+    with engine.connect() as connection:
+        started = time.perf_counter()
+        for _ in range(queries):
+            connection.execute('SELECT 1').scalar()
+        return (time.perf_counter() - started) / queries * 1e6
+
+
+def listeners(add):
+    for name, fn in (('before_cursor_execute', utils._before_cursor_execute),
+                     ('after_cursor_execute', utils._after_cursor_execute)):
+        (event.listen if add else event.remove)(Engine, name, fn)
+
+
+def main(samples):
+    histogram = utils.Histogram('bench_seconds', 'Bench.', ('endpoint',))
+    counter = utils.Counter('bench_total', 'Bench.', ('endpoint', 'status'))
+
+    def observe(i):
+        histogram.observe(0.003, 'main.home')
+
+    def inc(i):
+        counter.inc('main.home', '200')
+
+    def timed(i):
+        with histogram.time('main.home'):
+            pass
+
+    print(f"{'call':<10} {'threads':>7} {'us/call':>8}")
+    for name, fn in (('observe', observe), ('inc', inc), ('time', timed)):
+        for threads in THREADS:
+            print(f'{name:<10} {threads:>7} '
+                  f'{threaded(fn, threads, samples):>8.3f}')
+
+    # best of alternating runs, a query takes some microseconds only
+    engine = create_engine('sqlite://')
+    bare = timed_query = float('inf')
+    for _ in range(3):
+        bare = min(bare, query_time(engine, QUERIES))
+        listeners(True)
+        timed_query = min(timed_query, query_time(engine, QUERIES))
+        listeners(False)
+    print(f'\nSELECT 1: {bare:.2f} us bare, {timed_query:.2f} us timed '
+          f'(+{timed_query - bare:.2f} us)')
+
+    for i in range(1000):
+        histogram.observe(i / 1000, f'endpoint{i % 100}')
+        counter.inc(f'endpoint{i % 100}', str(200 + i % 5))
+    started = time.perf_counter()
+    text = utils.render()
+    print(f'render: {(time.perf_counter() - started) * 1000:.2f} ms for '
+          f'{text.count(chr(10))} lines')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else SAMPLES)
@@ -0,0 +1,97 @@
+"""
+This is a benchmark of the keyset pagination of the user listing. It fills a
+scratch SQLite db with an increasing number of users and times fetching the
+first, a middle and the last page, which should stay flat as the table grows.
+
+Usage: python benchmarks/bench_pagination.py [SIZE ...]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+# point the app at a scratch database before it is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DB_PATH
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from yahtzee import create_app, db  # noqa: E402
+from yahtzee.models import User  # noqa: E402
+from yahtzee.pagination import NEXT, encode_cursor, paginate  # noqa: E402
+
+app = create_app(config={'SQLALCHEMY_ECHO': False})
+
+SIZES = [1000, 10000, 100000, 1000000]
+REPEAT = 200
+PER_PAGE = 20
+BATCH = 10000
+
+
+def fill(start, stop, rng):
+    """
+    Insert users with ids in [start, stop) using executemany batches.
+    """
+    insert = User.__table__.insert()
+    for batch_start in range(start, stop, BATCH):
+        rows = [
+            {
+                'id': i,
+                'username': f'user{i}',
+                'password': 'x' * 60,
+                'first_name': 'First',
+                'last_name': f'Last{rng.randrange(50000):05d}',
+                'email': f'user{i}@example.com',
+            }
+            for i in range(batch_start, min(batch_start + BATCH, stop))
+        ]
+        db.session.execute(insert, rows)
+    db.session.commit()
+
+
+def time_page(cursor):
+    """
+    Return the mean seconds to fetch the page following cursor.
+    """
+    started = time.perf_counter()
+    for _ in range(REPEAT):
+        paginate(User.query, [User.last_name, User.id],
+                 cursor=cursor, per_page=PER_PAGE)
+        db.session.rollback()
+    return (time.perf_counter() - started) / REPEAT
+
+
+def main(sizes):
+    rng = random.Random(42)
+
+    with app.app_context():
+        db.create_all()
+
+        print(f"{'users':>10} {'first':>10} {'middle':>10} {'last':>10}")
+        count = 0
+        for size in sizes:
+            fill(count + 1, size + 1, rng)
+            count = size
+
+            # keys for a page in the middle and at the very end of the table
+            ordered = User.query \
+                .with_entities(User.last_name, User.id) \
+                .order_by(User.last_name, User.id)
+            middle = ordered.offset(size // 2).first()
+            last = ordered.offset(size - PER_PAGE - 1).first()
+
+            timings = [
+                time_page(None),
+                time_page(encode_cursor(NEXT, tuple(middle))),
+                time_page(encode_cursor(NEXT, tuple(last))),
+            ]
+            print(f'{size:>10} ' + ' '.join(
+                f'{t * 1e6:>8.0f}us' for t in timings))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
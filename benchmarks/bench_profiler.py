@@ -0,0 +1,82 @@
+"""
+This is a benchmark of the cost of the request profiler. It times GET
+requests of the home page (fragment cache off, so every request queries the
+users) with no capture, with the statements counted against a query budget,
+and profiled with cProfile by the X-Profile header, then a page walking the
+lazy users_games relationship of each user to check its N+1 is reported.
+
+Usage: python benchmarks/bench_profiler.py [REQUESTS]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(), 'profiler.db')
+os.environ['FLASK_ENV'] = 'testing'
+os.environ.setdefault('SECRET_KEY', 'bench-profiler')
+
+from yahtzee import create_app, db  # noqa: E402
+from yahtzee.models import User  # noqa: E402
+
+REQUESTS = 500
+USERS = 100
+
+
+def per_request(client, requests, headers=None):
+    """
+    :return: milliseconds per GET of the home page, best of three runs
+    """
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(requests):
+            client.get('/', headers=headers)
+        best = min(best, (time.perf_counter() - started) / requests * 1000)
+    return best
+
+
+def main(requests):
+    app = create_app(config={'FRAGMENT_CACHE_SIZE': 0, 'PROFILER_DIR': None})
+
+    @app.route('/bench/games')
+    def games():
+        return str(sum(len(user.users_games) for user in User.query.all()))
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(
+            User(username=f'user{i}', password='x' * 60, first_name='First',
+                 last_name=f'Last{i}', email=f'user{i}@example.com')
+            for i in range(USERS)
+        )
+        db.session.commit()
+
+    client = app.test_client()
+    budgets = app.config['QUERY_BUDGETS']
+    budget = budgets.pop('main.home')
+    bare = per_request(client, requests)
+    budgets['main.home'] = budget
+    counted = per_request(client, requests)
+    profiled = per_request(client, requests, {'X-Profile': '1'})
+    print(f'home: {bare:.3f} ms bare, {counted:.3f} ms counted '
+          f'(+{(counted - bare) * 1000:.1f} us), {profiled:.3f} ms profiled '
+          f'(+{(profiled - bare) * 1000:.1f} us)')
+
+    response = client.get('/bench/games', headers={'X-Profile': '1'})
+    queries = int(response.headers['X-Query-Count'])
+    repeated = int(response.headers['X-Repeated-Queries'])
+    print(f'users_games walk: {queries} queries, {repeated} repeated')
+    if repeated != 1:
+        print('the N+1 of the users_games walk was not reported')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else REQUESTS))
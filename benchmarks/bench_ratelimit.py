@@ -0,0 +1,107 @@
+"""
+This is a benchmark of the per-request cost of the rate limiter. It times
+MemoryStore.hit on a hot key and across stores of growing numbers of keys
+(distinct client addresses, as in a credential stuffing burst), the full
+limit() check of a login inside a request, and hits from concurrent threads,
+to compare with the bcrypt check the limiter saves.
+
+Usage: python benchmarks/bench_ratelimit.py [HITS]
+"""
+
+import os
+import sys
+import threading
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from yahtzee import create_app, bcrypt  # noqa: E402
+from yahtzee.ratelimit import MemoryStore, RateLimited, limit  # noqa: E402
+
+app = create_app()
+
+HITS = 200000
+KEYS = [1, 1000, 100000, 1000000]
+THREADS = [1, 4, 16]
+
+
+def per_hit(store, keys, hits):
+    """
+    Hit hits times, cycling through keys, with buckets that never run out.
+
+    :return: microseconds per hit
+    """
+    started = time.perf_counter()
+    for i in range(hits):
+        store.hit(keys[i % len(keys)], hits, 1)
+    return (time.perf_counter() - started) / hits * 1e6
+
+
+def threaded(threads, hits):
+    store = MemoryStore()
+
+    def run(n):
+        keys = [f'LOGIN:ip:10.{n}.{i // 256}.{i % 256}' for i in range(1000)]
+        per_hit(store, keys, hits // threads)
+
+    workers = [threading.Thread(target=run, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return hits / (time.perf_counter() - started)
+
+
+def limit_check(hits):
+    """
+    Time limit('LOGIN') per request context, addresses and accounts varying.
+
+    :return: (microseconds per check, number of checks refused)
+    """
+    refused = 0
+    elapsed = 0
+    for i in range(hits):
+        with app.test_request_context(
+                environ_base={'REMOTE_ADDR': f'10.0.{i // 256 % 256}.'
+                                             f'{i % 256}'}):
+            started = time.perf_counter()
+            try:
+                limit('LOGIN', f'user{i % 5000}@example.com')
+            except RateLimited:
+                refused += 1
+            elapsed += time.perf_counter() - started
+    return elapsed / hits * 1e6, refused
+
+
+def main(hits):
+    print(f"{'keys':>8} {'us/hit':>8}")
+    for count in KEYS:
+        store = MemoryStore(max_keys=max(KEYS))
+        keys = [f'LOGIN:ip:{i}' for i in range(count)]
+        per_hit(store, keys, count)  # fill the store
+        print(f'{count:>8} {per_hit(store, keys, hits):>8.2f}')
+
+    # every hit a new key, sweeping once the store is full
+    store = MemoryStore(max_keys=10000)
+    keys = [f'LOGIN:ip:{i}' for i in range(hits)]
+    print(f"{'sweeping':>8} {per_hit(store, keys, hits):>8.2f}")
+
+    print(f"\n{'threads':>8} {'hits/s':>10}")
+    for threads in THREADS:
+        print(f'{threads:>8} {threaded(threads, hits):>10.0f}')
+
+    us, refused = limit_check(hits // 10)
+    print(f'\nlimit() in a request: {us:.2f} us/check, {refused} refused')
+
+    pw_hash = bcrypt.generate_password_hash('abc123', 12)
+    started = time.perf_counter()
+    bcrypt.check_password_hash(pw_hash, 'abc123')
+    print(f'bcrypt check (cost 12): '
+          f'{(time.perf_counter() - started) * 1e6:.0f} us')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else HITS)
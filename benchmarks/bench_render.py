@@ -0,0 +1,114 @@
+"""
+This is a benchmark of rendering the pages. In fresh processes it times
+loading every template with the Jinja bytecode cache off, with a cold cache
+(compiling and writing it) and with a warm cache, as a new worker would at
+boot, then the home page per request with the fragment cache off and on, for
+pages of growing numbers of users, next to the login and 404 pages which
+only render the layout.
+
+Usage: python benchmarks/bench_render.py [USERS_PER_PAGE ...]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+PER_PAGE = [20, 100]
+REQUESTS = 500
+USERS = 1000
+
+
+def child_env(db_path, cache_dir):
+    return dict(os.environ, FLASK_ENV='testing', SECRET_KEY='bench-render',
+                DATABASE_URL='sqlite:///' + db_path,
+                TEMPLATE_BYTECODE_CACHE_DIR=cache_dir)
+
+
+def load_templates(use_cache):
+    """
+    Load every template of the app, as a worker compiling them at boot.
+    """
+    from yahtzee import create_app
+
+    app = create_app()
+    if not use_cache:
+        app.jinja_env.bytecode_cache = None
+    names = app.jinja_env.list_templates()
+
+    started = time.perf_counter()
+    for name in names:
+        app.jinja_env.get_template(name)
+    print(f'{(time.perf_counter() - started) * 1000:.2f} {len(names)}')
+
+
+def render(per_page, fragment_cache_size):
+    """
+    Time GET requests of the home, login and a missing page.
+    """
+    from yahtzee import create_app, db
+    from yahtzee.models import User
+
+    app = create_app(config={'USERS_PER_PAGE': per_page,
+                             'FRAGMENT_CACHE_SIZE': fragment_cache_size})
+    with app.app_context():
+        db.create_all()
+        if not User.query.count():
+            db.session.execute(User.__table__.insert(), [
+                {'username': f'user{i}', 'password': '!',
+                 'first_name': 'First', 'last_name': f'Last{i:06d}',
+                 'email': f'user{i}@example.com'}
+                for i in range(USERS)
+            ])
+            db.session.commit()
+
+    client = app.test_client()
+    timings = []
+    for path, status in (('/', 200), ('/login', 200), ('/missing', 404)):
+        # the first request renders the fragments and compiles the template
+        assert client.get(path).status_code == status
+        started = time.perf_counter()
+        for _ in range(REQUESTS):
+            client.get(path)
+        timings.append((time.perf_counter() - started) / REQUESTS * 1000)
+    print(' '.join(f'{ms:.3f}' for ms in timings))
+
+
+def run_child(env, *args):
+    return subprocess.run(
+        [sys.executable, __file__, '--child', *map(str, args)], env=env,
+        stdout=subprocess.PIPE, universal_newlines=True, check=True
+    ).stdout.split()
+
+
+def main(per_pages):
+    scratch = tempfile.mkdtemp()
+    db_path = os.path.join(scratch, 'bench.db')
+    env = child_env(db_path, os.path.join(scratch, 'jinja'))
+
+    print(f"{'bytecode cache':<16} {'load ms':>8} {'templates':>10}")
+    for label, use_cache in (('off', 0), ('cold', 1), ('warm', 1)):
+        ms, count = run_child(env, 'load', use_cache)
+        print(f'{label:<16} {float(ms):>8.2f} {count:>10}')
+
+    print(f"\n{'per page':>8} {'fragments':>10} {'home ms':>8} "
+          f"{'login ms':>9} {'404 ms':>7}")
+    for per_page in per_pages:
+        for label, size in (('off', 0), ('on', 8 * 1024 * 1024)):
+            home, login, missing = run_child(env, 'render', per_page, size)
+            print(f'{per_page:>8} {label:>10} {float(home):>8.3f} '
+                  f'{float(login):>9.3f} {float(missing):>7.3f}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        if sys.argv[2] == 'load':
+            load_templates(sys.argv[3] == '1')
+        else:
+            render(int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or PER_PAGE)
@@ -0,0 +1,108 @@
+"""
+This is a benchmark of entering one score per turn. It compares loading the
+scorecard, recomputing every total in Python and flushing the row, with the
+single UPDATE of UsersGames.set_score.
+
+Usage: python benchmarks/bench_score_entry.py [TURNS]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+# point the app at a scratch database before it is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DB_PATH
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from sqlalchemy import func  # noqa: E402
+
+from yahtzee import create_app, db  # noqa: E402
+from yahtzee.models import Game, User, UsersGames  # noqa: E402
+from yahtzee.scoring import (CATEGORIES, SCORECARD_COLUMNS,  # noqa: E402
+                             TOTAL_COLUMNS, score_of, score_totals)
+
+app = create_app(config={'SQLALCHEMY_ECHO': False})
+
+TURNS = 5000
+
+
+def turns(count):
+    """
+    Score each category of new scorecards once, in a random order.
+
+    :return: list of (scorecard index, category, score)
+    """
+    rng = random.Random(1)
+    cards = range(count // len(CATEGORIES) + 1)
+    slots = rng.sample([(card, category) for card in cards
+                        for category in CATEGORIES], count)
+    return [(card, category,
+             score_of(category, [rng.randint(1, 6) for _ in range(5)]))
+            for card, category in slots]
+
+
+def add_scorecards(count):
+    """
+    Add count empty scorecards.
+
+    :return: id of the first one
+    """
+    first_id = (db.session.query(func.max(UsersGames.users_games_id))
+                .scalar() or 0) + 1
+    db.session.execute(UsersGames.__table__.insert(), [
+        dict(user_id=1, game_id=1) for _ in range(count)
+    ])
+    db.session.commit()
+    return first_id
+
+
+def read_modify_write(first_id, turn_list):
+    """
+    Score each turn by loading the row and writing back all its totals.
+    """
+    for index, category, score in turn_list:
+        card = UsersGames.query.get(first_id + index)
+        setattr(card, category, score)
+        totals = score_totals(
+            [[getattr(card, c) or 0 for c in SCORECARD_COLUMNS]]
+        )[0]
+        for column, value in zip(TOTAL_COLUMNS, totals.tolist()):
+            setattr(card, column, value)
+        db.session.commit()
+
+
+def single_update(first_id, turn_list):
+    """
+    Score each turn with one UPDATE statement.
+    """
+    for index, category, score in turn_list:
+        UsersGames.set_score(first_id + index, category, score)
+        db.session.commit()
+
+
+def main(count):
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(username='bench', password='!', first_name='B',
+                            last_name='B', email='bench@example.com'))
+        db.session.add(Game())
+        db.session.commit()
+
+        turn_list = turns(count)
+        for name, fn in (('read-modify-write', read_modify_write),
+                         ('single UPDATE', single_update)):
+            first_id = add_scorecards(count // len(CATEGORIES) + 1)
+            started = time.perf_counter()
+            fn(first_id, turn_list)
+            elapsed = time.perf_counter() - started
+            print(f'{name:>17}: {count / elapsed:8.0f} turns/s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else TURNS)
@@ -0,0 +1,61 @@
+"""
+This is a benchmark of the vectorized scoring engine. It scores millions of
+random rolls with score_rolls and compares the rate with the plain Python
+score_roll reference, after checking both agree on every possible roll.
+
+Usage: python benchmarks/bench_scoring.py [ROLLS]
+"""
+
+import itertools
+import os
+import sys
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import numpy as np  # noqa: E402
+
+from yahtzee.scoring import (SCORECARD_COLUMNS, score_roll,  # noqa: E402
+                             score_rolls, score_totals)
+
+ROLLS = 2000000
+REFERENCE_ROLLS = 200000
+
+
+def rate(count, fn, repeat=3):
+    """
+    Return items per second of the best of repeat runs of fn.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return count / best
+
+
+def main(count):
+    # both implementations must agree on all 6**5 rolls
+    every_roll = np.array(list(itertools.product(range(1, 7), repeat=5)))
+    reference = np.array([score_roll(tuple(roll)) for roll in every_roll])
+    assert (score_rolls(every_roll) == reference).all()
+
+    rng = np.random.default_rng(42)
+    dice = rng.integers(1, 7, size=(count, 5))
+    sample = dice[:REFERENCE_ROLLS].tolist()
+    cards = rng.integers(0, 30, size=(count, len(SCORECARD_COLUMNS)))
+
+    vectorized = rate(count, lambda: score_rolls(dice))
+    python = rate(len(sample), lambda: [score_roll(roll) for roll in sample],
+                  repeat=1)
+    totals = rate(count, lambda: score_totals(cards))
+
+    print(f'score_rolls:  {vectorized / 1e6:8.2f}M rolls/s')
+    print(f'score_roll:   {python / 1e6:8.2f}M rolls/s '
+          f'(score_rolls is {vectorized / python:.0f}x faster)')
+    print(f'score_totals: {totals / 1e6:8.2f}M scorecards/s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if sys.argv[1:] else ROLLS)
@@ -0,0 +1,90 @@
+"""
+This is a benchmark of serializing user listings for the REST API. It compares
+loading User instances, dumping them with Marshmallow's UserSchema and
+encoding with the json module (the path before row serializers), to querying
+row tuples, dumping them with the compiled row serializer and encoding with
+orjson. The outputs are checked to decode to the same users.
+
+Usage: python benchmarks/bench_serialization.py [USERS ...]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+# point the app at a scratch database before it is imported
+DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + DB_PATH
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+from flask.json import JSONEncoder  # noqa: E402
+
+from yahtzee import create_app, db  # noqa: E402
+from yahtzee.json_encoder import OrjsonEncoder  # noqa: E402
+from yahtzee.models import User, UserSchema  # noqa: E402
+from yahtzee.serializers import user_rows  # noqa: E402
+
+app = create_app(config={'SQLALCHEMY_ECHO': False})
+
+USERS = [100, 1000, 10000, 100000]
+REPEAT = 3
+
+
+def seed(count):
+    db.session.execute(User.__table__.delete())
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'user{i}', 'password': '!', 'first_name': 'First',
+         'last_name': f'Last{i:06d}', 'email': f'user{i}@example.com'}
+        for i in range(count)
+    ])
+    db.session.commit()
+
+
+def marshmallow_path():
+    users = User.query.order_by(User.last_name, User.id).all()
+    dumped = UserSchema(many=True).dump(users)
+    return json.dumps({'users': dumped}, cls=JSONEncoder, sort_keys=True)
+
+
+def rows_path():
+    rows = user_rows.query().order_by(User.last_name, User.id).all()
+    dumped = user_rows.dump_many(rows)
+    return json.dumps({'users': dumped}, cls=OrjsonEncoder, sort_keys=True)
+
+
+def best_of(path):
+    """
+    Time path REPEAT times, each in a new session.
+
+    :return: (best seconds, output of the last run)
+    """
+    best = float('inf')
+    for _ in range(REPEAT):
+        db.session.remove()
+        started = time.perf_counter()
+        output = path()
+        best = min(best, time.perf_counter() - started)
+    return best, output
+
+
+def main(counts):
+    with app.app_context():
+        db.create_all()
+        print(f"{'users':>7} {'marshmallow ms':>15} {'rows ms':>9} "
+              f"{'speedup':>8}")
+        for count in counts:
+            seed(count)
+            slow, expected = best_of(marshmallow_path)
+            fast, output = best_of(rows_path)
+            assert json.loads(output) == json.loads(expected)
+            print(f'{count:>7} {slow * 1000:>15.1f} {fast * 1000:>9.1f} '
+                  f'{slow / fast:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or USERS)
@@ -15,24 +15,201 @@ class Config(object):
 
     SESSION_COOKIE_SECURE = True
 
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') \
+        or 'sqlite:///' + os.path.join(BASEDIR, 'data/yahtzee.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # log every statement only while debugging, with SQLALCHEMY_ECHO=1
+    SQLALCHEMY_ECHO = os.environ.get('SQLALCHEMY_ECHO') == '1'
+
+    # engine profile: a pool of connections (threads share SQLite ones too),
+    # recycled after half an hour
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_timeout': 10,
+        'pool_recycle': 1800,
+    }
+
+    # run on every new SQLite connection: WAL lets readers carry on while a
+    # transaction writes, NORMAL only syncs at checkpoints (safe in WAL),
+    # writers wait up to busy_timeout ms for the lock instead of failing,
+    # pages are cached (KiB when negative) and memory mapped (bytes), and
+    # foreign keys are enforced, which SQLite leaves off by default
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'ON',
+    }
+
+    # page size of user listings, and the largest page the API will serve
+    USERS_PER_PAGE = 20
+    USERS_MAX_PER_PAGE = 100
+
+    # the REST API only creates, changes, deletes or exports rows for clients
+    # sending API_TOKEN as a bearer token, and not at all while it is unset
+    API_TOKEN = os.environ.get('API_TOKEN')
+
+    # number of rows fetched and held in memory at a time by bulk exports
+    EXPORT_BATCH_SIZE = 1000
+
+    # bcrypt work factor, and the threads hashing passwords off the request
+    # thread with how many more hashes may queue before we answer 503
+    BCRYPT_LOG_ROUNDS = 12
+    BCRYPT_POOL_WORKERS = os.cpu_count() or 1
+    BCRYPT_QUEUE_DEPTH = 16
+
+    # emails are queued in the outbox table and sent by the outbox worker in
+    # batches, failed sends are retried after BACKOFF * 2**n seconds; a
+    # worker claims its batch for LEASE seconds, after which the messages it
+    # did not get to (e.g. it died) are due again for the other workers
+    MAIL_OUTBOX_BATCH_SIZE = 50
+    MAIL_OUTBOX_LEASE = 300
+    MAIL_OUTBOX_MAX_ATTEMPTS = 8
+    MAIL_OUTBOX_BACKOFF = 30
+    MAIL_OUTBOX_BACKOFF_MAX = 3600
+    MAIL_OUTBOX_POLL_INTERVAL = 5
+
+    # profile pictures are decoded on a process pool and saved in each size
+    # (px) as JPEG, plus WebP when AVATAR_WEBP, and uploads are capped at 32MB
+    AVATAR_SIZES = (32, 64, 125)
+    AVATAR_WEBP = True
+
+    # a replaced picture keeps its files if an upload saved or reused them
+    # in the last GRACE seconds, that upload may not be committed yet
+    AVATAR_REUSE_GRACE = 60
+    IMAGE_POOL_WORKERS = 2
+    MAX_CONTENT_LENGTH = 32 * 1024 * 1024
+
+    # fingerprinted static files are sent by Flask, or by the web server with
+    # USE_X_SENDFILE (X-Sendfile) or an NGINX internal location prefix such
+    # as '/_static/' here (X-Accel-Redirect)
+    USE_X_SENDFILE = False
+    ASSETS_ACCEL_REDIRECT = None
+
+    # leaders listed by default and at most, and how often (secs) a process
+    # reloads its rank tree to see games finished by other processes
+    LEADERBOARD_SIZE = 10
+    LEADERBOARD_MAX_SIZE = 100
+    LEADERBOARD_REFRESH = 5
+
+    # users kept by each worker for the login of a request, and for how long
+    # (secs) another worker's change to a user can go unseen
+    USER_CACHE_SIZE = 10000
+    USER_CACHE_TTL = 60
+
+    # logins and password reset requests allowed per client address, per
+    # account (email) from each address and per account from any address, as
+    # (requests, seconds to refill them all); the account limit is looser than
+    # the account_ip one so a single client cannot lock its owner out; buckets
+    # are kept in RATELIMIT_STORE, a class taking the max number of keys
+    RATELIMIT_ENABLED = True
+    RATELIMIT_STORE = 'yahtzee.ratelimit.MemoryStore'
+    RATELIMIT_STORE_MAX_KEYS = 100000
+    RATELIMIT_LOGIN = {'ip': (20, 60), 'account_ip': (10, 300),
+                       'account': (100, 3600)}
+    RATELIMIT_RESET_PASSWORD = {'ip': (5, 300), 'account_ip': (3, 3600),
+                                'account': (5, 3600)}
+    RATELIMIT_AVAILABILITY = {'ip': (60, 60)}
+
+    # proxies in front of the app setting X-Forwarded-For, whose address is
+    # then taken as the client's (ProxyFix); 0 when clients connect directly
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+
+    # the live username/email check of the registration page looks names up
+    # in a Bloom filter, rebuilt every AVAILABILITY_REFRESH secs, and only
+    # asks the db about those the filter may hold
+    AVAILABILITY_REFRESH = 600
+    AVAILABILITY_FALSE_POSITIVE_RATE = 0.01
+
+    # compiled templates are kept in TEMPLATE_BYTECODE_CACHE_DIR, a per user
+    # temp dir by default, so new workers load rather than compile them; a
+    # worker keeps up to FRAGMENT_CACHE_SIZE bytes of {% cache %} fragments
+    TEMPLATE_BYTECODE_CACHE = True
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get(
+        'TEMPLATE_BYTECODE_CACHE_DIR')
+    FRAGMENT_CACHE_SIZE = 8 * 1024 * 1024
+
+    # /metrics serves the metrics of the worker answering, only to scrapers
+    # sending METRICS_TOKEN as a bearer token when it is set; it is off
+    # unless METRICS_ENABLED=1, and with METRICS_REQUIRE_TOKEN it is not
+    # served at all while no token is set
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    METRICS_REQUIRE_TOKEN = False
+
+    # requests are profiled (cProfile and every SQL statement) with
+    # PROFILER_ENABLED, or when sending X-Profile with PROFILER_ALLOW_HEADER;
+    # SQL run PROFILER_REPEAT_THRESHOLD times by a request is reported as an
+    # N+1, and the last PROFILER_KEEP profiles are listed at /metrics/profiles
+    # (and dumped as .prof files to PROFILER_DIR when set)
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED') == '1'
+    PROFILER_ALLOW_HEADER = False
+    PROFILER_REPEAT_THRESHOLD = 3
+    PROFILER_KEEP = 20
+    PROFILER_DIR = os.environ.get('PROFILER_DIR')
+
+    # most SQL queries a request to an endpoint may run, logged when exceeded
+    # or failing the request with PROFILER_FAIL_ON_BUDGET
+    QUERY_BUDGETS = {
+        'main.home': 4,
+        'main.about': 1,
+        'users.register': 3,
+        'users.register_available': 3,
+        'users.login': 3,
+        'users.logout': 2,
+        'users.account': 5,
+        'users.reset_request': 4,
+        'users.reset_token': 4,
+    }
+    PROFILER_FAIL_ON_BUDGET = False
+
+    # events of the users blueprint are queued (up to LOG_QUEUE_SIZE, then
+    # dropped) and written by a thread in batches as JSON lines, to a file
+    # rotated at USERS_LOG_MAX_BYTES; LOG_SAMPLING keeps a share of the
+    # records of busy events, e.g. {'account_updated': 0.1}
+    USERS_LOG_FILE = os.path.join(BASEDIR, 'yahtzee/users.log')
+    USERS_LOG_MAX_BYTES = 10 * 1024 * 1024
+    USERS_LOG_BACKUPS = 5
+    LOG_QUEUE_SIZE = 10000
+    LOG_BATCH_SIZE = 256
+    LOG_SAMPLING = {}
+
 
 class ProductionConfig(Config):
-    pass
+    # served behind NGINX
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 1))
+
+    # the metrics of a public site are never served without a token
+    METRICS_REQUIRE_TOKEN = True
+
+    SQLALCHEMY_ENGINE_OPTIONS = dict(
+        Config.SQLALCHEMY_ENGINE_OPTIONS,
+        pool_size=10,
+        max_overflow=20,
+    )
 
 
 class DevelopmentConfig(Config):
     DEBUG = True
 
+    METRICS_ENABLED = True
+    PROFILER_ALLOW_HEADER = True
+
     DB_NAME = "development-db"
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' \
-        + os.path.join(BASEDIR, 'data/yahtzee.db')
-    SQLALCHEMY_ECHO = True
 
     SESSION_COOKIE_SECURE = False
 
-    MAIL_SERVER = 'smtp.googlemail.com'
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    BCRYPT_LOG_ROUNDS = 10
+
+    # point MAIL_SERVER/MAIL_PORT at a local SMTP stand-in to test delivery
+    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.googlemail.com')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', '1') == '1'
     MAIL_USERNAME = os.environ.get('EMAIL_USER')
     MAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD')
 
@@ -40,15 +217,18 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     TESTING = True
 
+    PROFILER_ALLOW_HEADER = True
+    PROFILER_FAIL_ON_BUDGET = True
+
     DB_NAME = "development-db"
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' \
-        + os.path.join(BASEDIR, 'data/yahtzee.db')
-    SQLALCHEMY_ECHO = True
 
     SESSION_COOKIE_SECURE = False
 
-    MAIL_SERVER = 'smtp.googlemail.com'
-    MAIL_PORT = 587
-    MAIL_USE_TLS = True
+    BCRYPT_LOG_ROUNDS = 4
+
+    # point MAIL_SERVER/MAIL_PORT at a local SMTP stand-in to test delivery
+    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.googlemail.com')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', '1') == '1'
     MAIL_USERNAME = os.environ.get('EMAIL_USER')
     MAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD')
@@ -1,16 +1,38 @@
 """
-This is a utility module to initialize, clean, and create the SQLite3 db.
+This is a utility module to initialize, clean, and create the SQLite3 db, and
+to fill it with a reproducible synthetic dataset of users, games and
+scorecards for load testing. Rows are written with SQLAlchemy Core executemany
+inserts in large transactions, with fast-load pragmas while the load runs.
+
+Usage:
+    python data/build_database.py                  # fresh db, 2 demo users
+    python data/build_database.py --users 1000000 --games 250000
+    python data/build_database.py --append --users 10000 --games 2500
 """
 
-import os, sys
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
 
 # adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
 
-from yahtzee import db
-from yahtzee.models import Game, User, UsersGames
+from sqlalchemy import event, func  # noqa: E402
+
+from yahtzee import create_app, bcrypt, db  # noqa: E402
+from yahtzee.leaderboard import rebuild_stats  # noqa: E402
+from yahtzee.models import Game, User, UserStats, UsersGames  # noqa: E402
+from yahtzee.rules import (FULL_HOUSE, LARGE_STRAIGHT,  # noqa: E402
+                           LOWER_CATEGORIES, SMALL_STRAIGHT,
+                           UPPER_BONUS, UPPER_BONUS_THRESHOLD,
+                           UPPER_CATEGORIES, YAHTZEE, YAHTZEE_BONUS)
+
+app = create_app(config={'SQLALCHEMY_ECHO': False})
 
-# dummy data to initialize the database with
+# demo accounts created in every fresh database, password 'abc123'
 USERS = [
     {
         'username': 'pmacking',
@@ -28,111 +50,237 @@ USERS = [
     }
 ]
 
-GAMES = [
-    {
-    }
+FIRST_NAMES = [
+    'Alex', 'Blake', 'Casey', 'Dana', 'Eli', 'Finley', 'Gray', 'Harper',
+    'Indy', 'Jordan', 'Kai', 'Logan', 'Morgan', 'Noor', 'Oakley', 'Parker',
+    'Quinn', 'Riley', 'Sage', 'Taylor', 'Uma', 'Vic', 'Wren', 'Yael',
+]
+LAST_NAMES = [
+    'Anders', 'Brooks', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia',
+    'Haddad', 'Ito', 'Jensen', 'Kowalski', 'Lopez', 'Maclachlan', 'Nguyen',
+    'Okafor', 'Patel', 'Quinn', 'Rossi', 'Silva', 'Tanaka', 'Usman',
+    'Varga', 'Williams', 'Xu', 'Yilmaz', 'Zhang',
 ]
 
-USERSGAMES = [
-    {
-        'ones': 0,
-        'twos': 0,
-        'threes': 0,
-        'fours': 0,
-        'fives': 0,
-        'sixes': 0,
-        'three_of_a_kind': 0,
-        'four_of_a_kind': 0,
-        'full_house': 0,
-        'small_straight': 0,
-        'large_straight': 0,
-        'yahtzee': 0,
-        'chance': 0,
-        'yahtzee_bonus': 0,
-        'top_score': 0,
-        'top_bonus_score': 0,
-        'top_bonus_score_delta': 0,
-        'total_top_score': 0,
-        'total_bottom_score': 0,
-        'grand_total_score': 0,
-        'user_id': 1,
-        'game_id': 1
-    },
-    {
-        'ones': 0,
-        'twos': 0,
-        'threes': 0,
-        'fours': 0,
-        'fives': 0,
-        'sixes': 0,
-        'three_of_a_kind': 0,
-        'four_of_a_kind': 0,
-        'full_house': 0,
-        'small_straight': 0,
-        'large_straight': 0,
-        'yahtzee': 0,
-        'chance': 0,
-        'yahtzee_bonus': 0,
-        'top_score': 0,
-        'top_bonus_score': 0,
-        'top_bonus_score_delta': 0,
-        'total_top_score': 0,
-        'total_bottom_score': 0,
-        'grand_total_score': 0,
-        'user_id': 2,
-        'game_id': 1
-    },
+# chance that a player scratches (scores 0 in) each fixed score category
+SCRATCH = {
+    'full_house': 0.35,
+    'small_straight': 0.25,
+    'large_straight': 0.55,
+    'yahtzee': 0.7,
+}
+FIXED_SCORES = {
+    'full_house': FULL_HOUSE,
+    'small_straight': SMALL_STRAIGHT,
+    'large_straight': LARGE_STRAIGHT,
+    'yahtzee': YAHTZEE,
+}
+
+# pragmas trading durability for speed while the generator owns the db
+FAST_LOAD_PRAGMAS = [
+    'PRAGMA journal_mode = MEMORY',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA cache_size = -262144',
+    'PRAGMA temp_store = MEMORY',
 ]
 
-# delete database file if it already exists
-if os.path.exists('./data/yahtzee.db'):
-    os.remove('./data/yahtzee.db')
-
-# create the database
-db.create_all()
-
-# iterate over the USERS dummy data and populate the users in the db
-for user in USERS:
-    u = User(
-        username=user['username'],
-        password=user['password'],
-        first_name=user['first_name'],
-        last_name=user['last_name'],
-        email=user['email']
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=0,
+                        help='synthetic users to add (default 0)')
+    parser.add_argument('--games', type=int, default=0,
+                        help='synthetic games to add (default 0)')
+    parser.add_argument('--players', type=int, default=4,
+                        help='max players per game (default 4)')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='random seed, the same seed gives the same data')
+    parser.add_argument('--batch-size', type=int, default=50000,
+                        help='rows per executemany and per transaction')
+    parser.add_argument('--append', action='store_true',
+                        help='top up the existing db instead of replacing it')
+    return parser.parse_args()
+
+
+def scorecard(rng):
+    """
+    Make the 14 category scores and 6 totals of one finished game, with
+    scores distributed roughly like real play.
+    """
+    card = {}
+
+    # upper section: mostly 2-4 of each face, occasionally a scratch or 5
+    for face, category in enumerate(UPPER_CATEGORIES, start=1):
+        card[category] = face * rng.choices(
+            (0, 1, 2, 3, 4, 5), weights=(3, 10, 25, 40, 18, 4))[0]
+
+    # sum-of-dice categories, the kinds are scratched fairly often
+    card['three_of_a_kind'] = 0 if rng.random() < 0.15 \
+        else min(30, max(5, int(rng.gauss(21, 4))))
+    card['four_of_a_kind'] = 0 if rng.random() < 0.45 \
+        else min(30, max(5, int(rng.gauss(18, 5))))
+    card['chance'] = min(30, max(5, int(rng.gauss(22, 3))))
+
+    for category, score in FIXED_SCORES.items():
+        card[category] = 0 if rng.random() < SCRATCH[category] else score
+    card['yahtzee_bonus'] = YAHTZEE_BONUS * rng.choices(
+        (0, 1, 2), weights=(90, 8, 2))[0] if card['yahtzee'] else 0
+
+    top_score = sum(card[category] for category in UPPER_CATEGORIES)
+    top_bonus_score = UPPER_BONUS if top_score >= UPPER_BONUS_THRESHOLD \
+        else 0
+    total_top_score = top_score + top_bonus_score
+    total_bottom_score = sum(card[category] for category in LOWER_CATEGORIES) \
+        + card['yahtzee_bonus']
+    card.update(
+        top_score=top_score,
+        top_bonus_score=top_bonus_score,
+        top_bonus_score_delta=max(0, UPPER_BONUS_THRESHOLD - top_score),
+        total_top_score=total_top_score,
+        total_bottom_score=total_bottom_score,
+        grand_total_score=total_top_score + total_bottom_score,
+    )
+    return card
+
+
+def insert_rows(table, rows, batch_size):
+    """
+    Insert an iterable of row dicts with one executemany and one transaction
+    per batch.
+
+    :return: number of rows inserted
+    """
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        count += len(batch)
+    return count
+
+
+def generate_users(rng, first_id, count, password):
+    for user_id in range(first_id, first_id + count):
+        yield {
+            'id': user_id,
+            'username': f'user{user_id}',
+            'password': password,
+            'first_name': rng.choice(FIRST_NAMES),
+            'last_name': rng.choice(LAST_NAMES),
+            'email': f'user{user_id}@example.com',
+        }
+
+
+def generate_games(first_id, count):
+    for game_id in range(first_id, first_id + count):
+        yield {'game_id': game_id}
+
+
+def generate_users_games(rng, first_game_id, count, max_user_id, players,
+                         finished_at):
+    for game_id in range(first_game_id, first_game_id + count):
+        for user_id in rng.sample(range(1, max_user_id + 1),
+                                  min(max_user_id, rng.randint(1, players))):
+            row = scorecard(rng)
+            row.update(user_id=user_id, game_id=game_id,
+                       finished_at=finished_at)
+            yield row
+
+
+def report(name, count, started):
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed else 0
+    print(f'{name:>12}: {count:>10} rows in {elapsed:7.2f}s '
+          f'({rate:,.0f} rows/sec)')
+
+
+def main():
+    args = parse_args()
+
+    with app.app_context():
+        # delete the database file of the app config (and its WAL files) if
+        # it already exists, unless topping it up
+        db_path = db.engine.url.database
+        if not args.append and db_path and db_path != ':memory:':
+            for path in (db_path, db_path + '-wal', db_path + '-shm'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        # pragmas are per connection, so apply them to every new one, after
+        # (and over) the pragmas of the app config
+        @event.listens_for(db.engine, 'connect')
+        def fast_load(dbapi_connection, connection_record):
+            for pragma in FAST_LOAD_PRAGMAS:
+                dbapi_connection.execute(pragma)
+
+        # create the database
+        db.create_all()
+
+        # continue numbering after existing rows so top-ups never collide
+        max_user_id = db.session.query(func.max(User.id)).scalar() or 0
+        max_game_id = db.session.query(func.max(Game.game_id)).scalar() or 0
+
+        # seed from the existing row counts too, so each top-up differs
+        rng = random.Random(f'{args.seed}:{max_user_id}:{max_game_id}')
+
+        # hash once with a low cost, every synthetic user shares it
+        password = bcrypt.generate_password_hash(
+            USERS[0]['password'], 4).decode('utf-8')
+
+        # every generated game is over
+        finished_at = datetime.utcnow()
+
+        started = time.perf_counter()
+        if max_user_id == 0:
+            for user in USERS:
+                db.session.add(User(**dict(user, password=password)))
+            db.session.add(Game())
+            db.session.commit()
+            max_user_id, max_game_id = len(USERS), 1
+            insert_rows(UsersGames.__table__, [
+                dict(scorecard(rng), user_id=user_id, game_id=1,
+                     finished_at=finished_at)
+                for user_id in range(1, len(USERS) + 1)
+            ], args.batch_size)
+
+        count = insert_rows(
+            User.__table__,
+            generate_users(rng, max_user_id + 1, args.users, password),
+            args.batch_size
         )
-    db.session.add(u)
-
-# iterate over GAMES dummy data and populate the games in the db
-for game in GAMES:
-    g = Game()
-    db.session.add(g)
-
-# iterate over the USERSGAMES dummy data and populate the users_games in the db
-for user_game in USERSGAMES:
-    ug = UsersGames(
-        ones=user_game['ones'],
-        twos=user_game['twos'],
-        threes=user_game['threes'],
-        fours=user_game['fours'],
-        fives=user_game['fives'],
-        sixes=user_game['sixes'],
-        three_of_a_kind=user_game['three_of_a_kind'],
-        four_of_a_kind=user_game['four_of_a_kind'],
-        full_house=user_game['full_house'],
-        small_straight=user_game['small_straight'],
-        large_straight=user_game['large_straight'],
-        yahtzee=user_game['yahtzee'],
-        chance=user_game['chance'],
-        yahtzee_bonus=user_game['yahtzee_bonus'],
-        top_score=user_game['top_score'],
-        top_bonus_score=user_game['top_bonus_score'],
-        top_bonus_score_delta=user_game['top_bonus_score_delta'],
-        total_top_score=user_game['total_top_score'],
-        total_bottom_score=user_game['total_bottom_score'],
-        grand_total_score=user_game['grand_total_score'],
-        user_id=user_game['user_id'],
-        game_id=user_game['game_id']
+        report('users', count, started)
+        max_user_id += count
+
+        started = time.perf_counter()
+        count = insert_rows(
+            Game.__table__,
+            generate_games(max_game_id + 1, args.games),
+            args.batch_size
+        )
+        report('games', count, started)
+
+        started = time.perf_counter()
+        count = insert_rows(
+            UsersGames.__table__,
+            generate_users_games(rng, max_game_id + 1, args.games,
+                                 max_user_id, args.players, finished_at),
+            args.batch_size
         )
-    db.session.add(ug)
+        report('users_games', count, started)
+
+        # bulk inserts skip finish_game, so aggregate the stats in one go
+        started = time.perf_counter()
+        rebuild_stats()
+        db.session.commit()
+        report('user_stats', UserStats.query.count(), started)
+
 
-db.session.commit()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+This is a utility module to export the user or users_games table of the db as
+NDJSON or CSV. Rows are streamed one batch at a time so memory use stays flat
+however large the table is.
+
+Usage: python data/export_database.py users --format csv -o users.csv
+"""
+
+import argparse
+import os
+import sys
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+from yahtzee import create_app, db  # noqa: E402
+from yahtzee.export import EXPORTS, FORMATS, stream_export  # noqa: E402
+
+# statement logging would interleave with the export on stdout
+app = create_app(config={'SQLALCHEMY_ECHO': False})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('table', choices=sorted(EXPORTS))
+    parser.add_argument('--format', dest='fmt', choices=sorted(FORMATS),
+                        default='ndjson')
+    parser.add_argument('-o', '--output',
+                        help='file to write to (default: stdout)')
+    parser.add_argument('--batch-size', type=int,
+                        default=app.config['EXPORT_BATCH_SIZE'])
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        with app.app_context():
+            for chunk in stream_export(db.session, args.table, args.fmt,
+                                       batch_size=args.batch_size):
+                out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
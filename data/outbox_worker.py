@@ -0,0 +1,21 @@
+"""
+This is a utility module to run the outbox worker, which sends the emails
+queued in the outbox table until it is interrupted.
+
+Usage: python data/outbox_worker.py
+"""
+
+import os
+import sys
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+from yahtzee import create_app  # noqa: E402
+from yahtzee.outbox import run_worker  # noqa: E402
+
+if __name__ == '__main__':
+    try:
+        run_worker(create_app())
+    except KeyboardInterrupt:
+        pass
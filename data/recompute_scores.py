@@ -0,0 +1,84 @@
+"""
+This is a utility module to recompute the total and bonus columns of every
+users_games scorecard in bulk from its category scores. Scorecards are read
+in batches, scored with one vectorized pass per batch, and only rows whose
+stored totals differ are updated. Scorecards holding impossible category
+scores are counted and reported.
+
+Usage: python data/recompute_scores.py [--batch-size N] [--dry-run]
+"""
+
+import argparse
+import os
+import sys
+
+# adds __file__ parent dir (/yahtzee-app) to sys.path to enable config ref
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import numpy as np  # noqa: E402
+from sqlalchemy import bindparam, func  # noqa: E402
+
+from yahtzee import create_app, db  # noqa: E402
+from yahtzee.export import iter_batches  # noqa: E402
+from yahtzee.models import UsersGames  # noqa: E402
+from yahtzee.scoring import (SCORECARD_COLUMNS, TOTAL_COLUMNS,  # noqa: E402
+                             score_totals, valid_scores)
+
+app = create_app(config={'SQLALCHEMY_ECHO': False})
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--dry-run', action='store_true',
+                        help='report differences without updating')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    table = UsersGames.__table__
+    update = table.update() \
+        .where(table.c.users_games_id == bindparam('b_id')) \
+        .values({name: bindparam(f'b_{name}') for name in TOTAL_COLUMNS})
+
+    # unscored categories are NULL, and count as 0
+    columns = [table.c.users_games_id] \
+        + [func.coalesce(table.c[name], 0) for name in SCORECARD_COLUMNS] \
+        + [table.c[name] for name in TOTAL_COLUMNS]
+
+    scanned = changed = invalid = 0
+    with app.app_context():
+        query = db.session.query(*columns).order_by(table.c.users_games_id)
+        for batch in iter_batches(query, args.batch_size):
+            rows = np.array(batch, dtype=np.int64)
+            ids = rows[:, 0]
+            cards = rows[:, 1:1 + len(SCORECARD_COLUMNS)]
+            stored = rows[:, 1 + len(SCORECARD_COLUMNS):]
+
+            totals = score_totals(cards)
+            differs = (totals != stored).any(axis=1)
+            invalid += int((~valid_scores(cards).all(axis=1)).sum())
+            scanned += len(rows)
+            changed += int(differs.sum())
+
+            # update this batch on the same connection as the open cursor,
+            # and commit once at the end so the cursor is never reset
+            if differs.any() and not args.dry_run:
+                db.session.execute(update, [
+                    dict({'b_id': int(row_id)},
+                         **{f'b_{name}': int(value)
+                            for name, value in zip(TOTAL_COLUMNS, row)})
+                    for row_id, row in zip(ids[differs], totals[differs])
+                ])
+
+        db.session.commit()
+
+    print(f'scanned {scanned} scorecards, {changed} with stale totals'
+          f'{"" if args.dry_run else " updated"}, '
+          f'{invalid} with impossible scores')
+
+
+if __name__ == '__main__':
+    main()
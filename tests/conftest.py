@@ -0,0 +1,116 @@
+"""
+This module holds the fixtures of the tests. Each test gets an app created
+with the testing config on a scratch SQLite db, writing its log to the temp
+dir of the test, and a client of that app. A config marker on a test
+overrides settings the app reads when it is created.
+"""
+
+import pytest
+
+from yahtzee import create_app, db
+from yahtzee.models import Game, User, UsersGames
+from yahtzee.users.hashing import generate_password_hash
+
+PASSWORD = 'abc123'
+
+# bearer token of the API writes and exports
+API_TOKEN = 'tests'
+
+
+def make_app(directory, **settings):
+    """
+    Create an app with the testing config, keeping its db and log in
+    directory. Stop its log pipeline once done with it.
+
+    :param directory: pathlib.Path of a scratch directory
+    :param settings: settings overriding those of the tests
+    :return: Flask app
+    """
+    config = {
+        'SECRET_KEY': 'tests',
+        'API_TOKEN': API_TOKEN,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{directory}/yahtzee.db',
+        'SQLALCHEMY_ECHO': False,
+        'USERS_LOG_FILE': str(directory / 'users.log'),
+        'TEMPLATE_BYTECODE_CACHE': False,
+        'WTF_CSRF_ENABLED': False,
+    }
+    config.update(settings)
+    return create_app('testing', config=config)
+
+
+@pytest.fixture
+def app(request, tmp_path):
+    # settings read when the app is created, e.g. @pytest.mark.config(...)
+    marker = request.node.get_closest_marker('config')
+    app = make_app(tmp_path, **(marker.kwargs if marker else {}))
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+    app.extensions['log_pipeline'].stop()
+
+
+@pytest.fixture
+def client(app):
+    """
+    Test client of the app, sending the API_TOKEN of the tests with every
+    request. Anonymous clients are made with app.test_client().
+    """
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {API_TOKEN}'
+    return client
+
+
+@pytest.fixture
+def query_budgets(app):
+    """
+    Set the QUERY_BUDGETS of endpoints for one test. The testing config sets
+    PROFILER_FAIL_ON_BUDGET, so a request running more queries than the
+    budget of its endpoint raises QueryBudgetExceeded out of the client.
+
+    :return: function of a dict of endpoint names to their budgets
+    """
+    def set_budgets(budgets):
+        # a new dict, the default one is shared by every app
+        app.config['QUERY_BUDGETS'] = dict(app.config['QUERY_BUDGETS'],
+                                           **budgets)
+    return set_budgets
+
+
+def add_user(username, last_name='Maclachlan', password=PASSWORD):
+    """
+    Add a user who can log in with password.
+
+    :return: id of the user
+    """
+    user = User(username=username,
+                password=generate_password_hash(password),
+                first_name=username.title(),
+                last_name=last_name,
+                email=f'{username}@test.com')
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def add_scorecard(user_id, game_id=None):
+    """
+    Add an empty scorecard of a user, in a new game unless game_id is given.
+
+    :return: users_games_id of the scorecard
+    """
+    if game_id is None:
+        game = Game()
+        db.session.add(game)
+        db.session.flush()
+        game_id = game.game_id
+    card = UsersGames(user_id=user_id, game_id=game_id)
+    db.session.add(card)
+    db.session.commit()
+    return card.users_games_id
+
+
+def login(client, username):
+    return client.post('/login', data={'email': f'{username}@test.com',
+                                       'password': PASSWORD})
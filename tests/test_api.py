@@ -0,0 +1,346 @@
+"""
+This module tests the REST API of swagger.yml, served under /api/v1.
+"""
+
+import csv
+import io
+import json
+
+import pytest
+from sqlalchemy import event
+
+from tests.conftest import add_scorecard, add_user
+from yahtzee import db, models
+
+API = '/api/v1'
+
+
+def new_user(username, last_name='Maclachlan'):
+    return {'username': username, 'email': f'{username}@test.com',
+            'first_name': username.title(), 'last_name': last_name}
+
+
+def test_create_and_read_users(client):
+    response = client.post(f'{API}/users', json=new_user('pmacking'))
+    assert response.status_code == 201
+    user_id = response.get_json()['id']
+    assert response.headers['ETag'] == '"1"'
+
+    response = client.post(f'{API}/users', json=new_user('pmacking'))
+    assert response.status_code == 409
+
+    response = client.get(f'{API}/users/{user_id}')
+    assert response.status_code == 200
+    assert response.get_json()['username'] == 'pmacking'
+    assert client.get(f'{API}/users/{user_id + 1}').status_code == 404
+
+
+def test_users_pages(client):
+    for i, last_name in enumerate(['Cole', 'Able', 'Baker']):
+        client.post(f'{API}/users', json=new_user(f'user{i}', last_name))
+
+    page = client.get(f'{API}/users', query_string={'limit': 2}).get_json()
+    assert [user['last_name'] for user in page['users']] == ['Able', 'Baker']
+    assert page['prev'] is None
+
+    page = client.get(f'{API}/users', query_string={
+        'limit': 2, 'cursor': page['next']}).get_json()
+    assert [user['last_name'] for user in page['users']] == ['Cole']
+    assert page['next'] is None
+
+    response = client.get(f'{API}/users', query_string={'cursor': 'bad'})
+    assert response.status_code == 400
+
+
+def test_users_page_not_modified(client):
+    client.post(f'{API}/users', json=new_user('pmacking'))
+    etag = client.get(f'{API}/users').headers['ETag']
+
+    response = client.get(f'{API}/users', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    client.post(f'{API}/users', json=new_user('tayadawne'))
+    response = client.get(f'{API}/users', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_sparse_fieldsets(client, app):
+    user_id = add_user('pmacking')
+    add_scorecard(user_id)
+
+    page = client.get(f'{API}/users', query_string={
+        'fields': 'username,users_games.grand_total_score'}).get_json()
+    assert page['users'] == [{'username': 'pmacking', 'users_games': [
+        {'grand_total_score': 0}]}]
+
+    response = client.get(f'{API}/users/{user_id}',
+                          query_string={'fields': 'last_name'})
+    assert response.get_json() == {'last_name': 'Maclachlan'}
+
+    response = client.get(f'{API}/users',
+                          query_string={'fields': 'password'})
+    assert response.status_code == 400
+
+
+def test_update_if_match(client):
+    user_id = client.post(f'{API}/users',
+                          json=new_user('pmacking')).get_json()['id']
+    url = f'{API}/users/{user_id}'
+
+    response = client.put(url, json={'first_name': 'Paul'},
+                          headers={'If-Match': '"1"'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"2"'
+
+    # a second writer still holding version 1 loses
+    response = client.put(url, json={'first_name': 'Pablo'},
+                          headers={'If-Match': '"1"'})
+    assert response.status_code == 409
+    assert response.get_json()['current']['first_name'] == 'Paul'
+
+
+def test_delete_user(client):
+    user_id = client.post(f'{API}/users',
+                          json=new_user('pmacking')).get_json()['id']
+    assert client.delete(f'{API}/users/{user_id}').status_code == 200
+    assert client.delete(f'{API}/users/{user_id}').status_code == 404
+
+
+def test_batch_create(client):
+    add_user('pmacking')
+    users = [new_user('pmacking', 'Updated'), new_user('batch1'),
+             new_user('batch1'), {'username': 'batch2'}]
+
+    results = client.post(f'{API}/users:batch',
+                          json=users).get_json()['results']
+    assert [result['status'] for result in results] == \
+        ['conflict', 'created', 'conflict', 'invalid']
+
+    results = client.post(f'{API}/users:batch', json=users[:1],
+                          query_string={'on_conflict': 'update'}) \
+        .get_json()['results']
+    assert results[0]['status'] == 'updated'
+
+
+def test_export(client):
+    for username in ('pmacking', 'tayadawne'):
+        add_user(username)
+
+    response = client.get(f'{API}/export/users.ndjson')
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.data.splitlines()]
+    assert [line['username'] for line in lines] == ['pmacking', 'tayadawne']
+    assert 'password' not in lines[0]
+
+    response = client.get(f'{API}/export/users.csv')
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [row['username'] for row in rows] == ['pmacking', 'tayadawne']
+
+    assert client.get(f'{API}/export/user.csv').status_code == 400
+
+
+def test_score_entry_and_finish(client):
+    card_id = add_scorecard(add_user('pmacking'))
+    url = f'{API}/users_games/{card_id}'
+
+    response = client.put(f'{url}/sixes', json={'dice': [6, 6, 6, 1, 2]})
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'category': 'sixes', 'score': 18, 'top_score': 18,
+        'top_bonus_score': 0, 'top_bonus_score_delta': 45,
+        'total_top_score': 18, 'total_bottom_score': 0,
+        'grand_total_score': 18}
+    version = response.headers['ETag']
+
+    response = client.put(f'{url}/chance', json={'score': 17},
+                          headers={'If-Match': version})
+    assert response.get_json()['grand_total_score'] == 35
+
+    # the scorecard moved on from that version
+    response = client.put(f'{url}/ones', json={'score': 3},
+                          headers={'If-Match': version})
+    assert response.status_code == 409
+
+    response = client.put(f'{url}/full_house', json={'score': 24})
+    assert response.status_code == 400
+
+    # a category is scored once
+    response = client.put(f'{url}/sixes', json={'score': 24})
+    assert response.status_code == 409
+
+    response = client.post(f'{url}/finish')
+    assert response.get_json() == {'best_score': 35, 'new_best': True}
+    assert client.post(f'{url}/finish').status_code == 409
+    assert client.put(f'{url}/ones', json={'score': 3}).status_code == 409
+
+
+def test_jokers_and_yahtzee_bonus(client):
+    url = f'{API}/users_games/' + str(add_scorecard(add_user('pmacking')))
+    yahtzee = {'dice': [4, 4, 4, 4, 4]}
+
+    # a yahtzee is no full house while the yahtzee box is open
+    response = client.put(f'{url}/full_house', json=yahtzee)
+    assert response.get_json()['score'] == 0
+    assert client.put(f'{url}/yahtzee_bonus',
+                      json={'score': 100}).status_code == 409
+
+    assert client.put(f'{url}/yahtzee', json=yahtzee).status_code == 200
+    response = client.put(f'{url}/large_straight', json=yahtzee)
+    assert response.get_json()['score'] == 40
+
+    for bonus in (100, 200):
+        response = client.put(f'{url}/yahtzee_bonus', json={'score': bonus})
+        assert response.get_json()['score'] == bonus
+    assert client.put(f'{url}/yahtzee_bonus',
+                      json={'score': 100}).status_code == 409
+    assert response.get_json()['grand_total_score'] == 290
+
+
+def test_leaderboard(client):
+    for username, category, score in (('pmacking', 'chance', 20),
+                                      ('tayadawne', 'yahtzee', 50),
+                                      ('third', 'chance', 20)):
+        card_id = add_scorecard(add_user(username))
+        client.put(f'{API}/users_games/{card_id}/{category}',
+                   json={'score': score})
+        client.post(f'{API}/users_games/{card_id}/finish')
+
+    leaders = client.get(f'{API}/leaderboard').get_json()['leaders']
+    assert [(leader['username'], leader['rank']) for leader in leaders] == \
+        [('tayadawne', 1), ('pmacking', 2), ('third', 2)]
+    assert leaders[0]['yahtzees'] == 1
+
+    response = client.get(f'{API}/leaderboard/1')
+    assert response.get_json()['rank'] == 2
+    assert client.get(f'{API}/leaderboard/9').status_code == 404
+
+    leaders = client.get(f'{API}/leaderboard/2/around',
+                         query_string={'count': 1}).get_json()['leaders']
+    assert [leader['username'] for leader in leaders] == \
+        ['tayadawne', 'pmacking']
+
+
+@pytest.mark.parametrize('returning, statements', [(True, 1), (False, 2)])
+def test_score_entry_round_trips(client, monkeypatch, returning, statements):
+    card_id = add_scorecard(add_user('pmacking'))
+    monkeypatch.setattr(models, 'supports_returning', lambda dialect:
+                        returning)
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        response = client.put(f'{API}/users_games/{card_id}/chance',
+                              json={'score': 17})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    assert response.get_json()['grand_total_score'] == 17
+    assert len(executed) == statements
+
+
+def test_turns_bump_game_version(client):
+    card_id = add_scorecard(add_user('pmacking'))
+    game_id = models.UsersGames.query.get(card_id).game_id
+    add_scorecard(add_user('tayadawne'), game_id)
+
+    def game_version():
+        db.session.expire_all()
+        return models.Game.query.get(game_id).version_id
+
+    version = game_version()
+    client.put(f'{API}/users_games/{card_id}/chance', json={'score': 17})
+    assert game_version() == version + 1
+    client.put(f'{API}/users_games/{card_id + 1}/ones', json={'score': 3})
+    client.post(f'{API}/users_games/{card_id}/finish')
+    assert game_version() == version + 3
+
+
+def test_read_game_versions(client):
+    card_id = add_scorecard(add_user('pmacking'))
+    game_id = models.UsersGames.query.get(card_id).game_id
+    add_scorecard(add_user('tayadawne'), game_id)
+
+    response = client.get(f'{API}/games/{game_id}')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    game = response.get_json()
+    assert [card['users_games_id'] for card in game['users_games']] == \
+        [card_id, card_id + 1]
+    assert game['users_games'][0]['chance'] is None
+
+    response = client.get(f'{API}/games/{game_id}',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    response = client.get(f'{API}/games/{game_id}',
+                          headers={'If-Match': etag})
+    assert response.status_code == 200
+
+    # a turn of either player is a new version of the game
+    client.put(f'{API}/users_games/{card_id + 1}/chance', json={'score': 17})
+    response = client.get(f'{API}/games/{game_id}',
+                          headers={'If-Match': etag})
+    assert response.status_code == 412
+    assert response.content_type == 'application/problem+json'
+    response = client.get(f'{API}/games/{game_id}',
+                          headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert response.get_json()['users_games'][1]['chance'] == 17
+
+    assert client.get(f'{API}/games/{game_id + 1}').status_code == 404
+
+
+@pytest.mark.parametrize('method, path', [
+    ('post', '/users'),
+    ('post', '/users:batch'),
+    ('put', '/users/1'),
+    ('delete', '/users/1'),
+    ('put', '/users_games/1/sixes'),
+    ('post', '/users_games/1/finish'),
+    ('get', '/export/users.csv'),
+])
+def test_writes_and_exports_need_token(app, method, path):
+    add_scorecard(add_user('pmacking'))
+    anonymous = app.test_client()
+
+    response = getattr(anonymous, method)(f'{API}{path}', json={})
+    assert response.status_code == 401
+    assert response.content_type == 'application/problem+json'
+    response = getattr(anonymous, method)(
+        f'{API}{path}', json={}, headers={'Authorization': 'Bearer wrong'})
+    assert response.status_code == 401
+    assert models.User.query.count() == 1
+
+
+@pytest.mark.config(API_TOKEN=None)
+def test_writes_refused_without_token_set(client):
+    response = client.delete(f'{API}/users/{add_user("pmacking")}')
+    assert response.status_code == 401
+
+
+def test_reads_are_public(app):
+    user_id = add_user('pmacking')
+    anonymous = app.test_client()
+    assert anonymous.get(f'{API}/users').status_code == 200
+    assert anonymous.get(f'{API}/users/{user_id}').status_code == 200
+
+
+@pytest.mark.parametrize('method, path, status', [
+    ('get', '/users/99', 404),
+    ('get', '/nothing', 404),
+    ('patch', '/users/1', 405),
+    ('get', '/users?cursor=bad', 400),
+])
+def test_errors_are_problems(client, method, path, status):
+    response = getattr(client, method)(f'{API}{path}')
+    assert response.status_code == status
+    assert response.content_type == 'application/problem+json'
+    assert response.get_json()['status'] == status
+
+
+def test_site_errors_stay_pages(client):
+    response = client.get('/nothing')
+    assert response.status_code == 404
+    assert response.content_type.startswith('text/html')
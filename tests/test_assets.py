@@ -0,0 +1,59 @@
+"""
+This module tests the fingerprinted URLs of static files: they are cached
+forever, old fingerprints redirect to the current one and revalidations get
+a 304.
+"""
+
+import pytest
+from flask import url_for
+
+from yahtzee.assets.routes import IMMUTABLE
+from yahtzee.assets.utils import asset_url, file_fingerprint
+
+
+@pytest.fixture
+def css_url(app):
+    with app.test_request_context():
+        return asset_url('main.css')
+
+
+def test_asset_is_immutable(client, css_url):
+    assert css_url == f"/assets/{file_fingerprint('main.css')}/main.css"
+
+    response = client.get(css_url)
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == IMMUTABLE
+    assert response.headers['ETag'] == f'"{file_fingerprint("main.css")}"'
+    assert response.mimetype == 'text/css'
+
+
+def test_old_fingerprint_redirects(client, css_url):
+    response = client.get('/assets/0123456789abcdef/main.css')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith(css_url)
+
+    assert client.get('/assets/0123456789abcdef/missing.css') \
+        .status_code == 404
+    assert client.get('/assets/0123456789abcdef/../config.py') \
+        .status_code == 404
+
+
+def test_missing_file_keeps_static_url(app):
+    with app.test_request_context():
+        assert asset_url('missing.css') == \
+            url_for('static', filename='missing.css')
+
+
+def test_revalidation_not_modified(client, css_url):
+    etag = client.get(css_url).headers['ETag']
+    response = client.get(css_url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['Cache-Control'] == IMMUTABLE
+
+
+@pytest.mark.config(ASSETS_ACCEL_REDIRECT='/_static/')
+def test_accel_redirect(client, css_url):
+    response = client.get(css_url)
+    assert response.headers['X-Accel-Redirect'] == '/_static/main.css'
+    assert response.data == b''
@@ -0,0 +1,79 @@
+"""
+This module tests the availability index of the registration page: taken
+names are found in the db, free ones are answered without a query, and a
+rebuild picks up the users of other processes without holding the lock.
+"""
+
+import time
+
+import pytest
+
+from tests.conftest import add_user
+from tests.test_user_cache import count_queries
+from yahtzee import db
+from yahtzee.models import User
+from yahtzee.users import availability
+from yahtzee.users.availability import available, get_availability_index
+
+
+def insert_user(username):
+    # as another process would, unseen by the events of this session
+    with db.engine.begin() as connection:
+        connection.execute(User.__table__.insert().values(
+            username=username, email=f'{username}@test.com',
+            password='x', first_name='Other', last_name='Process'))
+
+
+def test_taken_names(client):
+    add_user('pmacking')
+    response = client.get('/register/available', query_string={
+        'username': 'pmacking', 'email': 'tayadawne@test.com'})
+    assert response.get_json() == {'username': False, 'email': True}
+
+    # committed after the filter was built
+    add_user('tayadawne')
+    assert available(email='tayadawne@test.com') == {'email': False}
+
+
+def test_free_name_skips_query(app):
+    add_user('pmacking')
+    get_availability_index().might_hold('username', 'pmacking')
+
+    statements, stop = count_queries()
+    try:
+        assert available('tayadawne', 'tayadawne@test.com') == \
+            {'username': True, 'email': True}
+    finally:
+        stop()
+    assert statements == []
+
+
+@pytest.mark.config(AVAILABILITY_REFRESH=60)
+def test_refresh_finds_other_processes(app, monkeypatch):
+    assert available('tayadawne') == {'username': True}
+    insert_user('tayadawne')
+    assert available('tayadawne') == {'username': True}
+
+    now = time.monotonic()
+    monkeypatch.setattr(availability.time, 'monotonic', lambda: now + 61)
+    assert available('tayadawne') == {'username': False}
+
+
+def test_rebuild_outside_lock(app, monkeypatch):
+    index = get_availability_index()
+    build = index._build
+    answers = []
+
+    def slow_build():
+        bloom = build()
+        # another request, while the first filter is built
+        answers.append(index.might_hold('username', 'tayadawne'))
+        index.add([('tayadawne', 'tayadawne@test.com')])
+        return bloom
+
+    monkeypatch.setattr(index, '_build', slow_build)
+    assert not index.might_hold('username', 'pmacking')
+    assert answers == [True]
+
+    # the name added meanwhile made it into the new filter
+    assert index.might_hold('email', 'tayadawne@test.com')
@@ -0,0 +1,75 @@
+"""
+This module tests conditional GETs: a client holding the current page or
+user gets a 304, from its ETag or its Last-Modified time, and a 200 once a
+user changed.
+"""
+
+from datetime import timedelta
+
+from werkzeug.http import http_date, parse_date
+
+from tests.conftest import add_user, login
+
+API = '/api/v1'
+
+
+def test_home_not_modified(client):
+    add_user('pmacking')
+    response = client.get('/')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+
+    # another viewer gets a page of their own
+    login(client, 'pmacking')
+    assert client.get('/', headers={'If-None-Match': etag}) \
+        .status_code == 200
+
+
+def test_home_changes_with_users(client):
+    add_user('pmacking')
+    etag = client.get('/').headers['ETag']
+
+    add_user('tayadawne')
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'tayadawne' in response.data
+    assert response.headers['ETag'] != etag
+
+
+def test_if_modified_since(client):
+    user_id = add_user('pmacking')
+    url = f'{API}/users/{user_id}'
+    last_modified = client.get(url).headers['Last-Modified']
+
+    response = client.get(url, headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+
+    earlier = http_date(parse_date(last_modified) - timedelta(seconds=1))
+    response = client.get(url, headers={'If-Modified-Since': earlier})
+    assert response.status_code == 200
+
+    # If-None-Match wins over If-Modified-Since
+    response = client.get(url, headers={'If-Modified-Since': last_modified,
+                                        'If-None-Match': '"0"'})
+    assert response.status_code == 200
+
+
+def test_user_change_not_fresh(client):
+    user_id = add_user('pmacking')
+    url = f'{API}/users/{user_id}'
+    user_etag = client.get(url).headers['ETag']
+    page_etag = client.get(f'{API}/users').headers['ETag']
+
+    client.put(url, json={'first_name': 'Paul'})
+    response = client.get(url, headers={'If-None-Match': user_etag})
+    assert response.status_code == 200
+    assert response.get_json()['first_name'] == 'Paul'
+    response = client.get(f'{API}/users',
+                          headers={'If-None-Match': page_etag})
+    assert response.status_code == 200
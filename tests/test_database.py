@@ -0,0 +1,58 @@
+"""
+This module tests the engine profile: the pragmas every new SQLite
+connection runs, and the UPDATE ... RETURNING of versioned score entries.
+"""
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from tests.conftest import add_scorecard, add_user
+from tests.test_user_cache import count_queries
+from yahtzee import db, models
+from yahtzee.models import Game, UsersGames
+
+
+def test_pragmas_of_new_connection(app):
+    connection = db.engine.connect()
+    try:
+        def pragma(name):
+            return connection.execute(f'PRAGMA {name}').scalar()
+
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('foreign_keys') == 1
+        assert pragma('busy_timeout') == 5000
+        assert pragma('synchronous') == 1
+    finally:
+        connection.close()
+
+
+def test_foreign_keys_enforced(app):
+    db.session.add(Game())
+    db.session.flush()
+    db.session.add(UsersGames(user_id=1, game_id=1))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+
+@pytest.mark.parametrize('returning', [True, False])
+def test_score_entry_returning(app, monkeypatch, returning):
+    card_id = add_scorecard(add_user('pmacking'))
+    monkeypatch.setattr(models, 'supports_returning',
+                        lambda dialect: returning)
+
+    statements, stop = count_queries()
+    try:
+        row = UsersGames.set_score(card_id, 'chance', 17, versions=[1])
+    finally:
+        stop()
+    assert row['chance'] == 17
+    assert row['grand_total_score'] == 17
+    assert row['version_id'] == 2
+
+    updates = [statement for statement in statements
+               if statement.startswith('UPDATE users_games')]
+    assert len(updates) == 1
+    assert ('RETURNING' in updates[0]) == returning
+    # RETURNING saves the query reading the scores back
+    assert len(statements) == (1 if returning else 2)
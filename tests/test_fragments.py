@@ -0,0 +1,62 @@
+"""
+This module tests the fragment cache of templates: a fragment is rendered
+once per key, a new version of its data starts a new entry, and each app
+keeps its own fragments.
+"""
+
+from flask import render_template_string
+
+from tests.conftest import add_user, make_app
+from yahtzee.fragments import get_fragment_cache
+
+TEMPLATE = "{% cache 'users', version %}{{ render() }}{% endcache %}"
+
+
+def renderer(output):
+    calls = []
+
+    def render():
+        calls.append(output)
+        return output
+    return render, calls
+
+
+def test_fragment_reused(app):
+    render, calls = renderer('users')
+    for _ in range(2):
+        assert render_template_string(TEMPLATE, render=render,
+                                      version=1) == 'users'
+    assert calls == ['users']
+
+    # data without a version is never cached
+    for _ in range(2):
+        render_template_string(TEMPLATE, render=render, version=None)
+    assert len(calls) == 3
+
+
+def test_version_bump_renders_again(client):
+    add_user('pmacking')
+    assert b'pmacking' in client.get('/').data
+    assert len(get_fragment_cache()) == 1
+
+    # the user table moved on, the old entry is not served
+    add_user('tayadawne')
+    page = client.get('/').data
+    assert b'pmacking' in page and b'tayadawne' in page
+    assert len(get_fragment_cache()) == 2
+
+
+def test_apps_keep_own_fragments(app, tmp_path):
+    render, calls = renderer('users')
+    render_template_string(TEMPLATE, render=render, version=1)
+
+    (tmp_path / 'other').mkdir()
+    other = make_app(tmp_path / 'other')
+    try:
+        with other.app_context():
+            render_template_string(TEMPLATE, render=render, version=1)
+            assert len(get_fragment_cache()) == 1
+    finally:
+        other.extensions['log_pipeline'].stop()
+    assert len(calls) == 2
+    assert len(get_fragment_cache()) == 1
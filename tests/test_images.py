@@ -0,0 +1,151 @@
+"""
+This module tests rendering, reusing and deleting the files of profile
+pictures.
+"""
+
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image, ImageOps
+
+from tests.conftest import add_user
+from yahtzee import db
+from yahtzee.models import User
+from yahtzee.users import images, utils
+from yahtzee.users.images import avatar_filename, render_avatar
+
+DIGEST = '0123456789abcdef'
+
+
+@pytest.fixture
+def pictures(app, tmp_path, monkeypatch):
+    directory = tmp_path / 'profile_pics'
+    directory.mkdir()
+    monkeypatch.setattr(utils, '_profile_pics_dir', lambda: str(directory))
+    return directory
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """
+    Render on threads rather than processes, recording the digest of every
+    upload rendered.
+    """
+    rendered = []
+
+    def render(data, directory, digest, sizes, webp):
+        rendered.append(digest)
+        render_avatar(data, directory, digest, sizes, webp)
+
+    monkeypatch.setattr(images, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(images, 'render_avatar', render)
+    return rendered
+
+
+class Upload(object):
+    def __init__(self, width, height, fmt='PNG'):
+        output = io.BytesIO()
+        Image.new('RGB', (width, height), 'red').save(output, fmt)
+        self._data = output.getvalue()
+
+    def read(self):
+        return self._data
+
+
+def save_files(directory, digest, age):
+    """
+    Save the variants of a picture as if saved age seconds ago.
+    """
+    saved = time.time() - age
+    for size in (32, 64, 125):
+        path = directory / avatar_filename(digest, size)
+        path.write_bytes(b'jpeg')
+        os.utime(path, (saved, saved))
+
+
+def test_unused_picture_is_deleted(app, pictures):
+    save_files(pictures, DIGEST, app.config['AVATAR_REUSE_GRACE'] + 1)
+    assert utils.delete_unused_picture(DIGEST)
+    assert not os.listdir(pictures)
+
+
+def test_referenced_picture_is_kept(app, pictures):
+    save_files(pictures, DIGEST, app.config['AVATAR_REUSE_GRACE'] + 1)
+    user = User.query.get(add_user('pmacking'))
+    user.image_file = DIGEST
+    db.session.commit()
+
+    assert not utils.delete_unused_picture(DIGEST)
+    assert len(os.listdir(pictures)) == 3
+
+
+def test_reused_picture_is_kept_until_committed(app, pictures, monkeypatch):
+    save_files(pictures, DIGEST, app.config['AVATAR_REUSE_GRACE'] + 1)
+
+    # an upload of the same bytes reuses the files, and has not committed
+    # when the user replacing that picture deletes it
+    class Upload(object):
+        def read(self):
+            return b'same bytes'
+
+    monkeypatch.setattr(utils, 'content_digest', lambda data: DIGEST)
+    assert utils.save_picture(Upload()) == DIGEST
+    assert not utils.delete_unused_picture(DIGEST)
+    assert len(os.listdir(pictures)) == 3
+
+
+def test_default_picture_is_kept(app, pictures):
+    (pictures / 'default.jpg').write_bytes(b'jpeg')
+    assert not utils.delete_unused_picture('default.jpg')
+    assert os.listdir(pictures) == ['default.jpg']
+
+
+def test_sizes_keep_aspect_ratio(tmp_path):
+    render_avatar(Upload(400, 200).read(), str(tmp_path), DIGEST,
+                  (32, 64, 125), False)
+    for size in (32, 64, 125):
+        with Image.open(tmp_path / avatar_filename(DIGEST, size)) as image:
+            assert image.format == 'JPEG'
+            assert image.width == size
+            assert abs(image.width / image.height - 2) < 0.1
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_large_jpeg_decoded_in_draft(tmp_path, monkeypatch):
+    decoded = []
+
+    def exif_transpose(image):
+        decoded.append(image.size)
+        return image
+
+    monkeypatch.setattr(ImageOps, 'exif_transpose', exif_transpose)
+    render_avatar(Upload(2000, 1000, 'JPEG').read(), str(tmp_path), DIGEST,
+                  (32, 64, 125), False)
+    # scaled by 1/8 while decoding, still larger than the largest size
+    assert decoded == [(250, 125)]
+
+
+def test_same_upload_rendered_once(app, pictures, renders):
+    upload = Upload(400, 200)
+    digest = utils.save_picture(upload)
+    files = sorted(os.listdir(pictures))
+    assert len(files) == 3
+
+    assert utils.save_picture(upload) == digest
+    assert renders == [digest]
+    assert sorted(os.listdir(pictures)) == files
+
+    utils.save_picture(Upload(200, 400))
+    assert len(renders) == 2
+    assert len(os.listdir(pictures)) == 6
+
+
+@pytest.mark.config(AVATAR_WEBP=True)
+def test_webp_skipped_without_support(app, pictures, renders, monkeypatch):
+    monkeypatch.setattr(images.features, 'check',
+                        lambda feature: feature != 'webp')
+    utils.save_picture(Upload(400, 200))
+    assert all(name.endswith('.jpg') for name in os.listdir(pictures))
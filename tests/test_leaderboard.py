@@ -0,0 +1,108 @@
+"""
+This module tests keeping the leaderboard stats as games are finished and
+users deleted.
+"""
+
+import time
+
+from tests.conftest import add_scorecard, add_user
+from yahtzee import db, leaderboard
+from yahtzee.models import BestScoreCount, UserStats, UsersGames
+
+API = '/api/v1'
+
+
+def finished_game(client, username, chance):
+    """
+    Add a user who finished a game scoring only chance.
+
+    :return: id of the user
+    """
+    user_id = add_user(username)
+    play(client, user_id, chance)
+    return user_id
+
+
+def play(client, user_id, chance):
+    url = f'{API}/users_games/{add_scorecard(user_id)}'
+    client.put(f'{url}/chance', json={'score': chance})
+    assert client.post(f'{url}/finish').status_code == 200
+
+
+def best_score_counts():
+    return {row.best_score: row.users for row in BestScoreCount.query
+            if row.users}
+
+
+def test_finish_updates_stats(client):
+    user_id = finished_game(client, 'pmacking', 20)
+    play(client, user_id, 25)
+    play(client, user_id, 10)
+
+    stats = UserStats.query.get(user_id)
+    assert (stats.games_played, stats.best_score, stats.total_score) == \
+        (3, 25, 55)
+    assert best_score_counts() == {25: 1}
+
+
+def test_concurrent_first_finish(client, monkeypatch):
+    user_id = finished_game(client, 'pmacking', 20)
+
+    # another request finished the first game of the user after this one
+    # found no stats for them
+    lookups = []
+    best_score = leaderboard._best_score
+
+    def stale_best_score(user_id):
+        lookups.append(user_id)
+        return None if len(lookups) == 1 else best_score(user_id)
+
+    monkeypatch.setattr(leaderboard, '_best_score', stale_best_score)
+    play(client, user_id, 25)
+
+    stats = UserStats.query.get(user_id)
+    assert (stats.games_played, stats.best_score) == (2, 25)
+    assert best_score_counts() == {25: 1}
+
+
+def test_concurrent_best_score_count(app):
+    # the first user with a best score counted by another request
+    db.session.execute(BestScoreCount.__table__.insert().values(
+        best_score=30, users=1))
+    leaderboard._count_best_score(30, 1)
+    db.session.commit()
+    assert best_score_counts() == {30: 2}
+
+
+def test_delete_removes_user_from_leaderboard(client):
+    first = finished_game(client, 'pmacking', 25)
+    second = finished_game(client, 'tayadawne', 20)
+    assert client.get(f'{API}/leaderboard/{second}').get_json()['rank'] == 2
+
+    assert client.delete(f'{API}/users/{first}').status_code == 200
+    assert UserStats.query.get(first) is None
+    assert UsersGames.query.filter_by(user_id=first).count() == 0
+    assert best_score_counts() == {20: 1}
+
+    # ranked by the tree of this process, without reloading it
+    assert client.get(f'{API}/leaderboard/{second}').get_json()['rank'] == 1
+    assert client.get(f'{API}/leaderboard/{first}').status_code == 404
+
+
+def test_reload_before_record_not_counted_twice(client, monkeypatch):
+    finished_game(client, 'pmacking', 20)
+    board = leaderboard.get_leaderboard()
+    assert board.rank(0) == 2
+
+    card_id = add_scorecard(add_user('tayadawne'))
+    generation = board.generation()
+    old_best, new_best = leaderboard.finish_game(card_id)
+    db.session.commit()
+
+    # another request reloads the tree between the commit and the record
+    now = time.monotonic() + client.application.config['LEADERBOARD_REFRESH']
+    monkeypatch.setattr(leaderboard.time, 'monotonic', lambda: now + 1)
+    assert board.rank(0) == 2
+    board.record(old_best, new_best, generation)
+    assert board.rank(0) == 2
+    assert board.rank(20) == 1
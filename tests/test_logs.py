@@ -0,0 +1,71 @@
+"""
+This module tests the log pipeline: records are dropped and counted when its
+queue is full, sampling keeps every warning, and the log file rotates at the
+configured size.
+"""
+
+import json
+import logging
+
+import pytest
+
+from yahtzee.logs import (BatchFileHandler, JsonFormatter, LogPipeline,
+                          QueueHandler, SamplingFilter)
+
+
+def record(level=logging.INFO, event='user_created'):
+    return logging.makeLogRecord({
+        'name': 'yahtzee.users', 'levelno': level,
+        'levelname': logging.getLevelName(level), 'msg': 'Event',
+        'event': event,
+    })
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_full_queue_drops_records(tmp_path):
+    handler = BatchFileHandler(str(tmp_path / 'users.log'), delay=True)
+    handler.setFormatter(JsonFormatter())
+    pipeline = LogPipeline(handler, queue_size=2, batch_size=10)
+    queue_handler = QueueHandler(pipeline)
+
+    # nothing takes records off the queue until the listener starts
+    for _ in range(5):
+        queue_handler.handle(record())
+    assert pipeline.queue.qsize() == 2
+    assert pipeline.dropped == 3
+
+    pipeline.start()
+    pipeline.stop()
+    lines = read_lines(tmp_path / 'users.log')
+    assert [line['event'] for line in lines] == \
+        ['user_created'] * 2 + ['log_events_dropped']
+    assert lines[-1]['count'] == 3
+
+
+def test_sampling_keeps_warnings():
+    sampling = SamplingFilter({'user_logged_in': 0})
+    assert not sampling.filter(record(event='user_logged_in'))
+    assert sampling.filter(record(event='user_created'))
+    for level in (logging.WARNING, logging.ERROR, logging.CRITICAL):
+        assert sampling.filter(record(level, 'user_logged_in'))
+
+
+# batches of a few records, each fits in a file
+@pytest.mark.config(USERS_LOG_MAX_BYTES=1000, USERS_LOG_BACKUPS=2,
+                    LOG_BATCH_SIZE=4)
+def test_log_file_rotates(app, tmp_path):
+    logger = logging.getLogger('yahtzee.users')
+    for i in range(50):
+        logger.info('User created', extra={'event': 'user_created',
+                                           'user_id': i})
+    app.extensions['log_pipeline'].stop()
+
+    files = [tmp_path / name
+             for name in ('users.log', 'users.log.1', 'users.log.2')]
+    assert all(path.stat().st_size <= 1000 for path in files)
+    assert not (tmp_path / 'users.log.3').exists()
+    # the newest records are in the current file
+    assert read_lines(files[0])[-1]['user_id'] == 49
@@ -0,0 +1,51 @@
+"""
+This module tests who is served the metrics of a worker.
+"""
+
+import pytest
+
+from config import ProductionConfig
+
+
+def test_metrics_off_by_default(client):
+    assert client.get('/metrics').status_code == 404
+
+
+@pytest.mark.config(METRICS_ENABLED=True)
+def test_metrics_without_token(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+
+
+@pytest.mark.config(METRICS_ENABLED=True, METRICS_TOKEN='secret')
+def test_metrics_need_token(client):
+    assert client.get('/metrics').status_code == 403
+    response = client.get('/metrics',
+                          headers={'Authorization': 'Bearer wrong'})
+    assert response.status_code == 403
+    response = client.get('/metrics',
+                          headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+
+
+@pytest.mark.config(METRICS_ENABLED=True, METRICS_REQUIRE_TOKEN=True)
+def test_metrics_refused_without_token_set(client):
+    assert client.get('/metrics').status_code == 404
+
+
+def test_production_requires_token():
+    assert ProductionConfig.METRICS_REQUIRE_TOKEN
+
+
+@pytest.mark.config(METRICS_ENABLED=True)
+def test_profiles_refused_without_token_set(client):
+    assert client.get('/metrics/profiles').status_code == 404
+
+
+@pytest.mark.config(METRICS_ENABLED=True, METRICS_TOKEN='secret')
+def test_profiles_need_token(client):
+    assert client.get('/metrics/profiles').status_code == 403
+    response = client.get('/metrics/profiles',
+                          headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
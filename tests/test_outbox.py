@@ -0,0 +1,159 @@
+"""
+This module tests the delivery of the outbox, over a fake SMTP connection.
+"""
+
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+
+from tests.conftest import add_user
+from yahtzee import db, mail
+from yahtzee.models import OutboxMessage
+from yahtzee.outbox import claim_batch, drain_outbox, queue_message
+
+
+class FakeConnection(object):
+    """
+    Stands in for the SMTP connection of Flask-Mail, recording the messages
+    sent, refusing the recipients in refused and failing on those in broken
+    with an error of no SMTP kind.
+    """
+    def __init__(self, refused=(), down=False):
+        self.sent = []
+        self.refused = set(refused)
+        self.broken = set()
+        self.down = down
+
+    def __enter__(self):
+        if self.down:
+            raise ConnectionRefusedError('SMTP server down')
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def send(self, message):
+        recipient, = message.recipients
+        if recipient in self.refused:
+            raise smtplib.SMTPRecipientsRefused({recipient: (550, b'No')})
+        if recipient in self.broken:
+            raise UnicodeEncodeError('ascii', recipient, 0, 1, 'No')
+        self.sent.append(recipient)
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    connection = FakeConnection()
+    monkeypatch.setattr(mail, 'connect', lambda: connection)
+    return connection
+
+
+def queue(*recipients):
+    for recipient in recipients:
+        queue_message('Password Reset Request', recipient, 'Reset it.')
+    db.session.commit()
+
+
+def statuses():
+    return {message.recipient: message.status
+            for message in OutboxMessage.query}
+
+
+def test_drain_sends_due_messages(app, smtp):
+    queue('a@test.com', 'b@test.com')
+    assert drain_outbox() == 2
+    assert smtp.sent == ['a@test.com', 'b@test.com']
+    assert set(statuses().values()) == {OutboxMessage.SENT}
+    assert drain_outbox() == 0
+
+
+def test_claimed_messages_are_not_sent_twice(app, smtp):
+    queue('a@test.com', 'b@test.com')
+    now = datetime.utcnow()
+
+    # another worker claimed the batch and has not sent it yet
+    claimed = claim_batch(10, now)
+    assert len(claimed) == 2
+    assert drain_outbox() == 0
+    assert smtp.sent == []
+
+    # its lease ran out, e.g. it died, the messages are due again
+    later = now + timedelta(seconds=app.config['MAIL_OUTBOX_LEASE'] + 1)
+    assert len(claim_batch(10, later)) == 2
+
+
+def test_refused_recipient_is_retried_with_backoff(app, smtp):
+    smtp.refused.add('b@test.com')
+    queue('a@test.com', 'b@test.com')
+    started = datetime.utcnow()
+
+    assert drain_outbox() == 1
+    message = OutboxMessage.query.filter_by(recipient='b@test.com').one()
+    assert message.status == OutboxMessage.PENDING
+    assert message.attempts == 1
+    assert message.next_attempt_at >= started + timedelta(
+        seconds=app.config['MAIL_OUTBOX_BACKOFF'])
+    assert drain_outbox() == 0
+
+
+def test_failed_after_max_attempts(app, smtp):
+    app.config['MAIL_OUTBOX_MAX_ATTEMPTS'] = 2
+    app.config['MAIL_OUTBOX_BACKOFF'] = 0
+    smtp.refused.add('a@test.com')
+    queue('a@test.com')
+
+    drain_outbox()
+    drain_outbox()
+    assert statuses() == {'a@test.com': OutboxMessage.FAILED}
+
+
+def test_always_failing_message_gives_up(app, smtp):
+    app.config['MAIL_OUTBOX_MAX_ATTEMPTS'] = 3
+    app.config['MAIL_OUTBOX_BACKOFF'] = 0
+    smtp.broken.add('a@test.com')
+    queue('a@test.com', 'b@test.com')
+
+    # the message fails alone, the rest of the batch is sent
+    assert drain_outbox() == 1
+    assert smtp.sent == ['b@test.com']
+    for _ in range(3):
+        drain_outbox()
+    message = OutboxMessage.query.filter_by(recipient='a@test.com').one()
+    assert message.status == OutboxMessage.FAILED
+    assert message.attempts == 3
+    assert 'ascii' in message.last_error
+
+
+def test_attempt_counted_when_drain_dies(app, smtp):
+    app.config['MAIL_OUTBOX_MAX_ATTEMPTS'] = 2
+    app.config['MAIL_OUTBOX_LEASE'] = 0
+    queue('a@test.com')
+    now = datetime.utcnow()
+
+    # drains claiming the message and dying before sending it
+    for _ in range(2):
+        assert len(claim_batch(10, now)) == 1
+    assert OutboxMessage.query.one().attempts == 2
+
+    assert drain_outbox() == 0
+    assert smtp.sent == []
+    assert statuses() == {'a@test.com': OutboxMessage.FAILED}
+
+
+def test_connection_failure_reschedules_batch(app, monkeypatch):
+    monkeypatch.setattr(mail, 'connect', lambda: FakeConnection(down=True))
+    queue('a@test.com', 'b@test.com')
+
+    assert drain_outbox() == 0
+    messages = OutboxMessage.query.all()
+    assert [message.attempts for message in messages] == [1, 1]
+    assert set(statuses().values()) == {OutboxMessage.PENDING}
+
+
+def test_reset_request_queues_email(app, client, smtp):
+    add_user('pmacking')
+    client.post('/reset_password', data={'email': 'pmacking@test.com'})
+    assert statuses() == {'pmacking@test.com': OutboxMessage.PENDING}
+    assert drain_outbox() == 1
+    assert smtp.sent == ['pmacking@test.com']
@@ -0,0 +1,44 @@
+"""
+This module tests the request profiler: the query budgets of endpoints and
+what a profile keeps of the request it captured.
+"""
+
+import logging
+
+import pytest
+
+from tests.conftest import add_user
+from yahtzee.metrics.profiler import (
+    PROFILE_HEADER,
+    QueryBudgetExceeded,
+    recent_profiles,
+)
+
+
+def test_request_within_budget(client, query_budgets):
+    query_budgets({'main.about': 0})
+    assert client.get('/about').status_code == 200
+
+
+def test_request_over_budget_fails(client, query_budgets):
+    add_user('pmacking')
+    query_budgets({'main.home': 1})
+    with pytest.raises(QueryBudgetExceeded, match='main.home ran'):
+        client.get('/')
+
+
+@pytest.mark.config(PROFILER_FAIL_ON_BUDGET=False)
+def test_request_over_budget_logged(client, query_budgets, caplog):
+    add_user('pmacking')
+    query_budgets({'main.home': 1})
+    with caplog.at_level(logging.WARNING):
+        assert client.get('/').status_code == 200
+    assert 'over its budget of 1' in caplog.text
+
+
+def test_profile_keeps_url_rule(client):
+    client.get('/reset_password/secret-token?next=/account',
+               headers={PROFILE_HEADER: '1'})
+    profile = recent_profiles()[-1]
+    assert profile.path == '/reset_password/<token>'
+    assert 'secret-token' not in str(profile.report(threshold=3))
@@ -0,0 +1,258 @@
+"""
+This module guards against query plan regressions. Each scenario drives the
+routes and handlers of the app against a seeded scratch db, and every
+statement it issues is run through EXPLAIN QUERY PLAN: a scan of a whole
+table, an index scan without a LIMIT or a sort in a temporary b-tree fails
+the test. Requests are profiled too, so a request running the same SQL
+PROFILER_REPEAT_THRESHOLD times (an N+1) fails, and one running more queries
+than its QUERY_BUDGETS entry raises QueryBudgetExceeded.
+"""
+
+import pytest
+from sqlalchemy import event
+
+from tests.conftest import add_scorecard, add_user, login
+from yahtzee import db
+from yahtzee.leaderboard import get_leaderboard
+from yahtzee.metrics.profiler import PROFILE_HEADER, recent_profiles
+from yahtzee.models import Game, User, UsersGames
+from yahtzee.outbox import drain_outbox
+from yahtzee.pagination import NEXT, PREV, encode_cursor
+from yahtzee.users.availability import get_availability_index
+from yahtzee.users.utils import delete_unused_picture
+
+API = '/api/v1'
+
+
+def seed():
+    """
+    Add two users playing one game for the scenarios to work on.
+    """
+    game_id = None
+    for username in ('pmacking', 'tayadawne'):
+        card_id = add_scorecard(add_user(username), game_id)
+        game_id = UsersGames.query.get(card_id).game_id
+
+
+def expect(status, response):
+    """
+    Fail a scenario whose request did not get the status it exercises, a
+    refused request would not run the queries it is meant to check.
+    """
+    assert response.status_code == status, response.get_data(as_text=True)
+    return response
+
+
+def home_pages(client):
+    expect(200, client.get('/'))
+    expect(200, client.get(
+        '/?cursor=' + encode_cursor(NEXT, ('Maclachlan', 1))))
+    expect(200, client.get(
+        '/?cursor=' + encode_cursor(PREV, ('Maclachlan', 2))))
+
+
+def api_pages(client):
+    expect(200, client.get(f'{API}/users'))
+    expect(200, client.get(f'{API}/users', query_string={
+        'cursor': encode_cursor(NEXT, ('Maclachlan', 1)), 'limit': 1}))
+    expect(200, client.get(f'{API}/users', query_string={
+        'cursor': encode_cursor(PREV, ('Maclachlan', 2)), 'limit': 1}))
+
+
+def api_fieldsets(client):
+    expect(200, client.get(f'{API}/users', query_string={
+        'fields': 'username,users_games.grand_total_score'}))
+    expect(200, client.get(f'{API}/users/1', query_string={
+        'fields': 'last_name,users_games'}))
+
+
+def game(client):
+    expect(200, client.get(f'{API}/games/1'))
+
+
+def batch_create(client):
+    response = expect(200, client.post(
+        f'{API}/users:batch', query_string={'on_conflict': 'update'},
+        json=[{'username': username, 'email': f'{username}@batch.com',
+               'first_name': 'Batch', 'last_name': 'User'}
+              for username in ('pmacking', 'batch1', 'batch2')]))
+    assert [result['status'] for result in response.get_json()['results']] \
+        == ['updated', 'created', 'created']
+
+
+def register(client):
+    expect(302, client.post('/register', data={
+        'username': 'newuser',
+        'email': 'newuser@test.com',
+        'first_name': 'New',
+        'last_name': 'User',
+        'password': 'abc123',
+        'confirm_password': 'abc123',
+    }))
+
+
+def availability_index(client):
+    assert get_availability_index().might_hold('username', 'pmacking')
+
+
+def availability(client):
+    for name, free in (('pmacking', False), ('nobody', True)):
+        response = expect(200, client.get('/register/available', query_string={
+            'username': name, 'email': f'{name}@test.com'}))
+        assert response.get_json() == {'username': free, 'email': free}
+
+
+def account(client):
+    expect(302, login(client, 'pmacking'))
+    expect(200, client.get('/account'))
+    expect(302, client.post('/account', data={
+        'username': 'pmacking2',
+        'email': 'pmacking2@test.com',
+        'first_name': 'Paul',
+        'last_name': 'Maclachlan',
+        'version': '1',
+    }))
+    expect(302, client.get('/logout'))
+
+
+def reset_request(client):
+    expect(302, client.post('/reset_password',
+                            data={'email': 'tayadawne@test.com'}))
+
+
+def outbox(client):
+    drain_outbox()
+
+
+def avatar_gc(client):
+    assert delete_unused_picture('0123456789abcdef')
+
+
+def relationships(client):
+    user = User.query.get(1)
+    list(user.users_games)
+    list(Game.query.get(1).users_games)
+    UsersGames.best_for_user(user.id)
+    db.session.rollback()
+
+
+def score_and_finish(client):
+    expect(200, client.put(f'{API}/users_games/1/sixes',
+                           json={'dice': [6, 6, 6, 1, 2]}))
+    expect(200, client.put(f'{API}/users_games/1/chance',
+                           json={'score': 17}))
+    expect(200, client.post(f'{API}/users_games/1/finish'))
+    expect(200, client.post(f'{API}/users_games/2/finish'))
+
+
+def rank_tree(client):
+    get_leaderboard().rank(0)
+
+
+def finished_games(client):
+    # finish both games, and load the rank tree as a worker would have
+    score_and_finish(client)
+    rank_tree(client)
+
+
+def leaderboard(client):
+    expect(200, client.get(f'{API}/leaderboard'))
+    expect(200, client.get(f'{API}/leaderboard/1'))
+    expect(200, client.get(f'{API}/leaderboard/2/around'))
+
+
+def export(client):
+    for table in ('users', 'users_games'):
+        expect(200, client.get(f'{API}/export/{table}.ndjson'))
+
+
+# (scenario, run before it uncaptured or None, whether it may scan a whole
+# table on purpose)
+SCENARIOS = [
+    (home_pages, None, False),
+    (api_pages, None, False),
+    (api_fieldsets, None, False),
+    (game, None, False),
+    (register, None, False),
+    (availability_index, None, True),
+    (availability, availability_index, False),
+    (account, None, False),
+    (reset_request, None, False),
+    (outbox, reset_request, False),
+    (avatar_gc, None, False),
+    (relationships, None, False),
+    (batch_create, None, False),
+    (score_and_finish, None, False),
+    (rank_tree, None, True),
+    (leaderboard, finished_games, False),
+    (export, None, True),
+]
+
+
+def plan_problems(connection, statement, parameters, tables):
+    """
+    Explain statement and return the plan lines that scan or sort a table.
+    An index scan is only accepted when a LIMIT stops it early.
+    """
+    limited = 'LIMIT' in statement.upper()
+    cursor = connection.cursor()
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    problems = []
+    for row in cursor.fetchall():
+        detail = row[-1]
+        words = detail.split()
+        if words[0] == 'SCAN':
+            name = words[2] if words[1] == 'TABLE' else words[1]
+            if name in tables and not ('USING' in words and limited):
+                problems.append(detail)
+        elif detail.startswith('USE TEMP B-TREE'):
+            problems.append(detail)
+    cursor.close()
+    return problems
+
+
+@pytest.mark.parametrize('scenario, setup, full_scan_ok', SCENARIOS,
+                         ids=[scenario.__name__ for scenario, _, _
+                              in SCENARIOS])
+def test_query_plans(app, client, scenario, setup, full_scan_ok):
+    seed()
+    if setup is not None:
+        setup(client)
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and not statement.lstrip().upper() \
+                .startswith(('INSERT', 'PRAGMA')):
+            captured.append((statement, parameters))
+
+    # the X-Profile header on every request of the client
+    header = 'HTTP_' + PROFILE_HEADER.upper().replace('-', '_')
+    client.environ_base[header] = '1'
+    profiled = {profile.id for profile in recent_profiles()}
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        scenario(client)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    assert captured
+
+    threshold = app.config['PROFILER_REPEAT_THRESHOLD']
+    repeated = [(profile.path, ' '.join(statement.split()), times)
+                for profile in recent_profiles()
+                if profile.id not in profiled
+                for statement, times in profile.repeated(threshold)]
+    assert not repeated
+
+    if full_scan_ok:
+        return
+    tables = set(db.metadata.tables)
+    problems = []
+    connection = db.engine.raw_connection()
+    try:
+        for statement, parameters in captured:
+            details = plan_problems(connection, statement, parameters, tables)
+            if details:
+                problems.append((' '.join(statement.split()), details))
+    finally:
+        connection.close()
+    assert not problems
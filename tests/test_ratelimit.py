@@ -0,0 +1,119 @@
+"""
+This module tests the rate limits of logins and password reset requests,
+behind a proxy.
+"""
+
+import pytest
+
+from tests.conftest import add_user, make_app
+from yahtzee.models import OutboxMessage
+from yahtzee.users import routes
+
+LIMITS = {'ip': (3, 60), 'account_ip': (3, 300), 'account': (5, 300)}
+
+
+def attempt(client, address, password='wrong'):
+    return client.post('/login', data={'email': 'pmacking@test.com',
+                                       'password': password},
+                       headers={'X-Forwarded-For': address})
+
+
+@pytest.fixture
+def limited(app):
+    app.config['RATELIMIT_LOGIN'] = LIMITS
+    add_user('pmacking')
+
+
+@pytest.mark.config(PROXY_FIX_X_FOR=1)
+def test_clients_behind_proxy_have_own_buckets(app, client):
+    app.config['RATELIMIT_LOGIN'] = {'ip': (3, 60)}
+    add_user('pmacking')
+
+    # more attempts than one address may make, spread over two
+    statuses = [attempt(client, f'203.0.113.{i}').status_code
+                for i in range(2) for _ in range(3)]
+    assert statuses == [200] * 6
+
+    # one client over its limit leaves the others alone
+    for _ in range(4):
+        response = attempt(client, '203.0.113.9')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert attempt(client, '203.0.113.2').status_code == 200
+
+
+@pytest.mark.config(PROXY_FIX_X_FOR=1)
+def test_account_is_not_locked_out_by_one_client(client, limited):
+    for _ in range(6):
+        response = attempt(client, '198.51.100.7')
+    assert response.status_code == 429
+
+    # the refused attempts did not use up the bucket of the account
+    assert attempt(client, '203.0.113.1', 'abc123').status_code == 302
+
+
+@pytest.mark.config(PROXY_FIX_X_FOR=1)
+def test_account_limited_across_addresses(client, limited):
+    statuses = [attempt(client, f'203.0.113.{i}').status_code
+                for i in range(6)]
+    assert statuses == [200] * 5 + [429]
+
+    # another account is not affected
+    add_user('tayadawne')
+    response = client.post('/login', data={'email': 'tayadawne@test.com',
+                                           'password': 'wrong'},
+                           headers={'X-Forwarded-For': '203.0.113.9'})
+    assert response.status_code == 200
+
+
+def test_forwarded_for_ignored_without_proxy(client, limited):
+    # a client connecting directly cannot pick its address
+    for i in range(4):
+        response = attempt(client, f'203.0.113.{i}')
+    assert response.status_code == 429
+
+
+def test_refused_before_hashing(client, limited, monkeypatch):
+    checked = []
+
+    def check_password_hash(pw_hash, password):
+        checked.append(password)
+        return False
+
+    monkeypatch.setattr(routes, 'check_password_hash', check_password_hash)
+    for _ in range(3):
+        assert attempt(client, '203.0.113.1').status_code == 200
+    assert len(checked) == 3
+
+    assert attempt(client, '203.0.113.1').status_code == 429
+    assert len(checked) == 3
+
+
+@pytest.mark.config(PROXY_FIX_X_FOR=1)
+def test_reset_refused_before_queueing_mail(app, client):
+    app.config['RATELIMIT_RESET_PASSWORD'] = {'account': (2, 3600)}
+    add_user('pmacking')
+
+    statuses = [client.post('/reset_password',
+                            data={'email': 'pmacking@test.com'},
+                            headers={'X-Forwarded-For': f'203.0.113.{i}'}
+                            ).status_code
+                for i in range(3)]
+    assert statuses == [302, 302, 429]
+    assert OutboxMessage.query.count() == 2
+
+
+def test_apps_keep_own_buckets(app, tmp_path):
+    limits = {'ip': (1, 60)}
+    app.config['RATELIMIT_AVAILABILITY'] = limits
+    (tmp_path / 'other').mkdir()
+    other = make_app(tmp_path / 'other', RATELIMIT_AVAILABILITY=limits)
+    try:
+        for flask_app in (app, other):
+            client = flask_app.test_client()
+            statuses = [client.get('/register/available',
+                                   query_string={'username': 'x'}).status_code
+                        for _ in range(2)]
+            assert statuses == [200, 429]
+    finally:
+        other.extensions['log_pipeline'].stop()
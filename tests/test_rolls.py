@@ -0,0 +1,188 @@
+"""
+This module tests the scoring engine: every category of a roll, jokers, the
+totals and bonuses of a scorecard, and the validation of submitted scores.
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from yahtzee.rules import CATEGORIES, SCORECARD_COLUMNS, TOTAL_COLUMNS
+from yahtzee.scoring import (
+    MAX_GRAND_TOTAL,
+    SCORE_OPTIONS,
+    score_of,
+    score_roll,
+    score_rolls,
+    score_totals,
+    valid_scores,
+    validate_scorecards,
+)
+
+# (category, dice, score)
+CATEGORY_SCORES = [
+    ('ones', [1, 1, 2, 3, 1], 3),
+    ('ones', [2, 3, 4, 5, 6], 0),
+    ('twos', [2, 2, 2, 2, 2], 10),
+    ('threes', [3, 1, 3, 6, 6], 6),
+    ('fours', [4, 4, 4, 1, 1], 12),
+    ('fives', [5, 1, 2, 3, 4], 5),
+    ('sixes', [6, 6, 6, 6, 1], 24),
+    ('three_of_a_kind', [3, 3, 3, 5, 6], 20),
+    ('three_of_a_kind', [6, 6, 6, 6, 2], 26),
+    ('three_of_a_kind', [1, 1, 2, 2, 3], 0),
+    ('four_of_a_kind', [2, 2, 2, 2, 6], 14),
+    ('four_of_a_kind', [4, 4, 4, 4, 4], 20),
+    ('four_of_a_kind', [5, 5, 5, 1, 1], 0),
+    ('full_house', [2, 2, 3, 3, 3], 25),
+    ('full_house', [6, 1, 6, 1, 6], 25),
+    ('full_house', [2, 2, 3, 3, 4], 0),
+    ('full_house', [4, 4, 4, 4, 4], 0),
+    ('small_straight', [1, 2, 3, 4, 6], 30),
+    ('small_straight', [3, 4, 5, 6, 6], 30),
+    ('small_straight', [2, 3, 4, 5, 6], 30),
+    ('small_straight', [1, 2, 3, 5, 6], 0),
+    ('large_straight', [1, 2, 3, 4, 5], 40),
+    ('large_straight', [6, 5, 4, 3, 2], 40),
+    ('large_straight', [1, 2, 3, 4, 6], 0),
+    ('yahtzee', [6, 6, 6, 6, 6], 50),
+    ('yahtzee', [6, 6, 6, 6, 5], 0),
+    ('chance', [1, 2, 3, 4, 6], 16),
+    ('chance', [6, 6, 6, 6, 6], 30),
+]
+
+# (category, dice, score) of jokers, yahtzees rolled with the yahtzee box
+# already filled
+JOKER_SCORES = [
+    ('full_house', [3, 3, 3, 3, 3], 25),
+    ('small_straight', [3, 3, 3, 3, 3], 30),
+    ('large_straight', [1, 1, 1, 1, 1], 40),
+    ('three_of_a_kind', [4, 4, 4, 4, 4], 20),
+    ('chance', [2, 2, 2, 2, 2], 10),
+    ('threes', [3, 3, 3, 3, 3], 15),
+    ('full_house', [2, 2, 3, 3, 4], 0),
+    ('large_straight', [1, 2, 3, 4, 6], 0),
+]
+
+
+def card_of(**scores):
+    """
+    Get a scorecard row, SCORECARD_COLUMNS order, 0 unless given.
+    """
+    return [scores.get(column, 0) for column in SCORECARD_COLUMNS]
+
+
+# (scores, totals as a dict of TOTAL_COLUMNS)
+CARD_TOTALS = [
+    ({}, dict(top_score=0, top_bonus_score=0, top_bonus_score_delta=63,
+              total_top_score=0, total_bottom_score=0,
+              grand_total_score=0)),
+    # three of each face is exactly the upper bonus threshold
+    (dict(ones=3, twos=6, threes=9, fours=12, fives=15, sixes=18),
+     dict(top_score=63, top_bonus_score=35, top_bonus_score_delta=0,
+          total_top_score=98, total_bottom_score=0, grand_total_score=98)),
+    (dict(ones=2, twos=6, threes=9, fours=12, fives=15, sixes=18),
+     dict(top_score=62, top_bonus_score=0, top_bonus_score_delta=1,
+          total_top_score=62, total_bottom_score=0, grand_total_score=62)),
+    (dict(sixes=30, fives=25, fours=20, chance=22),
+     dict(top_score=75, top_bonus_score=35, top_bonus_score_delta=0,
+          total_top_score=110, total_bottom_score=22,
+          grand_total_score=132)),
+    (dict(yahtzee=50, yahtzee_bonus=200, full_house=25, large_straight=40),
+     dict(top_score=0, top_bonus_score=0, top_bonus_score_delta=63,
+          total_top_score=0, total_bottom_score=315,
+          grand_total_score=315)),
+]
+
+# (scores, column expected invalid or None)
+CARD_VALIDITY = [
+    (dict(ones=5, sixes=30, chance=5), None),
+    (dict(yahtzee=50, yahtzee_bonus=100), None),
+    (dict(yahtzee=50, yahtzee_bonus=1200), None),
+    (dict(twos=3), 'twos'),
+    (dict(sixes=36), 'sixes'),
+    (dict(three_of_a_kind=4), 'three_of_a_kind'),
+    (dict(chance=31), 'chance'),
+    (dict(full_house=20), 'full_house'),
+    (dict(small_straight=40), 'small_straight'),
+    (dict(yahtzee=25), 'yahtzee'),
+    # bonus yahtzees need a yahtzee, in hundreds up to 12 of them
+    (dict(yahtzee_bonus=100), 'yahtzee_bonus'),
+    (dict(yahtzee=50, yahtzee_bonus=150), 'yahtzee_bonus'),
+    (dict(yahtzee=50, yahtzee_bonus=1300), 'yahtzee_bonus'),
+]
+
+
+@pytest.mark.parametrize('category, dice, score', CATEGORY_SCORES)
+def test_category_scores(category, dice, score):
+    assert score_of(category, dice) == score
+    assert score_roll(dice)[CATEGORIES.index(category)] == score
+
+
+@pytest.mark.parametrize('category, dice, score', JOKER_SCORES)
+def test_joker_scores(category, dice, score):
+    assert score_of(category, dice, joker=True) == score
+    assert score_roll(dice, joker=True)[CATEGORIES.index(category)] == score
+
+
+def test_yahtzee_is_not_a_joker_while_its_box_is_open():
+    assert score_of('full_house', [3, 3, 3, 3, 3]) == 0
+    assert score_of('large_straight', [3, 3, 3, 3, 3]) == 0
+
+
+def test_score_rolls_matches_reference():
+    rolls = np.array(list(itertools.product(range(1, 7), repeat=5)))
+    jokers = np.arange(len(rolls)) % 2 == 0
+
+    scores = score_rolls(rolls, jokers)
+    expected = [score_roll(roll, joker)
+                for roll, joker in zip(rolls.tolist(), jokers.tolist())]
+    assert scores.tolist() == [list(roll) for roll in expected]
+
+
+@pytest.mark.parametrize('dice', [
+    [[1, 2, 3, 4]],
+    [[0, 1, 2, 3, 4]],
+    [[1, 2, 3, 4, 7]],
+])
+def test_invalid_dice(dice):
+    with pytest.raises(ValueError):
+        score_rolls(dice)
+
+
+def test_bonus_is_not_scored_from_dice():
+    with pytest.raises(ValueError):
+        score_of('yahtzee_bonus', [6, 6, 6, 6, 6])
+
+
+@pytest.mark.parametrize('scores, totals', CARD_TOTALS)
+def test_score_totals(scores, totals):
+    derived = score_totals([card_of(**scores)])[0].tolist()
+    assert dict(zip(TOTAL_COLUMNS, derived)) == totals
+
+
+def test_score_totals_in_bulk():
+    cards = [card_of(**scores) for scores, _ in CARD_TOTALS]
+    expected = [[totals[column] for column in TOTAL_COLUMNS]
+                for _, totals in CARD_TOTALS]
+    assert score_totals(cards).tolist() == expected
+    assert validate_scorecards(cards, expected).all()
+
+    expected[1][TOTAL_COLUMNS.index('top_bonus_score')] = 0
+    assert validate_scorecards(cards, expected).tolist() == \
+        [True, False, True, True, True]
+
+
+@pytest.mark.parametrize('scores, invalid', CARD_VALIDITY)
+def test_valid_scores(scores, invalid):
+    valid = valid_scores([card_of(**scores)])[0].tolist()
+    assert [column for column, ok in zip(SCORECARD_COLUMNS, valid)
+            if not ok] == ([invalid] if invalid else [])
+
+
+def test_max_grand_total():
+    best = {column: max(SCORE_OPTIONS[column])
+            for column in SCORECARD_COLUMNS}
+    grand_total = score_totals([card_of(**best)])[0, -1]
+    assert grand_total == MAX_GRAND_TOTAL == 1575
@@ -0,0 +1,51 @@
+"""
+This module tests dumping rows as the Marshmallow schemas dump instances.
+"""
+
+from datetime import datetime
+
+import pytest
+
+from tests.conftest import add_scorecard, add_user
+from yahtzee import db, serializers
+from yahtzee.models import User, UserSchema, UsersGames, UsersGamesSchema
+from yahtzee.serializers import user_rows, users_games_rows
+
+
+def test_rows_dump_as_schema(app):
+    card_id = add_scorecard(add_user('pmacking'))
+    card = UsersGames.query.get(card_id)
+    card.finished_at = datetime(2020, 6, 1, 12, 30)
+    db.session.commit()
+
+    row = users_games_rows.query().one()
+    assert users_games_rows.dump(row) == UsersGamesSchema().dump(card)
+    assert users_games_rows.dump(row)['finished_at'] == '2020-06-01T12:30:00'
+
+    user = User.query.one()
+    assert user_rows.dump_instance(user) == UserSchema().dump(user)
+
+
+def test_extra_columns_are_not_dumped(app):
+    add_user('pmacking')
+    rows = user_rows.only(['username']).query(User.id).all()
+    assert user_rows.only(['username']).dump_many(rows) == \
+        [{'username': 'pmacking'}]
+
+
+def test_only_unknown_field(app):
+    with pytest.raises(ValueError):
+        user_rows.only(['username', 'password'])
+
+
+def test_only_is_cached(app, monkeypatch):
+    monkeypatch.setattr(serializers, 'ONLY_CACHE_SIZE', 2)
+    rows = serializers.RowSerializer(UserSchema)
+
+    username = rows.only(['username'])
+    assert rows.only(['username']) is username
+    assert set(rows.only(['username', 'email']).names) == {'username', 'email'}
+
+    # the oldest subset is dropped beyond the cache size
+    rows.only(['last_name'])
+    assert rows.only(['username']) is not username
@@ -0,0 +1,96 @@
+"""
+This module tests the user cache of a worker: the users of a session are
+loaded without a query, dropped once a commit changes them, and reloaded
+after a write finds the cached user stale.
+"""
+
+from sqlalchemy import event
+
+from tests.conftest import add_user, login
+from yahtzee import db
+from yahtzee.models import User, load_user
+from yahtzee.user_cache import get_user_cache
+
+
+def count_queries():
+    """
+    Count the statements run on the engine of the db until removed.
+
+    :return: (list the statements are appended to, function removing it)
+    """
+    statements = []
+
+    def before_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_execute)
+    return statements, lambda: event.remove(
+        db.engine, 'before_cursor_execute', before_execute)
+
+
+def account_form(version):
+    return {'username': 'pmacking', 'email': 'pmacking@test.com',
+            'first_name': 'Paul', 'last_name': 'Maclachlan',
+            'version': str(version)}
+
+
+def test_cache_hit(app):
+    user_id = add_user('pmacking')
+    db.session.remove()
+    assert load_user(str(user_id)).username == 'pmacking'
+    db.session.remove()
+
+    statements, stop = count_queries()
+    try:
+        assert load_user(str(user_id)).username == 'pmacking'
+    finally:
+        stop()
+    assert statements == []
+
+
+def test_commit_invalidates(app):
+    user_id = add_user('pmacking')
+    load_user(str(user_id))
+    assert get_user_cache().get(user_id)[0] is not None
+
+    User.query.get(user_id).first_name = 'Changed'
+    db.session.commit()
+    assert get_user_cache().get(user_id)[0] is None
+    db.session.remove()
+    assert load_user(str(user_id)).first_name == 'Changed'
+
+
+def test_rollback_keeps_cache(app):
+    user_id = add_user('pmacking')
+    load_user(str(user_id))
+
+    User.query.get(user_id).first_name = 'Changed'
+    db.session.flush()
+    db.session.rollback()
+    assert get_user_cache().get(user_id)[0]['first_name'] == 'Pmacking'
+
+
+def test_stale_write_reloads_user(client):
+    user_id = add_user('pmacking')
+    login(client, 'pmacking')
+    assert client.get('/account').status_code == 200
+
+    # another worker changes the user, its commit leaves our cache alone
+    db.session.execute(User.__table__.update()
+                       .where(User.id == user_id)
+                       .values(first_name='Elsewhere',
+                               version_id=User.version_id + 1))
+    db.session.commit()
+    db.session.remove()
+    assert get_user_cache().get(user_id)[0]['version_id'] == 1
+
+    # the form of the cached version fails once, then the user is reloaded
+    response = client.post('/account', data=account_form(1))
+    assert response.status_code == 302
+    assert get_user_cache().get(user_id)[0] is None
+    assert b'Elsewhere' in client.get('/account').data
+
+    response = client.post('/account', data=account_form(2),
+                           follow_redirects=True)
+    assert b'Account update successful' in response.data
+    assert User.query.get(user_id).first_name == 'Paul'
@@ -0,0 +1,44 @@
+"""
+This module tests the users blueprint: logging in and the password hashes.
+"""
+
+from tests.conftest import PASSWORD, add_user, login
+from yahtzee import bcrypt, db
+from yahtzee.models import User
+from yahtzee.users.hashing import needs_rehash
+
+
+def hash_with_cost(rounds):
+    return bcrypt.generate_password_hash(PASSWORD, rounds).decode('utf-8')
+
+
+def test_needs_rehash(app):
+    app.config['BCRYPT_LOG_ROUNDS'] = 5
+    assert needs_rehash(hash_with_cost(4))
+    assert not needs_rehash(hash_with_cost(5))
+    assert not needs_rehash(hash_with_cost(6))
+    assert needs_rehash('not a bcrypt hash')
+
+
+def test_login_upgrades_weaker_hash(app, client):
+    app.config['BCRYPT_LOG_ROUNDS'] = 5
+    weak, strong = add_user('weak'), add_user('strong')
+    stored = {weak: hash_with_cost(4), strong: hash_with_cost(6)}
+    for user_id, pw_hash in stored.items():
+        User.query.get(user_id).password = pw_hash
+    db.session.commit()
+
+    for username in ('weak', 'strong'):
+        assert login(client, username).status_code == 302
+        client.get('/logout')
+
+    assert User.query.get(weak).password.startswith('$2b$05$')
+    assert User.query.get(strong).password == stored[strong]
+
+
+def test_login_wrong_password(client):
+    add_user('pmacking')
+    response = client.post('/login', data={'email': 'pmacking@test.com',
+                                           'password': 'wrong'})
+    assert response.status_code == 200
+    assert b'Login unsuccessful' in response.data
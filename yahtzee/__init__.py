@@ -1,44 +1,173 @@
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+"""
+This module creates the Flask app. The extensions are created unbound here and
+bound to each app by create_app, which also imports and registers the
+blueprints, so importing the package loads no models, views or forms and
+opens no files; a worker pays for them once, when it creates its app.
+"""
+
+import os
+import pathlib
+import threading
+
+from flask import Flask, current_app
 from flask_marshmallow import Marshmallow
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from flask_mail import Mail
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.middleware.proxy_fix import ProxyFix
 
-# BASEDIR = os.path.abspath(os.path.dirname(__file__))
+from yahtzee.database import SQLAlchemy
+from yahtzee.json_encoder import OrjsonEncoder
+from yahtzee.logs import start_log_pipeline
+from yahtzee.metrics.profiler import init_profiler
+from yahtzee.metrics.utils import init_metrics
 
-# create connexion app, config from swagger.yml in specification_dir path
-# connexion_app = connexion.App(__name__, specification_dir=BASEDIR)
+BASEDIR = os.path.abspath(os.path.dirname(__file__))
 
-# get the underlying Flask app instance
-# app = connexion_app.app
+# the REST API, served by connexion under the basePath of the file (/api/v1)
+SWAGGER_FILE = os.path.join(BASEDIR, '..', 'swagger.yml')
 
-app = Flask(__name__)
-
-# config app instance from config.py class
-if app.config["ENV"] == "production":
-    app.config.from_object("config.ProductionConfig")
-elif app.config["ENV"] == "testing":
-    app.config.from_object("config.TestingConfig")
-else:
-    app.config.from_object("config.DevelopmentConfig")
+# config.py class of each FLASK_ENV, any other env is development
+CONFIGS = {
+    'production': 'config.ProductionConfig',
+    'testing': 'config.TestingConfig',
+    'development': 'config.DevelopmentConfig',
+}
 
 # create mail server, pulling app.config from config.py and env variables
-mail = Mail(app)
+mail = Mail()
 
-# create SQLAlchemy db instance from app with configs above
-db = SQLAlchemy(app)
+# create SQLAlchemy db instance, its engine follows the engine profile and
+# SQLite pragmas of the config of the app
+db = SQLAlchemy()
 
 # init Bcrypt
-bcrypt = Bcrypt(app)
+bcrypt = Bcrypt()
 
 # init LoginManager
-login_manager = LoginManager(app)
+login_manager = LoginManager()
 login_manager.login_view = 'users.login'
 login_manager.login_message_category = 'info'
 
 # init Marshmallow
-ma = Marshmallow(app)
+ma = Marshmallow()
+
+# guards the creation of the objects app_extension keeps per app
+_extensions_lock = threading.Lock()
+
+
+def create_app(config_name=None, config=None):
+    """
+    Create the app, bind the extensions to it and register the blueprints.
+
+    :param config_name: key of CONFIGS, defaults to the FLASK_ENV of the app
+    :param config: dict of settings overriding those of the config class,
+        applied before the extensions read them, e.g. the db of a test
+    :return: Flask app
+    """
+    app = Flask(__name__)
+
+    # encode jsonify and API responses with orjson
+    app.json_encoder = OrjsonEncoder
+
+    # config app instance from config.py class
+    config_name = config_name or app.config['ENV']
+    app.config.from_object(CONFIGS.get(config_name, CONFIGS['development']))
+    if config:
+        app.config.update(config)
+
+    # take the client address from the X-Forwarded-For of trusted proxies
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app,
+                                x_for=app.config['PROXY_FIX_X_FOR'])
+
+    mail.init_app(app)
+    db.init_app(app)
+    bcrypt.init_app(app)
+    login_manager.init_app(app)
+    # after db, Marshmallow schemas use the session of the db extension
+    ma.init_app(app)
+
+    _init_templates(app)
+    start_log_pipeline(app)
+    init_metrics(app)
+    # after metrics, its statements are recorded by the request timer
+    init_profiler(app)
+
+    # imported here, they load the models, forms and templates helpers
+    from yahtzee.users.routes import users
+    from yahtzee.main.routes import main
+    from yahtzee.errors.handlers import errors
+    from yahtzee.assets.routes import assets
+    from yahtzee.metrics.routes import metrics
+
+    app.register_blueprint(users)
+    app.register_blueprint(main)
+    app.register_blueprint(errors)
+    app.register_blueprint(assets)
+    app.register_blueprint(metrics)
+
+    _init_api(app)
+
+    return app
+
+
+def app_extension(name, factory):
+    """
+    Get the object kept under name in the extensions of the current app, made
+    by factory from the app on first use. Each app gets its own, built from
+    its config and db, and a pool created on first use is not shared with
+    the workers forked from the process before then.
+
+    :param name: key of app.extensions
+    :param factory: function of the app making the object
+    :return: the object of the current app
+    """
+    extensions = current_app.extensions
+    value = extensions.get(name)
+    if value is None:
+        with _extensions_lock:
+            value = extensions.get(name)
+            if value is None:
+                value = factory(current_app._get_current_object())
+                extensions[name] = value
+    return value
+
+
+def _init_api(app):
+    """
+    Register the endpoints of swagger.yml, their handlers are the operationId
+    functions of the yahtzee.swagger_* modules.
+    """
+    # connexion takes a while to import, and only the API needs it
+    from connexion.apis.flask_api import FlaskApi
+    from connexion.apps.flask_app import FlaskApp
+    from connexion.exceptions import ProblemException
+
+    # the blueprint connexion.App would register, on the app of the factory
+    # rather than on one of its own; requests failing validation or the
+    # api_token check, and the HTTP errors of requests under the base path
+    # (see yahtzee.errors.handlers), are answered as application/problem+json
+    api = FlaskApi(pathlib.Path(SWAGGER_FILE))
+    app.register_blueprint(api.blueprint)
+    app.extensions['api_base_path'] = api.base_path
+    app.register_error_handler(ProblemException,
+                               FlaskApp.common_error_handler)
+
+
+def _init_templates(app):
+    """
+    Add the fragment cache tag and the bytecode cache of compiled templates
+    to the Jinja environment.
+    """
+    from yahtzee.fragments import FragmentCacheExtension, init_fragment_cache
+
+    init_fragment_cache(app)
+    app.jinja_env.add_extension(FragmentCacheExtension)
 
-# use swagger file to configure connexion endpoints
-# connexion_app.add_api("../swagger.yml")
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        directory = app.config['TEMPLATE_BYTECODE_CACHE_DIR']
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
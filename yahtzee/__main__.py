@@ -2,14 +2,9 @@
 Main module of the server file.
 """
 
-from yahtzee import app
-from yahtzee.users.routes import users
-from yahtzee.main.routes import main
-from yahtzee.errors.handlers import errors
+from yahtzee import create_app
 
-app.register_blueprint(users)
-app.register_blueprint(main)
-app.register_blueprint(errors)
+app = create_app()
 
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,62 @@
+import mimetypes
+
+from flask import (Blueprint, abort, current_app, redirect, request,
+                   send_from_directory)
+from werkzeug.exceptions import NotFound
+
+from yahtzee.assets.utils import asset_url, file_fingerprint
+
+# create assets Blueprint instance serving static files under their hash
+assets = Blueprint('assets', __name__)
+
+# the URL changes with the content, so clients may cache it forever
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+@assets.app_template_global('asset_url')
+def asset_url_global(filename):
+    return asset_url(filename)
+
+
+@assets.route("/assets/<fingerprint>/<path:filename>")
+def asset(fingerprint, filename):
+    """
+    This function responds to the fingerprinted URL of a static file, e.g.
+    localhost:5000/assets/<fingerprint>/main.css, with the file and headers
+    letting it be cached forever.
+    """
+    try:
+        current = file_fingerprint(filename)
+    except (OSError, NotFound):
+        abort(404)
+
+    # an old fingerprint: send the client on to the current version
+    if fingerprint != current:
+        return redirect(asset_url(filename))
+
+    # the fingerprint is a strong ETag, answer revalidations without a body
+    if request.if_none_match.contains_weak(current):
+        response = current_app.response_class(status=304)
+
+    # let NGINX send the bytes from an internal location, e.g.
+    # location /_static/ { internal; alias /path/to/yahtzee/static/; }
+    elif current_app.config['ASSETS_ACCEL_REDIRECT']:
+        response = current_app.response_class(
+            mimetype=mimetypes.guess_type(filename)[0]
+            or 'application/octet-stream'
+        )
+        response.headers['X-Accel-Redirect'] = \
+            current_app.config['ASSETS_ACCEL_REDIRECT'] + filename
+
+    # send the file, or an X-Sendfile header if USE_X_SENDFILE is set
+    else:
+        response = send_from_directory(
+            current_app.static_folder,
+            filename,
+            add_etags=False,
+            conditional=False
+        )
+
+    response.set_etag(current)
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
@@ -0,0 +1,93 @@
+import hashlib
+import os
+import threading
+
+from flask import current_app, url_for, safe_join
+
+# static path -> (mtime, size, fingerprint), so each file is hashed once
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+
+
+def static_path(filename):
+    """
+    Get the filesystem path of a static file.
+
+    :raises NotFound: if filename points outside the static folder
+    """
+    return safe_join(current_app.static_folder, filename)
+
+
+def file_fingerprint(filename):
+    """
+    Get the fingerprint (content hash) of a static file. It is cached until
+    the file's mtime or size changes.
+
+    :param filename: path relative to the static folder
+    :return: 16 hex digit fingerprint
+    :raises OSError: if the file does not exist
+    """
+    path = static_path(filename)
+    stat = os.stat(path)
+
+    cached = _fingerprints.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(block)
+    value = digest.hexdigest()[:16]
+
+    with _fingerprints_lock:
+        _fingerprints[path] = (stat.st_mtime_ns, stat.st_size, value)
+    return value
+
+
+def asset_url(filename):
+    """
+    Get the fingerprinted, immutable URL of a static file. Falls back to the
+    plain static URL if the file does not exist.
+
+    :param filename: path relative to the static folder
+    :return: URL
+    """
+    try:
+        value = file_fingerprint(filename)
+    except OSError:
+        return url_for('static', filename=filename)
+    return url_for('assets.asset', fingerprint=value, filename=filename)
+
+
+_templates_version = None
+
+
+def templates_version():
+    """
+    Get a fingerprint of the deployed templates and stylesheets, from their
+    names, sizes and mtimes, for the ETags of rendered pages. It is computed
+    once per process, or on each call in debug mode where files change.
+    Uploads, in subfolders of static, are left out.
+
+    :return: 16 hex digit fingerprint
+    """
+    global _templates_version
+    if _templates_version is not None and not current_app.debug:
+        return _templates_version
+
+    paths = []
+    template_folder = os.path.join(current_app.root_path,
+                                   current_app.template_folder)
+    for root, _, files in os.walk(template_folder):
+        paths.extend(os.path.join(root, name) for name in files)
+    paths.extend(entry.path for entry in os.scandir(current_app.static_folder)
+                 if entry.is_file())
+
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns};'
+                      .encode('utf-8'))
+    _templates_version = digest.hexdigest()[:16]
+    return _templates_version
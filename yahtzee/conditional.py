@@ -0,0 +1,75 @@
+"""
+This module answers conditional GETs. A view works out the validators of its
+response, an ETag and a Last-Modified time, from a cheap query before doing
+anything else; when If-None-Match or If-Modified-Since shows the client holds
+that response already, it returns a 304 without querying the rest, serializing
+or rendering a template.
+"""
+
+from flask import current_app, request
+from werkzeug.http import http_date, quote_etag
+
+from yahtzee import db
+from yahtzee.models import TableVersion
+
+
+def table_version(name):
+    """
+    Get the write counter of a table tracked by track_table_version.
+
+    :param name: name of the table
+    :return: (version, changed_at) row, None if the table is not tracked
+    """
+    return db.session.query(TableVersion.version, TableVersion.changed_at) \
+        .filter(TableVersion.name == name) \
+        .first()
+
+
+def validators(etag, last_modified=None, weak=False):
+    """
+    Get the headers carrying the validators of a response. Clients have to
+    revalidate (no-cache) rather than guess a lifetime from Last-Modified.
+
+    :param etag: unquoted entity tag
+    :param last_modified: naive UTC datetime of the last change, or None
+    :param weak: True if the response is only semantically equivalent
+        between changes, e.g. rendered HTML
+    :return: dict of headers
+    """
+    headers = {
+        'ETag': quote_etag(etag, weak),
+        'Cache-Control': 'no-cache',
+    }
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def is_fresh(etag, last_modified=None):
+    """
+    Check if the request's validators match the current response. As in RFC
+    7232, If-Modified-Since is ignored when If-None-Match is sent.
+
+    :param etag: unquoted entity tag of the current response
+    :param last_modified: naive UTC datetime of the last change, or None
+    :return: True if the client may reuse its copy
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        # HTTP dates have whole seconds
+        return last_modified.replace(microsecond=0) \
+            <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def not_modified(headers):
+    """
+    Get a 304 response carrying the validators.
+
+    :param headers: dict returned by validators
+    """
+    response = current_app.response_class(status=304, headers=headers)
+    # a 304 has no body to describe
+    del response.headers['Content-Type']
+    return response
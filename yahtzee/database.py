@@ -0,0 +1,117 @@
+"""
+This module creates the database engine from the engine profile of the app
+config. SQLALCHEMY_ENGINE_OPTIONS sets the connection pool, and for SQLite
+the SQLITE_PRAGMAS (WAL journal, synchronous, busy timeout, cache and mmap
+sizes, foreign keys) are applied to every new connection, since pragmas are
+per connection.
+It also renders UPDATE ... RETURNING for SQLite, which SQLAlchemy 1.3 leaves
+out although SQLite runs it from 3.35.
+"""
+
+from flask_sqlalchemy import SQLAlchemy as _SQLAlchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import Update
+
+# first SQLite version running RETURNING
+SQLITE_RETURNING = (3, 35)
+
+
+def is_sqlite_file(url):
+    """
+    Check if a database url points at an SQLite database file.
+
+    :param url: sqlalchemy.engine.url.URL
+    """
+    return url.drivername.startswith('sqlite') \
+        and url.database not in (None, '', ':memory:')
+
+
+def engine_options(url, options):
+    """
+    Adapt engine options to the database. SQLite file databases get a new
+    connection for every checkout (NullPool) by default; given a pool size
+    their connections are pooled and shared between threads instead. An
+    in-memory database lives in its one connection, so it has no pool size.
+
+    :param url: sqlalchemy.engine.url.URL
+    :param options: keyword arguments for sqlalchemy.create_engine
+    :return: adapted copy of options
+    """
+    options = dict(options)
+    if not url.drivername.startswith('sqlite'):
+        return options
+
+    if is_sqlite_file(url) and options.get('pool_size'):
+        options['poolclass'] = QueuePool
+        options['connect_args'] = dict(options.get('connect_args', {}),
+                                       check_same_thread=False)
+    elif not is_sqlite_file(url):
+        for option in ('pool_size', 'max_overflow', 'pool_timeout'):
+            options.pop(option, None)
+    return options
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    """
+    Run PRAGMA name = value on every new connection of an SQLite engine.
+
+    :param engine: sqlalchemy Engine
+    :param pragmas: dict of pragma name to value, in the order to run them
+    """
+    if not pragmas or engine.dialect.name != 'sqlite':
+        return
+
+    statements = [f'PRAGMA {name} = {value}' for name, value in
+                  pragmas.items()]
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def supports_returning(dialect):
+    """
+    Check if UPDATE ... RETURNING can be run on a database.
+
+    :param dialect: sqlalchemy Dialect of the engine
+    """
+    if dialect.name == 'sqlite':
+        return dialect.dbapi.sqlite_version_info >= SQLITE_RETURNING
+    return dialect.implicit_returning
+
+
+@compiles(Update, 'sqlite')
+def _compile_update(update, compiler, **kw):
+    """
+    Render the RETURNING clause of an UPDATE for SQLite, check with
+    supports_returning before giving one.
+    """
+    returning = update._returning
+    if not returning:
+        return compiler.visit_update(update, **kw)
+
+    update._returning = None
+    try:
+        text = compiler.visit_update(update, **kw)
+    finally:
+        update._returning = returning
+    return text + ' RETURNING ' + ', '.join(
+        compiler.process(column, include_table=False) for column in returning
+    )
+
+
+class SQLAlchemy(_SQLAlchemy):
+    """
+    Flask-SQLAlchemy with the engine profile of the app config applied.
+    """
+    def create_engine(self, sa_url, engine_opts):
+        engine = create_engine(sa_url, **engine_options(sa_url, engine_opts))
+        set_sqlite_pragmas(engine, self.get_app().config.get('SQLITE_PRAGMAS'))
+        return engine
@@ -1,18 +1,84 @@
-from flask import Blueprint, render_template
+import functools
+
+from flask import Blueprint, current_app, render_template, request
+from werkzeug.exceptions import HTTPException
 
 errors = Blueprint('errors', __name__)
 
 
+def _api_problem(error):
+    """
+    Get the application/problem+json response of an HTTP error of the REST
+    API, with the headers of the error (e.g. Allow, Retry-After).
+    """
+    # connexion is imported by create_app, with the API
+    from connexion.apis.flask_api import FlaskApi
+    from connexion.problem import problem
+
+    headers = {name: value for name, value in error.get_headers()
+               if name.lower() != 'content-type'}
+    if getattr(error, 'retry_after', None):
+        headers['Retry-After'] = str(error.retry_after)
+    return FlaskApi.get_response(problem(
+        status=error.code, title=error.name, detail=error.description,
+        headers=headers))
+
+
+def site_page(handler):
+    """
+    Answer the errors of requests to the REST API as application/problem+json
+    rather than with the HTML page of handler. Errors raised with a response
+    of their own (e.g. a 409 carrying the current row) keep it.
+    """
+    @functools.wraps(handler)
+    def wrapper(error):
+        base_path = current_app.extensions.get('api_base_path')
+        if base_path and (request.path + '/').startswith(base_path + '/'):
+            if error.response is not None:
+                return error.response
+            return _api_problem(error)
+        return handler(error)
+    return wrapper
+
+
 @errors.app_errorhandler(404)
+@site_page
 def error_404(error):
     return render_template('errors/404.html'), 404
 
 
 @errors.app_errorhandler(403)
+@site_page
 def error_403(error):
     return render_template('errors/403.html'), 403
 
 
+@errors.app_errorhandler(429)
+@site_page
+def error_429(error):
+    headers = {}
+    if getattr(error, 'retry_after', None):
+        headers['Retry-After'] = str(error.retry_after)
+    return render_template('errors/429.html'), 429, headers
+
+
 @errors.app_errorhandler(500)
+@site_page
 def error_500(error):
     return render_template('errors/500.html'), 500
+
+
+@errors.app_errorhandler(503)
+@site_page
+def error_503(error):
+    headers = {}
+    if getattr(error, 'retry_after', None):
+        headers['Retry-After'] = str(error.retry_after)
+    return render_template('errors/503.html'), 503, headers
+
+
+@errors.app_errorhandler(HTTPException)
+@site_page
+def error_other(error):
+    # the default page of werkzeug, e.g. 400 or 405
+    return error
@@ -0,0 +1,112 @@
+"""
+This module streams bulk exports of the user and users_games tables as NDJSON
+or CSV. Rows are read from a streaming cursor with yield_per and emitted one
+batch at a time, so memory use does not depend on the size of the table.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+
+from yahtzee.models import User, UsersGames
+
+# exportable tables and their columns, the password hash is never exported
+EXPORTS = {
+    'users': [
+        User.id,
+        User.username,
+        User.first_name,
+        User.last_name,
+        User.email,
+        User.image_file,
+        User.timestamp,
+    ],
+    'users_games': [
+        getattr(UsersGames, column.key)
+        for column in UsersGames.__table__.columns
+    ],
+}
+
+# supported export formats and their mimetypes
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _value(value):
+    """
+    Convert a column value into a JSON/CSV friendly value.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_batches(query, batch_size):
+    """
+    Yield lists of at most batch_size rows from a streaming cursor.
+
+    :param query: SQLAlchemy query to stream
+    :param batch_size: number of rows fetched and yielded at a time
+    """
+    rows = iter(
+        query.execution_options(stream_results=True).yield_per(batch_size)
+    )
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def ndjson_chunks(query, names, batch_size):
+    """
+    Yield one string of newline delimited JSON objects per batch of rows.
+    """
+    dumps = json.JSONEncoder(separators=(',', ':')).encode
+    for batch in iter_batches(query, batch_size):
+        yield ''.join(
+            dumps(dict(zip(names, map(_value, row)))) + '\n'
+            for row in batch
+        )
+
+
+def csv_chunks(query, names, batch_size):
+    """
+    Yield a CSV header, then one string of CSV lines per batch of rows.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(names)
+    yield buffer.getvalue()
+
+    for batch in iter_batches(query, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([map(_value, row) for row in batch])
+        yield buffer.getvalue()
+
+
+def stream_export(session, table, fmt, batch_size=1000):
+    """
+    Stream an export of table in format fmt.
+
+    :param session: SQLAlchemy session to query with
+    :param table: key of EXPORTS, e.g. 'users'
+    :param fmt: key of FORMATS, e.g. 'ndjson'
+    :param batch_size: number of rows held in memory at a time
+    :return: generator of str chunks
+    :raises KeyError: if the table or format is not exportable
+    """
+    columns = EXPORTS[table]
+    chunks = {'ndjson': ndjson_chunks, 'csv': csv_chunks}[fmt]
+
+    # order by primary key so the export walks the table in rowid order
+    query = session.query(*columns).order_by(columns[0])
+    names = [column.key for column in columns]
+
+    return chunks(query, names, batch_size)
@@ -0,0 +1,114 @@
+"""
+This module caches rendered fragments of templates. The cache tag of
+FragmentCacheExtension renders its body once per key and then reuses the
+output, e.g. for the user listing of the home page:
+
+    {% cache 'users', users_version, cursor %}...{% endcache %}
+
+The key has to hold everything the body depends on; keying on the version of
+the data (see yahtzee.conditional.table_version) makes a write of any worker
+start new entries, and old ones age out. Each app keeps at most
+FRAGMENT_CACHE_SIZE bytes of fragments, evicting the least recently used.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+class FragmentCache(object):
+    """
+    An LRU map of key to rendered fragment bounded by the memory of the
+    fragments, safe to share between threads.
+    """
+    def __init__(self, max_bytes):
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        size = sys.getsizeof(value)
+        # a fragment that fills the cache would only evict everything else
+        if size > self._max_bytes // 4:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self._max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+def init_fragment_cache(app):
+    """
+    Give app a fragment cache of its own, sized by its config.
+    """
+    app.extensions['fragment_cache'] = FragmentCache(
+        app.config['FRAGMENT_CACHE_SIZE']
+    )
+
+
+def get_fragment_cache():
+    """
+    Get the fragment cache of the current app.
+    """
+    return current_app.extensions['fragment_cache']
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Jinja extension adding {% cache key, ... %}...{% endcache %}. The key is
+    one or more expressions, scoped to the template and line of the tag. A
+    key with a None part, e.g. data without a version, renders the body
+    without caching.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+
+        name = nodes.Const(f'{parser.name}:{lineno}')
+        call = self.call_method(
+            '_render', [name, nodes.Tuple(parts, 'load')]
+        )
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, name, parts, caller):
+        if any(part is None for part in parts):
+            return caller()
+
+        cache = get_fragment_cache()
+        key = (name,) + parts
+        value = cache.get(key)
+        if value is None:
+            value = caller()
+            cache.put(key, value)
+        return value
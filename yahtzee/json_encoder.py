@@ -0,0 +1,33 @@
+"""
+This module plugs orjson into the JSON encoding of the app. Flask builds its
+encoder class for jsonify and for the dicts returned by API handlers; this one
+encodes with orjson and hands anything orjson does not know, dates included,
+to the default of Flask, so responses keep their formats.
+"""
+
+import orjson
+from flask.json import JSONEncoder
+
+# datetimes and dataclasses go to JSONEncoder.default like before (HTTP dates)
+_OPTIONS = orjson.OPT_NON_STR_KEYS \
+    | orjson.OPT_PASSTHROUGH_DATETIME \
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+
+
+class OrjsonEncoder(JSONEncoder):
+    """
+    Flask JSONEncoder encoding with orjson. Non-ASCII characters are written
+    as UTF-8 rather than escaped, whatever JSON_AS_ASCII says.
+    """
+    def encode(self, o):
+        option = _OPTIONS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(o, default=self.default,
+                                option=option).decode('utf-8')
+        except orjson.JSONEncodeError:
+            # e.g. integers beyond 64 bits, which the json module handles
+            return super().encode(o)
@@ -0,0 +1,366 @@
+"""
+This module maintains the leaderboard. Finishing a scorecard updates the
+user_stats row of its player and the best_score_count histogram in the same
+transaction, and deleting a user removes them from both. Each process
+ranks scores with a Fenwick tree over that histogram, so a rank costs
+O(log MAX_GRAND_TOTAL) whatever the number of users, and lists of leaders
+are read from the best score index.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from yahtzee import app_extension, db
+from yahtzee.models import BestScoreCount, User, UserStats, UsersGames
+from yahtzee.rules import YAHTZEE, YAHTZEE_BONUS
+
+
+class FenwickTree(object):
+    """
+    A binary indexed tree of counts over the integers 0 to size - 1, with
+    O(log size) updates and prefix sums.
+    """
+    def __init__(self, size):
+        self._tree = [0] * (size + 1)
+
+    def add(self, index, delta):
+        """
+        Add delta to the count of index.
+        """
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix_sum(self, index):
+        """
+        Sum the counts of 0 to index, inclusive.
+        """
+        total = 0
+        index = min(index + 1, len(self._tree) - 1)
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+
+class Leaderboard(object):
+    """
+    The ranks of best scores kept by an app. Finishes made through it are
+    applied at once, the tree is reloaded from best_score_count every
+    refresh seconds to pick up those of other processes. Each reload starts
+    a new generation, so a change committed before a reload, which the
+    reload counted already, is not recorded again.
+    """
+    def __init__(self, refresh):
+        self._refresh = refresh
+        self._lock = threading.Lock()
+        self._tree = None
+        self._users = 0
+        self._loaded_at = 0
+        self._generation = 0
+
+    def _load(self):
+        # the score tables load NumPy, only workers ranking players need them
+        from yahtzee.scoring import MAX_GRAND_TOTAL
+
+        tree = FenwickTree(MAX_GRAND_TOTAL + 1)
+        users = 0
+        for best_score, count in db.session.query(
+                BestScoreCount.best_score, BestScoreCount.users):
+            tree.add(best_score, count)
+            users += count
+        self._tree, self._users = tree, users
+        self._loaded_at = time.monotonic()
+        self._generation += 1
+
+    def rank(self, best_score):
+        """
+        Rank a best score, 1 being the top. Users with equal best scores
+        share a rank.
+
+        :param best_score: UserStats.best_score
+        :return: 1 + number of users with a higher best score
+        """
+        with self._lock:
+            if self._tree is None \
+                    or time.monotonic() - self._loaded_at > self._refresh:
+                self._load()
+            return 1 + self._users - self._tree.prefix_sum(best_score)
+
+    def generation(self):
+        """
+        Get the generation of the tree, to pass to record for a change about
+        to be committed.
+        """
+        with self._lock:
+            return self._generation
+
+    def record(self, old_best, new_best, generation):
+        """
+        Move a user from old_best to new_best, either None for a user without
+        a finished game, unless the tree was reloaded since generation was
+        taken: the reload may have counted the move already, and one that
+        did not is caught up by the next one.
+        """
+        with self._lock:
+            if self._tree is None or generation != self._generation:
+                return
+            if old_best is None:
+                self._users += 1
+            else:
+                self._tree.add(old_best, -1)
+            if new_best is None:
+                self._users -= 1
+            else:
+                self._tree.add(new_best, 1)
+
+
+def get_leaderboard():
+    """
+    Get the leaderboard of the current app, creating it from its config.
+    """
+    return app_extension('leaderboard', lambda app: Leaderboard(
+        app.config['LEADERBOARD_REFRESH']
+    ))
+
+
+def _insert_new(statement):
+    """
+    Run an INSERT in a savepoint, rolled back if a concurrent transaction
+    inserted the same key first.
+
+    :return: True if inserted, False if the row exists
+    """
+    try:
+        with db.session.begin_nested():
+            db.session.execute(statement)
+    except IntegrityError:
+        return False
+    return True
+
+
+def _count_best_score(best_score, delta):
+    """
+    Add delta to the number of users having best_score.
+    """
+    table = BestScoreCount.__table__
+    update = table.update() \
+        .where(table.c.best_score == best_score) \
+        .values(users=table.c.users + delta)
+    if db.session.execute(update).rowcount:
+        return
+    if not _insert_new(table.insert().values(best_score=best_score,
+                                             users=delta)):
+        db.session.execute(update)
+
+
+def _best_score(user_id):
+    return db.session.query(UserStats.best_score) \
+        .filter(UserStats.user_id == user_id) \
+        .scalar()
+
+
+def finish_game(users_games_id, versions=None):
+    """
+    Finish a scorecard and add it to the stats of its player, in the
+    current transaction. The caller takes get_leaderboard().generation(),
+    commits, then calls record with the returned best scores and that
+    generation.
+
+    :param users_games_id: id of the scorecard
+    :param versions: only finish if version_id is one of these, or None
+    :return: (old_best, new_best) of the player, old_best is None for their
+        first game; None if the scorecard is missing, already finished or has
+        another version
+    """
+    c = UsersGames.__table__.c
+    statement = UsersGames.__table__.update() \
+        .where(c.users_games_id == users_games_id) \
+        .where(c.finished_at.is_(None)) \
+        .values(finished_at=datetime.utcnow(), version_id=c.version_id + 1)
+    if versions is not None:
+        statement = statement.where(c.version_id.in_(versions))
+    finished = db.session.execute(statement).rowcount
+    if not finished:
+        return None
+
+    user_id, score, yahtzee, yahtzee_bonus = db.session.query(
+        UsersGames.user_id,
+        UsersGames.grand_total_score,
+        UsersGames.yahtzee,
+        UsersGames.yahtzee_bonus
+    ).filter(UsersGames.users_games_id == users_games_id).one()
+    yahtzees = (yahtzee == YAHTZEE) + yahtzee_bonus // YAHTZEE_BONUS
+
+    old_best = _best_score(user_id)
+    if old_best is None:
+        if _insert_new(UserStats.__table__.insert().values(
+                user_id=user_id,
+                games_played=1,
+                best_score=score,
+                total_score=score,
+                yahtzees=yahtzees)):
+            _count_best_score(score, 1)
+            return None, score
+
+        # a concurrent first finish of the user inserted their stats
+        old_best = _best_score(user_id)
+
+    s = UserStats.__table__.c
+    db.session.execute(
+        UserStats.__table__.update()
+        .where(s.user_id == user_id)
+        .values(
+            games_played=s.games_played + 1,
+            best_score=db.case([(s.best_score < score, score)],
+                               else_=s.best_score),
+            total_score=s.total_score + score,
+            yahtzees=s.yahtzees + yahtzees,
+        )
+    )
+    new_best = max(old_best, score)
+    if new_best != old_best:
+        _count_best_score(old_best, -1)
+        _count_best_score(new_best, 1)
+    return old_best, new_best
+
+
+def remove_user(user_id):
+    """
+    Remove the scorecards and stats of a user about to be deleted, in the
+    current transaction. The caller takes get_leaderboard().generation(),
+    deletes the user and commits, then calls record(best_score, None,
+    generation) if they had finished a game.
+
+    :param user_id: id of the user
+    :return: best score of the user, None if they have not finished a game
+    """
+    best_score = _best_score(user_id)
+    db.session.execute(UsersGames.__table__.delete()
+                       .where(UsersGames.user_id == user_id))
+    if best_score is not None:
+        db.session.execute(UserStats.__table__.delete()
+                           .where(UserStats.user_id == user_id))
+        _count_best_score(best_score, -1)
+    return best_score
+
+
+def rebuild_stats():
+    """
+    Recompute user_stats and best_score_count from every finished scorecard,
+    in the current transaction. For bulk loads, which skip finish_game.
+    """
+    db.session.execute(BestScoreCount.__table__.delete())
+    db.session.execute(UserStats.__table__.delete())
+
+    yahtzees = db.case([(UsersGames.yahtzee == YAHTZEE, 1)], else_=0) \
+        + UsersGames.yahtzee_bonus / YAHTZEE_BONUS
+    db.session.execute(UserStats.__table__.insert().from_select(
+        ['user_id', 'games_played', 'best_score', 'total_score', 'yahtzees'],
+        db.session.query(
+            UsersGames.user_id,
+            db.func.count(),
+            db.func.max(UsersGames.grand_total_score),
+            db.func.sum(UsersGames.grand_total_score),
+            db.func.sum(yahtzees),
+        )
+        .filter(UsersGames.finished_at.isnot(None))
+        .group_by(UsersGames.user_id)
+    ))
+    db.session.execute(BestScoreCount.__table__.insert().from_select(
+        ['best_score', 'users'],
+        db.session.query(UserStats.best_score, db.func.count())
+        .group_by(UserStats.best_score)
+    ))
+
+
+def _entries(rows):
+    """
+    Turn (UserStats, username) rows into ranked leaderboard entries.
+    """
+    leaderboard = get_leaderboard()
+    return [
+        {
+            'rank': leaderboard.rank(stats.best_score),
+            'user_id': stats.user_id,
+            'username': username,
+            'games_played': stats.games_played,
+            'best_score': stats.best_score,
+            'mean_score': round(stats.mean_score, 1),
+            'yahtzees': stats.yahtzees,
+        }
+        for stats, username in rows
+    ]
+
+
+def _ranked():
+    return db.session.query(UserStats, User.username) \
+        .join(User, User.id == UserStats.user_id)
+
+
+def top(limit):
+    """
+    Get the leaders, best score first.
+
+    :param limit: number of users to return
+    :return: list of leaderboard entries
+    """
+    rows = _ranked() \
+        .order_by(UserStats.best_score.desc(), UserStats.user_id) \
+        .limit(limit) \
+        .all()
+    return _entries(rows)
+
+
+def stats_of(user_id):
+    """
+    Get the leaderboard entry of a user.
+
+    :param user_id: id of the user
+    :return: leaderboard entry, None if the user has not finished a game
+    """
+    row = _ranked().filter(UserStats.user_id == user_id).one_or_none()
+    return _entries([row])[0] if row else None
+
+
+def around(user_id, count):
+    """
+    Get the users ranked just above and below a user.
+
+    :param user_id: id of the user
+    :param count: number of users to return on each side
+    :return: list of leaderboard entries, best score first, None if the user
+        has not finished a game
+    """
+    best_score = db.session.query(UserStats.best_score) \
+        .filter(UserStats.user_id == user_id) \
+        .scalar()
+    if best_score is None:
+        return None
+
+    # walk the best score index both ways from the user's own key, the
+    # leading column is bounded on its own so each walk is a range search
+    above = _ranked() \
+        .filter(and_(
+            UserStats.best_score >= best_score,
+            or_(UserStats.best_score > best_score,
+                UserStats.user_id < user_id)
+        )) \
+        .order_by(UserStats.best_score, UserStats.user_id.desc()) \
+        .limit(count) \
+        .all()
+    rest = _ranked() \
+        .filter(and_(
+            UserStats.best_score <= best_score,
+            or_(UserStats.best_score < best_score,
+                UserStats.user_id >= user_id)
+        )) \
+        .order_by(UserStats.best_score.desc(), UserStats.user_id) \
+        .limit(count + 1) \
+        .all()
+    return _entries(above[::-1] + rest)
@@ -0,0 +1,268 @@
+"""
+This module logs structured events without writing on the request thread.
+A handler on the logger only samples a record and puts it on a bounded queue;
+a listener thread takes records off in batches, formats them as JSON lines
+and writes each batch at once to a rotating file. Messages are %-formatted by
+the listener, so call sites pass plain values, as args or as the extra
+fields of the event:
+
+    logger.info('User created', extra={'event': 'user_created',
+                                       'user_id': user.id})
+
+When the queue is full records are dropped rather than waited for; the
+listener logs how many as a log_events_dropped event, and LogPipeline.dropped
+counts them all. Each app runs a pipeline of its own, and records go to the
+one of the app they were logged in.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+
+import orjson
+from flask import current_app, has_app_context
+
+# attributes of every LogRecord, the others were passed in extra
+_RECORD_ATTRIBUTES = frozenset(
+    logging.LogRecord('', 0, '', 0, '', (), None).__dict__
+) | {'message', 'asctime', 'sample_rate'}
+
+# put on the queue to stop the listener
+_STOP = object()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format a record as one line of JSON: time, level, logger, message and the
+    extra fields of the record, with the traceback of an exception.
+    """
+    def format(self, record):
+        line = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc)
+            .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        line.update((key, value) for key, value in record.__dict__.items()
+                    if key not in _RECORD_ATTRIBUTES)
+        if getattr(record, 'sample_rate', 1) < 1:
+            line['sample_rate'] = record.sample_rate
+        if record.exc_text:
+            line['exception'] = record.exc_text
+        return orjson.dumps(line, default=str).decode('utf-8')
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a share of the records of some events, by the event field of the
+    record. Warnings and errors are always kept.
+
+    :param rates: dict of event name to the share of its records kept
+    """
+    def __init__(self, rates):
+        super().__init__()
+        self._rates = dict(rates)
+
+    def filter(self, record):
+        rate = self._rates.get(getattr(record, 'event', None), 1)
+        if rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class BatchFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler also writing many formatted records in one write.
+    """
+    def write_batch(self, records):
+        text = ''.join(self.format(record) + self.terminator
+                       for record in records)
+        self.acquire()
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 \
+                    and self.stream.tell() + len(text) >= self.maxBytes:
+                self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+            self.stream.write(text)
+            self.stream.flush()
+        finally:
+            self.release()
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Handler putting records on the queue of a pipeline, without waiting for
+    room. Only exceptions are formatted here, as their traceback may not
+    outlive the request.
+    """
+    def __init__(self, pipeline):
+        super().__init__(pipeline.queue)
+        self._pipeline = pipeline
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._pipeline.drop()
+
+
+class LogPipeline(object):
+    """
+    A bounded queue of records and the thread writing them to handler.
+
+    :param handler: BatchFileHandler to write with
+    :param queue_size: most records waiting to be written
+    :param batch_size: most records written at once
+    """
+    def __init__(self, handler, queue_size, batch_size):
+        self.queue = queue.Queue(queue_size)
+        self.handler = handler
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self._reported = 0
+        self._thread = None
+
+    def drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='log-pipeline',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """
+        Write the queued records and stop the listener.
+        """
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+        self.handler.close()
+
+    def _dropped_record(self):
+        # the records dropped since the last report, as a record of their own
+        with self._lock:
+            count = self.dropped - self._reported
+            self._reported = self.dropped
+        if not count:
+            return None
+        return logging.makeLogRecord({
+            'name': __name__, 'levelno': logging.WARNING,
+            'levelname': 'WARNING', 'msg': 'Log queue full, events dropped',
+            'event': 'log_events_dropped', 'count': count,
+        })
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch.remove(_STOP)
+
+            dropped = self._dropped_record()
+            if dropped is not None:
+                batch.append(dropped)
+            if batch:
+                try:
+                    self.handler.write_batch(batch)
+                except Exception:
+                    for record in batch:
+                        self.handler.handleError(record)
+
+
+class AppLogHandler(logging.Handler):
+    """
+    Handler passing the records of a logger to the pipeline started for the
+    current app, or for the last app started outside of an app context, so
+    each app writes to the USERS_LOG_FILE of its own config.
+
+    :param logger_name: name of the logger the handler is on
+    """
+    def __init__(self, logger_name):
+        super().__init__()
+        self._logger_name = logger_name
+
+    def handle(self, record):
+        handlers = current_app.extensions.get('log_handlers', {}) \
+            if has_app_context() else _last_handlers
+        handler = handlers.get(self._logger_name)
+        if handler is None:
+            return False
+        return handler.handle(record)
+
+
+# queue handlers of the last app started, by logger name
+_last_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def get_log_pipeline():
+    """
+    Get the log pipeline of the current app, None before start_log_pipeline.
+    """
+    return current_app.extensions.get('log_pipeline')
+
+
+def start_log_pipeline(app, logger_name='yahtzee.users'):
+    """
+    Start a log pipeline writing to the USERS_LOG_FILE of app, and send the
+    records of a logger through it while app is the current app.
+
+    :param app: Flask app to take the config from
+    :param logger_name: name of the logger, its children propagate to it
+    :return: LogPipeline
+    """
+    config = app.config
+    handler = BatchFileHandler(
+        config['USERS_LOG_FILE'],
+        maxBytes=config['USERS_LOG_MAX_BYTES'],
+        backupCount=config['USERS_LOG_BACKUPS'],
+        delay=True
+    )
+    handler.setFormatter(JsonFormatter())
+    pipeline = LogPipeline(handler, config['LOG_QUEUE_SIZE'],
+                           config['LOG_BATCH_SIZE'])
+    pipeline.start()
+    atexit.register(pipeline.stop)
+
+    queue_handler = QueueHandler(pipeline)
+    queue_handler.addFilter(SamplingFilter(config['LOG_SAMPLING']))
+    app.extensions['log_pipeline'] = pipeline
+    app.extensions.setdefault('log_handlers', {})[logger_name] = queue_handler
+
+    with _handlers_lock:
+        _last_handlers[logger_name] = queue_handler
+        logger = logging.getLogger(logger_name)
+        if not any(isinstance(h, AppLogHandler) for h in logger.handlers):
+            logger.setLevel(logging.INFO)
+            logger.addHandler(AppLogHandler(logger_name))
+    return pipeline
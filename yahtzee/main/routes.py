@@ -1,5 +1,11 @@
-from flask import render_template, Blueprint
+from flask import (render_template, Blueprint, request, abort, current_app,
+                   session)
+from flask_login import current_user
+from yahtzee.assets.utils import templates_version
+from yahtzee.conditional import (is_fresh, not_modified, table_version,
+                                 validators)
 from yahtzee.models import User
+from yahtzee.pagination import paginate
 
 main = Blueprint('main', __name__)
 
@@ -10,13 +16,40 @@ def home():
     """
     This function responds to the browser URL localhost:5000/
 
-    return:         the rendered template "home.html"
+    return:         the rendered template "home.html", or 304 if the
+                    browser's copy is current
     """
-    users = User.query \
-        .order_by(User.last_name) \
-        .all()
+    # the page shows users and who is logged in, so its weak ETag is made
+    # of the user table version, the viewer and the deployed templates; a
+    # page with pending flashes is always rendered to show them
+    headers = {}
+    version = table_version('user')
+    if version is not None and '_flashes' not in session:
+        viewer = current_user.get_id() or 'anonymous'
+        etag = f'home-{version.version}-{viewer}-{templates_version()}'
+        headers = validators(etag, weak=True)
+        headers['Vary'] = 'Cookie'
+        if is_fresh(etag):
+            return not_modified(headers)
 
-    return render_template("home.html", users=users)
+    # '' for the first page, a part of the fragment key like the version
+    cursor = request.args.get('cursor', '')
+
+    def load_page():
+        # fetch one page of users following the cursor, keyed on
+        # (last_name, id); the template only calls this to render a page
+        # that is not in the fragment cache for this version of the table
+        try:
+            return paginate(User.query, [User.last_name, User.id],
+                            cursor=cursor,
+                            per_page=current_app.config['USERS_PER_PAGE'])
+        except ValueError:
+            abort(404)
+
+    return render_template(
+        "home.html", load_page=load_page, cursor=cursor,
+        users_version=version.version if version is not None else None
+    ), 200, headers
 
 
 @main.route("/about")
@@ -0,0 +1,203 @@
+"""
+This module profiles single requests and watches the SQL they run. A request
+is captured when PROFILER_ENABLED is set, or when it sends an X-Profile header
+and PROFILER_ALLOW_HEADER is set: it runs under cProfile and each statement it
+issues is recorded. SQL run PROFILER_REPEAT_THRESHOLD times or more by one
+request, the parameters aside, is flagged as an N+1 pattern, e.g. a lazy
+relationship such as User.users_games walked row by row. The reports of the
+last PROFILER_KEEP captured requests are served under /metrics/profiles, to
+clients sending METRICS_TOKEN only.
+
+The statements of the endpoints in QUERY_BUDGETS are counted on every
+request. A request running more than the budget of its endpoint is logged,
+and raises QueryBudgetExceeded with PROFILER_FAIL_ON_BUDGET, so the request
+fails under test.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import Counter, deque
+
+from flask import current_app, request
+
+from yahtzee.metrics.utils import capture_statements
+
+logger = logging.getLogger(__name__)
+
+# sent by a client to have its request captured
+PROFILE_HEADER = 'X-Profile'
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a request runs more statements than the QUERY_BUDGETS entry
+    of its endpoint, with PROFILER_FAIL_ON_BUDGET set.
+    """
+
+
+class RequestProfile(object):
+    """
+    The profile and the statements of one request.
+    """
+    def __init__(self, profile, statements):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = request.method
+        # the URL rule rather than the URL, which may hold secrets such as
+        # the token of /reset_password/<token> or a query string
+        self.path = request.url_rule.rule if request.url_rule else None
+        self.endpoint = request.endpoint
+        self.profile = profile
+        self.statements = statements
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status = None
+
+    def repeated(self, threshold):
+        """
+        Get the SQL run threshold times or more.
+
+        :return: list of (statement, times) tuples, most repeated first
+        """
+        counts = Counter(statement for statement, _ in self.statements)
+        return [(statement, times) for statement, times
+                in counts.most_common() if times >= threshold]
+
+    def stats(self, limit):
+        """
+        Get the functions taking the most cumulative time, as pstats text.
+        """
+        if self.profile is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).strip_dirs() \
+            .sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
+
+    def report(self, threshold, limit=40):
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'status': self.status,
+            'duration': self.duration,
+            'query_count': len(self.statements),
+            'query_duration': sum(secs for _, secs in self.statements),
+            'repeated': [{'statement': statement, 'times': times}
+                         for statement, times in self.repeated(threshold)],
+            'statements': [{'statement': statement, 'duration': secs}
+                           for statement, secs in self.statements],
+            'profile': self.stats(limit),
+        }
+
+
+_local = threading.local()
+_profiles = None
+_profiles_lock = threading.Lock()
+
+
+def recent_profiles():
+    """
+    Get the captured requests of this process, newest last.
+
+    :return: list of RequestProfile
+    """
+    with _profiles_lock:
+        return list(_profiles or ())
+
+
+def _keep(profile):
+    global _profiles
+    with _profiles_lock:
+        if _profiles is None:
+            _profiles = deque(maxlen=current_app.config['PROFILER_KEEP'])
+        _profiles.append(profile)
+
+
+def _wants_profile(config):
+    if request.blueprint == 'metrics':
+        return False
+    return config['PROFILER_ENABLED'] or (
+        config['PROFILER_ALLOW_HEADER']
+        and request.headers.get(PROFILE_HEADER, '0') not in ('', '0')
+    )
+
+
+def _start_request():
+    config = current_app.config
+    profiling = _wants_profile(config)
+    budget = config['QUERY_BUDGETS'].get(request.endpoint)
+    if not profiling and budget is None:
+        _local.capture = None
+        return
+
+    statements = capture_statements()
+    profile = None
+    if profiling:
+        profile = cProfile.Profile()
+        profile.enable()
+    _local.capture = (RequestProfile(profile, statements), profiling, budget)
+
+
+def _end_request(response):
+    capture = getattr(_local, 'capture', None)
+    if capture is None:
+        return response
+    _local.capture = None
+    captured, profiling, budget = capture
+    if captured.profile is not None:
+        captured.profile.disable()
+    captured.duration = time.perf_counter() - captured.started
+    captured.status = response.status_code
+
+    config = current_app.config
+    count = len(captured.statements)
+    if profiling:
+        repeated = captured.repeated(config['PROFILER_REPEAT_THRESHOLD'])
+        response.headers['X-Profile-Id'] = captured.id
+        response.headers['X-Query-Count'] = str(count)
+        response.headers['X-Repeated-Queries'] = str(len(repeated))
+        for statement, times in repeated:
+            logger.warning('Possible N+1 in %s, run %d times: %s',
+                           captured.endpoint, times,
+                           ' '.join(statement.split()))
+        _keep(captured)
+        if config['PROFILER_DIR']:
+            captured.profile.dump_stats(
+                os.path.join(config['PROFILER_DIR'], f'{captured.id}.prof'))
+
+    if budget is not None and count > budget:
+        message = (f'{captured.endpoint} ran {count} queries, '
+                   f'over its budget of {budget}')
+        if config['PROFILER_FAIL_ON_BUDGET']:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return response
+
+
+def _teardown_request(exc):
+    # after_request is skipped when an exception propagates out of the
+    # request (PROPAGATE_EXCEPTIONS, as under test or debug) or an earlier
+    # after_request function raised, stop profiling anyway
+    capture = getattr(_local, 'capture', None)
+    if capture is not None:
+        _local.capture = None
+        if capture[0].profile is not None:
+            capture[0].profile.disable()
+
+
+def init_profiler(app):
+    """
+    Capture the requests of app asked for, after init_metrics.
+    """
+    if app.config['PROFILER_DIR']:
+        os.makedirs(app.config['PROFILER_DIR'], exist_ok=True)
+    app.before_request(_start_request)
+    app.after_request(_end_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,97 @@
+import hmac
+
+from flask import Blueprint, abort, current_app, jsonify, request
+
+from yahtzee.logs import get_log_pipeline
+from yahtzee.metrics.profiler import recent_profiles
+from yahtzee.metrics.utils import render
+
+# create metrics Blueprint instance serving the metrics of this process
+metrics = Blueprint('metrics', __name__)
+
+# version of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def authorize(require_token=False):
+    """
+    Abort unless metrics are enabled and, with METRICS_TOKEN set, the client
+    sent it as a bearer token. With METRICS_REQUIRE_TOKEN or require_token
+    they are not served while no token is set.
+
+    :param require_token: never serve without a token, whatever the config
+    """
+    config = current_app.config
+    token = config['METRICS_TOKEN']
+    if not config['METRICS_ENABLED'] or (
+            (require_token or config['METRICS_REQUIRE_TOKEN']) and not token):
+        abort(404)
+    if token and not hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(403)
+
+
+@metrics.route("/metrics")
+def read_metrics():
+    """
+    This function responds to the browser URL localhost:5000/metrics with
+    the metrics of the worker answering, in the Prometheus text format.
+    With METRICS_TOKEN set, the scraper has to send it as a bearer token.
+
+    return:         the metrics as text/plain
+    """
+    authorize()
+
+    extra = []
+    pipeline = get_log_pipeline()
+    if pipeline is not None:
+        extra.append(('log_events_dropped_total', 'counter',
+                      'Log records dropped as the log queue was full.',
+                      pipeline.dropped))
+
+    return current_app.response_class(
+        render(extra), content_type=CONTENT_TYPE,
+        headers={'Cache-Control': 'no-store'}
+    )
+
+
+@metrics.route("/metrics/profiles")
+def read_profiles():
+    """
+    This function responds to the browser URL localhost:5000/metrics/profiles
+    with a summary of the requests profiled by the worker answering, newest
+    first, and the statements each one repeated. They hold the SQL of other
+    clients' requests, so they are only served with METRICS_TOKEN set.
+
+    return:         JSON list of profiles
+    """
+    authorize(require_token=True)
+    threshold = current_app.config['PROFILER_REPEAT_THRESHOLD']
+    summaries = []
+    for profile in reversed(recent_profiles()):
+        report = profile.report(threshold)
+        del report['statements'], report['profile']
+        summaries.append(report)
+    response = jsonify(summaries)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@metrics.route("/metrics/profiles/<profile_id>")
+def read_profile(profile_id):
+    """
+    This function responds to the browser URL
+    localhost:5000/metrics/profiles/<profile_id> with the statements and the
+    slowest functions (by cumulative time) of one profiled request, the id
+    sent back in its X-Profile-Id header.
+
+    return:         JSON profile, or 404 once it is no longer kept
+    """
+    authorize(require_token=True)
+    for profile in recent_profiles():
+        if profile.id == profile_id:
+            response = jsonify(profile.report(
+                current_app.config['PROFILER_REPEAT_THRESHOLD']))
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+    abort(404)
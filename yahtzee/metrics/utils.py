@@ -0,0 +1,303 @@
+"""
+This module collects the metrics served by /metrics in the Prometheus text
+format: latency histograms and status counts of every endpoint, the number
+and duration of the SQL queries of each request, and timers of the slow
+calls (bcrypt, profile pictures, mail).
+
+Recording takes no lock. Each thread adds to a shard of its own, found in a
+threading.local, and only rendering the metrics sums the shards under a lock;
+the shards of finished threads are then folded into one, so they do not pile
+up with short-lived threads.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# upper bounds (secs) of the buckets of duration histograms
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1, 2.5, 5, 10)
+# upper bounds of the buckets of the number of queries of a request
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# start times of the queries running on a connection, in connection.info
+QUERY_STARTED = 'metrics_query_started'
+
+
+class _Shard(object):
+    """
+    The samples recorded by one thread, by (metric, label values).
+    """
+    def __init__(self, thread):
+        self.thread = thread
+        self.values = {}
+
+    def merge(self, other):
+        # list() copies at once, while the thread of other may add keys
+        for key, value in list(other.values.items()):
+            mine = self.values.get(key)
+            if mine is None:
+                self.values[key] = list(value)
+            else:
+                for i, count in enumerate(value):
+                    mine[i] += count
+
+
+_local = threading.local()
+_shards = []
+_retired = _Shard(None)
+_shards_lock = threading.Lock()
+_metrics = []
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = _Shard(threading.current_thread())
+        with _shards_lock:
+            _shards.append(shard)
+        return shard
+
+
+class Counter(object):
+    """
+    A count going up, by label values.
+    """
+    kind = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        values = _shard().values
+        key = (self, label_values)
+        try:
+            values[key][0] += amount
+        except KeyError:
+            values[key] = [amount]
+
+    def samples(self, values):
+        for label_values, (count,) in values:
+            yield self.name, self.labels, label_values, count
+
+
+class Histogram(object):
+    """
+    Counts of observed values by bucket, with their sum, by label values.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(),
+                 buckets=DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        _metrics.append(self)
+
+    def observe(self, value, *label_values):
+        values = _shard().values
+        key = (self, label_values)
+        counts = values.get(key)
+        if counts is None:
+            # one count per bucket, then +Inf, then the sum
+            counts = values[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        """
+        Observe the duration of the with block.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self, values):
+        labels = self.labels + ('le',)
+        for label_values, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield (f'{self.name}_bucket', labels,
+                       label_values + (_format_value(bound),), cumulative)
+            yield f'{self.name}_sum', self.labels, label_values, counts[-1]
+            yield f'{self.name}_count', self.labels, label_values, cumulative
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Time to answer a request.',
+    ('blueprint', 'endpoint'))
+REQUESTS = Counter(
+    'http_requests_total', 'Requests answered, by status.',
+    ('blueprint', 'endpoint', 'status'))
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'SQL queries run by a request.',
+    ('endpoint',), QUERY_COUNT_BUCKETS)
+REQUEST_DB_DURATION = Histogram(
+    'http_request_db_duration_seconds', 'Time a request spent in SQL.',
+    ('endpoint',))
+QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'Time to run an SQL query.')
+BCRYPT_DURATION = Histogram(
+    'bcrypt_duration_seconds',
+    'Time to hash or check a password, waiting for the pool included.',
+    ('operation',))
+IMAGE_DURATION = Histogram(
+    'image_processing_duration_seconds',
+    'Time to save an uploaded profile picture in every size.')
+MAIL_DURATION = Histogram(
+    'mail_send_duration_seconds', 'Time to send an email over SMTP.')
+
+
+def _format_value(value):
+    return value if isinstance(value, str) else repr(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"') \
+        .replace('\n', r'\n')
+
+
+def collect():
+    """
+    Sum the samples of every thread.
+
+    :return: dict of metric to list of (label values, summed values)
+    """
+    with _shards_lock:
+        live = []
+        for shard in _shards:
+            if shard.thread.is_alive():
+                live.append(shard)
+            else:
+                _retired.merge(shard)
+        _shards[:] = live
+
+        total = _Shard(None)
+        for shard in live + [_retired]:
+            total.merge(shard)
+
+    by_metric = {metric: [] for metric in _metrics}
+    for (metric, label_values), values in sorted(
+            total.values.items(), key=lambda item: item[0][1]):
+        by_metric[metric].append((label_values, values))
+    return by_metric
+
+
+def render(extra=()):
+    """
+    Render every metric in the Prometheus text format.
+
+    :param extra: more (name, kind, description, value) metrics without
+        labels
+    :return: str
+    """
+    lines = []
+    for metric, values in collect().items():
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, label_values, value in metric.samples(values):
+            if labels:
+                pairs = ','.join(f'{label}="{_escape(label_value)}"'
+                                 for label, label_value
+                                 in zip(labels, label_values))
+                name = f'{name}{{{pairs}}}'
+            lines.append(f'{name} {_format_value(value)}')
+    for name, kind, description, value in extra:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _start_request():
+    # started, queries, secs in SQL, statements if captured
+    _local.request = [time.perf_counter(), 0, 0.0, None]
+
+
+def capture_statements():
+    """
+    Record the statements the current request runs from now on.
+
+    :return: list the (statement, secs) of each query are appended to, None
+        outside of a request
+    """
+    stats = getattr(_local, 'request', None)
+    if stats is None:
+        return None
+    stats[3] = []
+    return stats[3]
+
+
+def _end_request(response):
+    stats = getattr(_local, 'request', None)
+    if stats is None:
+        return response
+    _local.request = None
+
+    blueprint = request.blueprint or ''
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_DURATION.observe(time.perf_counter() - stats[0], blueprint,
+                             endpoint)
+    REQUESTS.inc(blueprint, endpoint, str(response.status_code))
+    REQUEST_QUERIES.observe(stats[1], endpoint)
+    REQUEST_DB_DURATION.observe(stats[2], endpoint)
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault(QUERY_STARTED, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    elapsed = time.perf_counter() - conn.info[QUERY_STARTED].pop()
+    QUERY_DURATION.observe(elapsed)
+    stats = getattr(_local, 'request', None)
+    if stats is not None:
+        stats[1] += 1
+        stats[2] += elapsed
+        if stats[3] is not None:
+            stats[3].append((statement, elapsed))
+
+
+def _handle_error(context):
+    started = context.connection.info.get(QUERY_STARTED) \
+        if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+_listening = False
+
+
+def init_metrics(app):
+    """
+    Time the requests of app, and the SQL queries of every engine.
+    """
+    global _listening
+    app.before_request(_start_request)
+    app.after_request(_end_request)
+
+    with _shards_lock:
+        if not _listening:
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+            _listening = True
@@ -5,13 +5,38 @@ This module contains the models for yahtzee. It also makes use of SQLAlchemy
 
 from datetime import datetime
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
-from yahtzee import db, ma, login_manager, app
+from flask import current_app
+from yahtzee import db, ma, login_manager
 from flask_login import UserMixin
+from sqlalchemy import DDL, event
+from yahtzee.database import supports_returning
+from yahtzee.rules import (
+    TOTAL_COLUMNS,
+    UPPER_BONUS,
+    UPPER_BONUS_THRESHOLD,
+    UPPER_CATEGORIES,
+    YAHTZEE,
+)
+from yahtzee.user_cache import (column_values, from_column_values,
+                                get_user_cache)
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    """
+    Load the user of a session, from the user cache of the worker when it
+    holds them, otherwise from the db.
+    """
+    user_id = int(user_id)
+    cache = get_user_cache()
+    values, generation = cache.get(user_id)
+    if values is not None:
+        return from_column_values(User, values)
+
+    user = User.query.get(user_id)
+    if user is not None:
+        cache.put(user_id, column_values(user), generation)
+    return user
 
 
 class UsersGames(db.Model):
@@ -21,33 +46,50 @@ class UsersGames(db.Model):
     UsersGames relationships: enables one-to-many between game and users
     """
     __tablename__ = "users_games"
+    # (user_id, grand_total_score) serves both the user_id join of the
+    # users_games relationship and per-user best score lookups
+    __table_args__ = (
+        db.Index(
+            'ix_users_games_user_id_grand_total_score',
+            'user_id',
+            'grand_total_score'
+        ),
+    )
     users_games_id = db.Column(db.Integer, nullable=False, primary_key=True)
-    ones = db.Column(db.Integer, nullable=False)
-    twos = db.Column(db.Integer, nullable=False)
-    threes = db.Column(db.Integer, nullable=False)
-    fours = db.Column(db.Integer, nullable=False)
-    fives = db.Column(db.Integer, nullable=False)
-    sixes = db.Column(db.Integer, nullable=False)
-    three_of_a_kind = db.Column(db.Integer, nullable=False)
-    four_of_a_kind = db.Column(db.Integer, nullable=False)
-    full_house = db.Column(db.Integer, nullable=False)
-    small_straight = db.Column(db.Integer, nullable=False)
-    large_straight = db.Column(db.Integer, nullable=False)
-    yahtzee = db.Column(db.Integer, nullable=False)
-    chance = db.Column(db.Integer, nullable=False)
-    yahtzee_bonus = db.Column(db.Integer, nullable=False)
-    top_score = db.Column(db.Integer, nullable=False)
-    top_bonus_score = db.Column(db.Integer, nullable=False)
-    top_bonus_score_delta = db.Column(db.Integer, nullable=False)
-    total_top_score = db.Column(db.Integer, nullable=False)
-    total_bottom_score = db.Column(db.Integer, nullable=False)
-    grand_total_score = db.Column(db.Integer, nullable=False)
+    # a category is NULL until it is scored, and is then scored once
+    ones = db.Column(db.Integer)
+    twos = db.Column(db.Integer)
+    threes = db.Column(db.Integer)
+    fours = db.Column(db.Integer)
+    fives = db.Column(db.Integer)
+    sixes = db.Column(db.Integer)
+    three_of_a_kind = db.Column(db.Integer)
+    four_of_a_kind = db.Column(db.Integer)
+    full_house = db.Column(db.Integer)
+    small_straight = db.Column(db.Integer)
+    large_straight = db.Column(db.Integer)
+    yahtzee = db.Column(db.Integer)
+    chance = db.Column(db.Integer)
+    yahtzee_bonus = db.Column(db.Integer, nullable=False, default=0)
+    top_score = db.Column(db.Integer, nullable=False, default=0)
+    top_bonus_score = db.Column(db.Integer, nullable=False, default=0)
+    top_bonus_score_delta = db.Column(
+        db.Integer, nullable=False, default=UPPER_BONUS_THRESHOLD
+    )
+    total_top_score = db.Column(db.Integer, nullable=False, default=0)
+    total_bottom_score = db.Column(db.Integer, nullable=False, default=0)
+    grand_total_score = db.Column(db.Integer, nullable=False, default=0)
     user_id = db.Column(
         db.Integer, db.ForeignKey('user.id'), nullable=False
     )
     game_id = db.Column(
-        db.Integer, db.ForeignKey('game.game_id'), nullable=False
+        db.Integer, db.ForeignKey('game.game_id'), nullable=False, index=True
     )
+    # set once when the game is over, the scorecard is then frozen
+    finished_at = db.Column(db.DateTime)
+    # bumped by every update, which only applies if it is unchanged
+    version_id = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version_id}
 
     def __repr__(self):
         return (
@@ -75,9 +117,118 @@ class UsersGames(db.Model):
             f"'{self.total_top_score}', "
             f"'{self.total_bottom_score}', "
             f"'{self.grand_total_score}', "
+            f"'{self.finished_at}', "
+            f"'{self.version_id}', "
             f")"
         )
 
+    @staticmethod
+    def best_for_user(user_id, limit=5):
+        """
+        Get the highest scoring games of a user.
+
+        :param user_id: id of the user
+        :param limit: maximum number of games to return (default 5)
+        :return: list of UsersGames, best grand total first
+        """
+        return UsersGames.query \
+            .filter(UsersGames.user_id == user_id) \
+            .order_by(UsersGames.grand_total_score.desc()) \
+            .limit(limit) \
+            .all()
+
+    @staticmethod
+    def set_score(users_games_id, category, score, versions=None,
+                  joker_score=None):
+        """
+        Score one category of a scorecard with a single UPDATE. Only the
+        totals depending on the category are recomputed, in SQL from the
+        values stored when the statement runs, so concurrent turns on one
+        scorecard never overwrite each other. A category is scored once, the
+        yahtzee bonus can only grow. Where the db runs UPDATE ... RETURNING
+        the new scores come back from the same statement. The caller commits.
+
+        :param users_games_id: id of the scorecard
+        :param category: one of SCORECARD_COLUMNS
+        :param score: new score of the category
+        :param versions: only update if version_id is one of these, for
+            If-Match; None to update any version
+        :param joker_score: score instead if the yahtzee box is filled, for
+            a yahtzee rolled as a joker; None if the roll is no joker
+        :return: dict of the category score, TOTAL_COLUMNS and version_id if
+            the scorecard was updated, None if it does not exist, is
+            finished, has another version, has the category scored or the
+            score conflicts with the yahtzee box
+        """
+        c = UsersGames.__table__.c
+        if joker_score is None:
+            score = db.literal(score)
+        else:
+            score = db.case([(c.yahtzee.isnot(None), joker_score)],
+                            else_=score)
+
+        # unscored categories count as 0 in the totals
+        if category == 'yahtzee_bonus':
+            delta = score - c.yahtzee_bonus
+        else:
+            delta = score
+        values = {category: score, 'version_id': c.version_id + 1}
+
+        # SQLite evaluates every SET expression against the old row
+        if category in UPPER_CATEGORIES:
+            top = c.top_score + delta
+            bonus = db.case(
+                [(top >= UPPER_BONUS_THRESHOLD, UPPER_BONUS)], else_=0
+            )
+            values.update(
+                top_score=top,
+                top_bonus_score=bonus,
+                top_bonus_score_delta=db.case(
+                    [(top >= UPPER_BONUS_THRESHOLD, 0)],
+                    else_=UPPER_BONUS_THRESHOLD - top
+                ),
+                total_top_score=top + bonus,
+                grand_total_score=c.grand_total_score - c.total_top_score
+                + top + bonus,
+            )
+        else:
+            values.update(
+                total_bottom_score=c.total_bottom_score + delta,
+                grand_total_score=c.grand_total_score + delta,
+            )
+
+        statement = UsersGames.__table__.update() \
+            .where(c.users_games_id == users_games_id) \
+            .where(c.finished_at.is_(None)) \
+            .values(values)
+
+        # bonus yahtzees need a yahtzee and only add up, every other
+        # category is scored once
+        if category == 'yahtzee_bonus':
+            statement = statement.where(c.yahtzee == YAHTZEE) \
+                .where(c.yahtzee_bonus < score)
+        else:
+            statement = statement.where(c[category].is_(None))
+        if versions is not None:
+            statement = statement.where(c.version_id.in_(versions))
+
+        columns = [c[category]] + [c[name] for name in TOTAL_COLUMNS] \
+            + [c.version_id]
+        if supports_returning(db.engine.dialect):
+            row = db.session.execute(
+                statement.returning(*columns)
+            ).first()
+        elif db.session.execute(statement).rowcount == 1:
+            # read the scores back in the same transaction, before other
+            # turns
+            row = db.session.execute(
+                db.select(columns)
+                .where(c.users_games_id == users_games_id)
+            ).first()
+        else:
+            row = None
+        return None if row is None else dict(row)
+
 
 class UsersGamesSchema(ma.SQLAlchemyAutoSchema):
     """
@@ -94,6 +245,10 @@ class User(db.Model, UserMixin):
     User model which defines the user attributes and SQLite3 db table/fields.
     """
     __tablename__ = "user"
+    # composite index backing the keyset pagination of user listings
+    __table_args__ = (
+        db.Index('ix_user_last_name_id', 'last_name', 'id'),
+    )
     id = db.Column(db.Integer, nullable=False, primary_key=True)
     username = db.Column(db.String(32), unique=True, nullable=False)
     password = db.Column(db.String(60), nullable=False)
@@ -103,7 +258,8 @@ class User(db.Model, UserMixin):
     image_file = db.Column(
                         db.String(20),
                         nullable=False,
-                        default='default.jpg'
+                        default='default.jpg',
+                        index=True
                         )
     timestamp = db.Column(
         db.DateTime,
@@ -111,11 +267,15 @@ class User(db.Model, UserMixin):
         onupdate=datetime.utcnow
         )
     users_games = db.relationship('UsersGames', backref='user', lazy=True)
+    # the ORM adds version_id to the WHERE of every UPDATE and bumps it, a
+    # concurrent change makes the commit fail with StaleDataError
+    version_id = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version_id}
 
     def __repr__(self):
         return (
             f"User('{self.id}', '{self.username}', '{self.first_name}', "
-            f"'{self.last_name}', '{self.email}')"
+            f"'{self.last_name}', '{self.email}', '{self.version_id}')"
         )
 
     def get_reset_token(self, expires_sec=1800):
@@ -125,7 +285,7 @@ class User(db.Model, UserMixin):
         :param expires_sec: expiration time for token (default 1800 secs)
         :return: token
         """
-        s = Serializer(app.config['SECRET_KEY'], expires_sec)
+        s = Serializer(current_app.config['SECRET_KEY'], expires_sec)
         return s.dumps({'user_id': self.id}).decode('utf-8')
 
     @staticmethod
@@ -136,13 +296,46 @@ class User(db.Model, UserMixin):
         :param token: a token
         :return: user
         """
-        s = Serializer(app.config['SECRET_KEY'])
+        s = Serializer(current_app.config['SECRET_KEY'])
         try:
             user_id = s.loads(token)['user_id']
         except:
             return None
         return User.query.get(user_id)
 
+    @staticmethod
+    def taken(username=None, email=None, exclude_id=None):
+        """
+        Check if a username and an email are used, with one query on their
+        unique indexes.
+
+        :param username: username to look for, None to skip
+        :param email: email to look for, None to skip
+        :param exclude_id: id of a user whose own username and email count
+            as free, e.g. the user updating their account
+        :return: set of the fields taken, of 'username' and 'email'
+        """
+        conditions = []
+        if username is not None:
+            conditions.append(User.username == username)
+        if email is not None:
+            conditions.append(User.email == email)
+        if not conditions:
+            return set()
+
+        query = db.session.query(User.username, User.email) \
+            .filter(db.or_(*conditions))
+        if exclude_id is not None:
+            query = query.filter(User.id != exclude_id)
+
+        taken = set()
+        for row in query.limit(2):
+            if username is not None and row.username == username:
+                taken.add('username')
+            if email is not None and row.email == email:
+                taken.add('email')
+        return taken
+
 
 class UserSchema(ma.SQLAlchemyAutoSchema):
     """
@@ -152,6 +345,8 @@ class UserSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = User
         sqla_session = db.session
+        # never send password hashes back, e.g. in a 409 with the current user
+        load_only = ('password',)
 
 
 class Game(db.Model):
@@ -162,11 +357,27 @@ class Game(db.Model):
     game_id = db.Column(db.Integer, nullable=False, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     users_games = db.relationship('UsersGames', backref='game', lazy=True)
+    # optimistic lock, as on UsersGames and User, also bumped by every turn
+    # and finish of the game's scorecards
+    version_id = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version_id}
 
     def __repr__(self):
         return f"Game('{self.game_id}', '{self.timestamp}'"
 
 
+# a new version of a scorecard is a new version of its game, so an If-Match
+# on the game detects the concurrent turns of all its players; on SQLite a
+# trigger bumps it, whichever statement wrote the scorecard
+event.listen(UsersGames.__table__, 'after_create', DDL(
+    'CREATE TRIGGER users_games_game_version '
+    'AFTER UPDATE OF version_id ON users_games '
+    'WHEN NEW.version_id != OLD.version_id BEGIN '
+    'UPDATE game SET version_id = version_id + 1 '
+    'WHERE game_id = NEW.game_id; END'
+).execute_if(dialect='sqlite'))
+
+
 class GameSchema(ma.SQLAlchemyAutoSchema):
     """
     This game schema inherets from SQLAlchemyAutoSchema and uses the Meta
@@ -175,3 +386,142 @@ class GameSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Game
         sqla_session = db.session
+
+
+class UserStats(db.Model):
+    """
+    UserStats model which aggregates the finished games of a user. A row is
+    updated incrementally as each of the user's games is finished, so the
+    leaderboard never aggregates users_games.
+    """
+    __tablename__ = "user_stats"
+    user_id = db.Column(
+        db.Integer, db.ForeignKey('user.id'), nullable=False, primary_key=True
+    )
+    games_played = db.Column(db.Integer, nullable=False, default=0)
+    best_score = db.Column(db.Integer, nullable=False, default=0)
+    total_score = db.Column(db.Integer, nullable=False, default=0)
+    yahtzees = db.Column(db.Integer, nullable=False, default=0)
+    user = db.relationship('User', lazy=True)
+
+    @property
+    def mean_score(self):
+        return self.total_score / self.games_played \
+            if self.games_played else 0
+
+    def __repr__(self):
+        return (
+            f"UserStats('{self.user_id}', '{self.games_played}', "
+            f"'{self.best_score}', '{self.total_score}', '{self.yahtzees}')"
+        )
+
+
+# leaderboard order: best score first, the earlier user first on a tie
+db.Index(
+    'ix_user_stats_best_score_user_id',
+    UserStats.best_score.desc(),
+    UserStats.user_id
+)
+
+
+class BestScoreCount(db.Model):
+    """
+    BestScoreCount model which counts the users having each best score. It
+    has at most one row per possible grand total, so the leaderboard loads
+    its rank tree from it without reading user_stats.
+    """
+    __tablename__ = "best_score_count"
+    best_score = db.Column(db.Integer, nullable=False, primary_key=True,
+                           autoincrement=False)
+    users = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"BestScoreCount('{self.best_score}', '{self.users}')"
+
+
+class OutboxMessage(db.Model):
+    """
+    OutboxMessage model which defines an email waiting in the db for the
+    outbox worker to send it. Messages are added in the same transaction as
+    the change that caused them, so none are lost if the SMTP server is down.
+    """
+    __tablename__ = "outbox"
+    # pending messages are fetched in order of their next attempt
+    __table_args__ = (
+        db.Index('ix_outbox_status_next_attempt_at',
+                 'status', 'next_attempt_at'),
+    )
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    id = db.Column(db.Integer, nullable=False, primary_key=True)
+    subject = db.Column(db.String(120), nullable=False)
+    sender = db.Column(db.String(120), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default=PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, nullable=False,
+                                default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    # token of the drain that claimed the message, next_attempt_at then
+    # holds the end of its lease
+    claimed_by = db.Column(db.String(32))
+
+    def __repr__(self):
+        return (
+            f"OutboxMessage('{self.id}', '{self.recipient}', "
+            f"'{self.subject}', '{self.status}', '{self.attempts}')"
+        )
+
+
+class TableVersion(db.Model):
+    """
+    TableVersion model which counts the writes to a table, a cheap validator
+    for conditional GETs of listings. On SQLite, triggers bump the row of a
+    tracked table on every insert, update and delete, whoever writes.
+    """
+    __tablename__ = "table_version"
+    name = db.Column(db.String(32), nullable=False, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+
+    def __repr__(self):
+        return (
+            f"TableVersion('{self.name}', '{self.version}', "
+            f"'{self.changed_at}')"
+        )
+
+
+def track_table_version(table):
+    """
+    Create the table_version row of a table and its triggers along with the
+    tables, on SQLite. Other databases have no row, so no validator.
+
+    :param table: sqlalchemy Table to track
+    """
+    # % is escaped for the DDL string formatting
+    bump = (
+        f"UPDATE table_version SET version = version + 1, "
+        f"changed_at = strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now') "
+        f"WHERE name = '{table.name}';"
+    )
+    for operation in ('INSERT', 'UPDATE', 'DELETE'):
+        event.listen(table, 'after_create', DDL(
+            f'CREATE TRIGGER {table.name}_version_{operation.lower()} '
+            f'AFTER {operation} ON "{table.name}" BEGIN {bump} END'
+        ).execute_if(dialect='sqlite'))
+    event.listen(TableVersion.__table__, 'after_create', DDL(
+        f"INSERT INTO table_version (name, version, changed_at) "
+        f"VALUES ('{table.name}', 0, "
+        f"strftime('%%Y-%%m-%%d %%H:%%M:%%f', 'now'))"
+    ).execute_if(dialect='sqlite'))
+
+
+# user listings are revalidated against the version of the user table
+track_table_version(User.__table__)
@@ -0,0 +1,188 @@
+"""
+This module delivers the emails queued in the outbox table. The worker claims
+a batch of due messages, sends them over one reused SMTP connection, and
+reschedules failures with exponential backoff until MAIL_OUTBOX_MAX_ATTEMPTS.
+
+Several workers can drain the outbox at once. A batch is claimed by an
+UPDATE, committed before anything is sent, that tags the due messages with a
+token of the drain, counts an attempt and pushes their next_attempt_at
+MAIL_OUTBOX_LEASE seconds ahead; a message already claimed by another drain
+is no longer due, so it is neither matched by the UPDATE nor sent twice. As
+the attempt is counted up front, a message whose drain died before recording
+the outcome is given up on like any other once its attempts run out.
+"""
+
+import smtplib
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_mail import Message
+
+from yahtzee import db, mail
+from yahtzee.metrics.utils import MAIL_DURATION
+from yahtzee.models import OutboxMessage
+
+# errors that only concern one message, the connection is still usable
+MESSAGE_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+)
+
+
+def queue_message(subject, recipient, body, sender='noreply@demo.com'):
+    """
+    Add an email to the outbox in the current db session. It is sent once
+    the caller commits, and never if the caller rolls back.
+
+    :return: the OutboxMessage
+    """
+    message = OutboxMessage(
+        subject=subject,
+        sender=sender,
+        recipient=recipient,
+        body=body
+    )
+    db.session.add(message)
+    return message
+
+
+def _schedule_retry(message, error, now):
+    """
+    Record the error of a failed attempt, counted by claim_batch, and
+    schedule the next one with backoff.
+    """
+    config = current_app.config
+    message.last_error = str(error)[:255]
+
+    if message.attempts >= config['MAIL_OUTBOX_MAX_ATTEMPTS']:
+        message.status = OutboxMessage.FAILED
+        return
+
+    delay = min(
+        config['MAIL_OUTBOX_BACKOFF'] * 2 ** (message.attempts - 1),
+        config['MAIL_OUTBOX_BACKOFF_MAX']
+    )
+    message.next_attempt_at = now + timedelta(seconds=delay)
+
+
+def claim_batch(batch_size, now):
+    """
+    Claim up to batch_size due messages for this drain and count an attempt
+    of each, committing the claim.
+
+    :return: list of the claimed OutboxMessage, next attempt first
+    """
+    due = (OutboxMessage.status == OutboxMessage.PENDING,
+           OutboxMessage.next_attempt_at <= now)
+    ids = [message_id for message_id, in db.session.query(OutboxMessage.id)
+           .filter(*due)
+           .order_by(OutboxMessage.next_attempt_at)
+           .limit(batch_size)]
+    if not ids:
+        return []
+
+    # only the messages still due when the UPDATE runs are claimed, those
+    # another drain claimed since the SELECT are left to it
+    token = uuid.uuid4().hex
+    lease = timedelta(seconds=current_app.config['MAIL_OUTBOX_LEASE'])
+    db.session.query(OutboxMessage) \
+        .filter(OutboxMessage.id.in_(ids), *due) \
+        .update({OutboxMessage.claimed_by: token,
+                 OutboxMessage.next_attempt_at: now + lease,
+                 OutboxMessage.attempts: OutboxMessage.attempts + 1},
+                synchronize_session=False)
+    db.session.commit()
+
+    return OutboxMessage.query \
+        .filter(OutboxMessage.id.in_(ids)) \
+        .filter(OutboxMessage.claimed_by == token) \
+        .order_by(OutboxMessage.id) \
+        .all()
+
+
+def drain_outbox(batch_size=None):
+    """
+    Claim one batch of due outbox messages and send it over a single SMTP
+    connection. Must be called inside an app context.
+
+    :param batch_size: max messages to send (default MAIL_OUTBOX_BATCH_SIZE)
+    :return: number of messages sent
+    """
+    batch_size = batch_size or current_app.config['MAIL_OUTBOX_BATCH_SIZE']
+    now = datetime.utcnow()
+
+    batch = claim_batch(batch_size, now)
+    if not batch:
+        return 0
+
+    # attempts whose drain died before recording them are failures too
+    max_attempts = current_app.config['MAIL_OUTBOX_MAX_ATTEMPTS']
+    for message in batch:
+        if message.attempts > max_attempts:
+            message.status = OutboxMessage.FAILED
+    unsent = [message for message in batch
+              if message.status == OutboxMessage.PENDING]
+
+    sent = 0
+    try:
+        with mail.connect() as connection:
+            while unsent:
+                message = unsent[0]
+                try:
+                    with MAIL_DURATION.time():
+                        connection.send(Message(
+                            message.subject,
+                            sender=message.sender,
+                            recipients=[message.recipient],
+                            body=message.body
+                        ))
+                except MESSAGE_ERRORS as e:
+                    _schedule_retry(message, e, now)
+                except (smtplib.SMTPException, OSError):
+                    raise
+                # e.g. a message that cannot be built or encoded, it must
+                # not hold up the others
+                except Exception as e:
+                    current_app.logger.exception('Outbox message %s failed',
+                                                 message.id)
+                    _schedule_retry(message, e, now)
+                else:
+                    message.status = OutboxMessage.SENT
+                    message.sent_at = datetime.utcnow()
+                    sent += 1
+                unsent.pop(0)
+
+    # the connection failed, retry everything not attempted yet later on
+    except (smtplib.SMTPException, OSError) as e:
+        for message in unsent:
+            _schedule_retry(message, e, now)
+
+    db.session.commit()
+    return sent
+
+
+def run_worker(app, stop=None):
+    """
+    Drain the outbox until stop is set, polling every
+    MAIL_OUTBOX_POLL_INTERVAL seconds while there is nothing due.
+
+    :param app: Flask app to run in the context of
+    :param stop: threading.Event ending the loop (default: run forever)
+    """
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        with app.app_context():
+            try:
+                sent = drain_outbox()
+            except Exception:
+                db.session.rollback()
+                current_app.logger.exception('Outbox drain failed')
+                sent = 0
+            interval = current_app.config['MAIL_OUTBOX_POLL_INTERVAL']
+
+        # after sending something check again straight away for more
+        if not sent:
+            stop.wait(interval)
@@ -0,0 +1,148 @@
+"""
+This module contains keyset (cursor based) pagination for listings. Pages are
+fetched with a WHERE clause on the ordering columns instead of an OFFSET, so
+the cost of a page stays the same no matter how deep into the table it is.
+"""
+
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+# cursor directions: fetch the page after or before the encoded key
+NEXT = 'n'
+PREV = 'p'
+
+
+class Page(object):
+    """
+    A page of results and the opaque cursors to the adjacent pages.
+    """
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def encode_cursor(direction, key):
+    """
+    Encode a direction and key into an opaque url-safe cursor.
+
+    :param direction: NEXT or PREV
+    :param key: tuple of ordering column values
+    :return: cursor string
+    """
+    payload = json.dumps([direction] + list(key), separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')) \
+        .decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, key_length):
+    """
+    Decode a cursor created by encode_cursor.
+
+    :param cursor: cursor string
+    :param key_length: number of ordering columns the key must contain
+    :return: (direction, key) tuple
+    :raises ValueError: if the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+    if not isinstance(payload, list) or len(payload) != key_length + 1 \
+            or payload[0] not in (NEXT, PREV):
+        raise ValueError(f'Invalid cursor: {cursor}')
+
+    return payload[0], tuple(payload[1:])
+
+
+def _after(columns, key):
+    """
+    Build the row-value comparison (columns) > (key). The leading column is
+    bounded on its own (c0 >= v0 AND ...) so that the planner can turn the
+    condition into a range search on a composite index on every backend.
+    """
+    column, value = columns[0], key[0]
+    if len(columns) == 1:
+        return column > value
+    return and_(
+        column >= value,
+        or_(column > value, _after(columns[1:], key[1:]))
+    )
+
+
+def _before(columns, key):
+    """
+    Build the row-value comparison (columns) < (key), see _after.
+    """
+    column, value = columns[0], key[0]
+    if len(columns) == 1:
+        return column < value
+    return and_(
+        column <= value,
+        or_(column < value, _before(columns[1:], key[1:]))
+    )
+
+
+def paginate(query, columns, cursor=None, per_page=20):
+    """
+    Fetch one page of query ordered by columns, starting from cursor.
+
+    The last column must be unique (e.g. the primary key) so that the
+    ordering is total and no row is skipped or repeated between pages.
+
+    :param query: SQLAlchemy query to paginate, without an order_by
+    :param columns: list of ordering columns, e.g. [User.last_name, User.id]
+    :param cursor: cursor from a previous Page, or None for the first page
+    :param per_page: maximum number of items in the page
+    :return: Page
+    :raises ValueError: if the cursor is malformed
+    """
+    direction, key = NEXT, None
+    if cursor:
+        direction, key = decode_cursor(cursor, len(columns))
+
+    # fetch one extra row to find out if there is a page beyond this one
+    if direction == NEXT:
+        if key is not None:
+            query = query.filter(_after(columns, key))
+        query = query.order_by(*[c.asc() for c in columns])
+    else:
+        query = query.filter(_before(columns, key))
+        query = query.order_by(*[c.desc() for c in columns])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+
+    if direction == PREV:
+        items.reverse()
+
+    if not items:
+        return Page(items)
+
+    def key_of(item):
+        return tuple(getattr(item, c.key) for c in columns)
+
+    if direction == NEXT:
+        next_cursor = encode_cursor(NEXT, key_of(items[-1])) \
+            if has_more else None
+        prev_cursor = encode_cursor(PREV, key_of(items[0])) \
+            if key is not None else None
+    else:
+        next_cursor = encode_cursor(NEXT, key_of(items[-1]))
+        prev_cursor = encode_cursor(PREV, key_of(items[0])) \
+            if has_more else None
+
+    return Page(items, next_cursor, prev_cursor)
@@ -0,0 +1,133 @@
+"""
+This module rate limits costly requests, such as logins (a bcrypt check each)
+and password reset requests (an email each), with token buckets keyed by
+client address, by account from that address and by account from anywhere.
+A request over any limit is refused with a 429 and a Retry-After header
+before any of that work is done. The account bucket caps the attempts on an
+account however many addresses make them, and is kept more lenient than the
+one of each address, so one client going over its limit does not lock the
+owner of the account out from elsewhere.
+
+Buckets live in the store named by RATELIMIT_STORE. MemoryStore keeps them in
+the worker; a store shared by every worker only needs the same hit method.
+"""
+
+import math
+import threading
+import time
+from itertools import islice
+
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.utils import import_string
+
+from yahtzee import app_extension
+
+
+class RateLimited(TooManyRequests):
+    """
+    Raised when a request is over a rate limit. The errors blueprint renders
+    it as a 429 with a Retry-After header.
+    """
+    description = 'Too many attempts. Please wait a moment and try again.'
+
+    def __init__(self, retry_after):
+        super().__init__()
+        self.retry_after = retry_after
+
+
+class MemoryStore(object):
+    """
+    Token buckets held in a dict of key to (tokens, updated at, full at). A
+    bucket that has refilled is the same as no bucket, so entries expire
+    lazily: they are replaced when next hit, and swept once the store holds
+    more than max_keys, dropping the least recently hit if still too many.
+    """
+    def __init__(self, max_keys=100000):
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def hit(self, key, capacity, period, now=None):
+        """
+        Take a token from the bucket of key, which holds capacity tokens and
+        refills completely in period seconds.
+
+        :return: 0 if a token was taken, else seconds until one is available
+        """
+        if now is None:
+            now = time.monotonic()
+        rate = capacity / period
+        with self._lock:
+            # pop and reinsert to keep the dict in order of last hit
+            bucket = self._buckets.pop(key, None)
+            if bucket is None or bucket[2] <= now:
+                tokens = capacity
+            else:
+                tokens = bucket[0] + (now - bucket[1]) * rate
+
+            taken = tokens >= 1
+            if taken:
+                tokens -= 1
+            self._buckets[key] = (tokens, now,
+                                  now + (capacity - tokens) / rate)
+            if len(self._buckets) > self._max_keys:
+                self._sweep(now)
+            return 0 if taken else (1 - tokens) / rate
+
+    def _sweep(self, now):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if bucket[2] > now}
+        excess = len(self._buckets) - self._max_keys
+        for key in list(islice(self._buckets, max(excess, 0))):
+            del self._buckets[key]
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+def get_store():
+    """
+    Get the rate limit store of the current app, creating it from its config.
+    """
+    return app_extension('ratelimit_store', lambda app: import_string(
+        app.config['RATELIMIT_STORE'])(app.config['RATELIMIT_STORE_MAX_KEYS']))
+
+
+def limit(scope, account=None):
+    """
+    Count a request against the limits of scope, by client address and, when
+    given, by account from that address and by account. Limits come from
+    app.config['RATELIMIT_' + scope], kinds it has no limit for are not
+    counted.
+
+    :param scope: name of the limited action, e.g. 'LOGIN'
+    :param account: identifier of the targeted account, e.g. an email
+    :raises RateLimited: if the request is over a limit
+    """
+    config = current_app.config
+    if not config['RATELIMIT_ENABLED']:
+        return
+
+    limits = config['RATELIMIT_' + scope]
+    address = request.remote_addr or ''
+    keys = [('ip', address)]
+    if account:
+        account = account.strip().lower()
+        # the narrowest bucket first, a client refused by its own does not
+        # use up the shared bucket of the account
+        keys.extend((('account_ip', f'{account}:{address}'),
+                     ('account', account)))
+
+    store = get_store()
+    for kind, value in keys:
+        if kind not in limits:
+            continue
+        capacity, period = limits[kind]
+        retry_after = store.hit(f'{scope}:{kind}:{value}', capacity, period)
+        if retry_after:
+            raise RateLimited(math.ceil(retry_after))
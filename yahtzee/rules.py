@@ -0,0 +1,41 @@
+"""
+This module holds the rules of Yahtzee as plain constants: the categories,
+the scorecard and total columns named as the UsersGames columns, and the fixed
+scores and bonuses. The models import them from here, so loading the app does
+not load NumPy and the score tables of yahtzee.scoring.
+"""
+
+UPPER_CATEGORIES = ('ones', 'twos', 'threes', 'fours', 'fives', 'sixes')
+LOWER_CATEGORIES = (
+    'three_of_a_kind',
+    'four_of_a_kind',
+    'full_house',
+    'small_straight',
+    'large_straight',
+    'yahtzee',
+    'chance',
+)
+CATEGORIES = UPPER_CATEGORIES + LOWER_CATEGORIES
+
+# columns of a scorecard matrix and of the totals derived from it, named as
+# the UsersGames columns
+SCORECARD_COLUMNS = CATEGORIES + ('yahtzee_bonus',)
+TOTAL_COLUMNS = (
+    'top_score',
+    'top_bonus_score',
+    'top_bonus_score_delta',
+    'total_top_score',
+    'total_bottom_score',
+    'grand_total_score',
+)
+
+UPPER_BONUS_THRESHOLD = 63
+UPPER_BONUS = 35
+FULL_HOUSE = 25
+SMALL_STRAIGHT = 30
+LARGE_STRAIGHT = 40
+YAHTZEE = 50
+YAHTZEE_BONUS = 100
+
+# at most 12 extra yahtzees fit in the 12 other categories of a game
+MAX_YAHTZEE_BONUS = 12 * YAHTZEE_BONUS
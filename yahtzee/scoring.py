@@ -0,0 +1,271 @@
+"""
+This module scores Yahtzee with NumPy. score_rolls scores every category for
+N rolls of five dice in one vectorized pass, and score_totals derives the
+total and bonus columns of N UsersGames scorecards. Together they validate
+submitted scores and recompute stored totals in bulk. score_roll is a plain
+Python reference of the same rules.
+
+An extra yahtzee rolled once the yahtzee box is filled is a joker: scored in
+the lower section, it counts as a full house and as both straights.
+
+There are only 6**5 possible rolls, so their scores are computed once into
+SCORE_TABLE and score_rolls is a single gather from it by roll code.
+"""
+
+from collections import Counter
+
+import numpy as np
+
+from yahtzee.rules import (  # noqa: F401
+    CATEGORIES,
+    FULL_HOUSE,
+    LARGE_STRAIGHT,
+    LOWER_CATEGORIES,
+    MAX_YAHTZEE_BONUS,
+    SCORECARD_COLUMNS,
+    SMALL_STRAIGHT,
+    TOTAL_COLUMNS,
+    UPPER_BONUS,
+    UPPER_BONUS_THRESHOLD,
+    UPPER_CATEGORIES,
+    YAHTZEE,
+    YAHTZEE_BONUS,
+)
+
+FACES = np.arange(1, 7)
+
+# a roll's code reads its dice minus one as a base 6 number, first die lowest
+POWERS = 6 ** np.arange(5)
+
+
+def _check_dice(dice):
+    dice = np.asarray(dice)
+    if dice.ndim != 2 or dice.shape[1] != 5:
+        raise ValueError(f'Expected an (N, 5) array of dice, '
+                         f'got shape {dice.shape}')
+    if dice.size and (dice.min() < 1 or dice.max() > 6):
+        raise ValueError('Dice values must be between 1 and 6')
+    return dice
+
+
+def roll_codes(dice):
+    """
+    Number each roll in [0, 6**5).
+
+    :param dice: integer array of shape (N, 5) with values 1-6
+    :return: int array of shape (N,)
+    :raises ValueError: if dice is not N rolls of five valid dice
+    """
+    return _check_dice(dice) @ POWERS - POWERS.sum()
+
+
+def face_counts(dice):
+    """
+    Count the faces of each roll.
+
+    :param dice: integer array of shape (N, 5) with values 1-6
+    :return: array of shape (N, 6), column f-1 counts the dice showing f
+    :raises ValueError: if dice is not N rolls of five valid dice
+    """
+    dice = _check_dice(dice)
+
+    # offset each roll into its own block of 6 bins, then count all at once
+    n = dice.shape[0]
+    bins = (dice - 1) + 6 * np.arange(n)[:, None]
+    return np.bincount(bins.ravel(), minlength=6 * n).reshape(n, 6)
+
+
+def _score_counts(counts):
+    """
+    Score every category from the face counts of rolls.
+
+    :param counts: array of shape (N, 6) from face_counts
+    :return: int16 array of shape (N, 13), columns in CATEGORIES order
+    """
+    totals = counts @ FACES
+    most = counts.max(axis=1)
+    present = counts > 0
+
+    scores = np.zeros((counts.shape[0], len(CATEGORIES)), dtype=np.int16)
+    scores[:, :6] = counts * FACES
+    scores[:, 6] = np.where(most >= 3, totals, 0)
+    scores[:, 7] = np.where(most >= 4, totals, 0)
+    scores[:, 8] = np.where(
+        (counts == 3).any(axis=1) & (counts == 2).any(axis=1), FULL_HOUSE, 0)
+    scores[:, 9] = np.where(
+        present[:, 0:4].all(axis=1)
+        | present[:, 1:5].all(axis=1)
+        | present[:, 2:6].all(axis=1),
+        SMALL_STRAIGHT, 0)
+    scores[:, 10] = np.where(
+        present[:, 0:5].all(axis=1) | present[:, 1:6].all(axis=1),
+        LARGE_STRAIGHT, 0)
+    scores[:, 11] = np.where(most == 5, YAHTZEE, 0)
+    scores[:, 12] = totals
+    return scores
+
+
+# scores of every possible roll, row i holds the scores of the roll coded i
+SCORE_TABLE = _score_counts(face_counts(
+    np.arange(6 ** 5)[:, None] // POWERS % 6 + 1
+))
+SCORE_TABLE.setflags(write=False)
+
+# every score a scorecard column can hold, 0 being a scratch
+SCORE_OPTIONS = dict(
+    {category: frozenset(SCORE_TABLE[:, i].tolist()) | {0}
+     for i, category in enumerate(CATEGORIES)},
+    yahtzee_bonus=frozenset(range(0, MAX_YAHTZEE_BONUS + 1, YAHTZEE_BONUS)),
+)
+
+# highest grand total a scorecard can reach
+MAX_GRAND_TOTAL = sum(max(options) for options in SCORE_OPTIONS.values()) \
+    + UPPER_BONUS
+
+
+# the columns a joker scores at their fixed value
+JOKER_SCORES = {
+    CATEGORIES.index('full_house'): FULL_HOUSE,
+    CATEGORIES.index('small_straight'): SMALL_STRAIGHT,
+    CATEGORIES.index('large_straight'): LARGE_STRAIGHT,
+}
+
+
+def score_of(category, dice, joker=False):
+    """
+    Score one roll in one category.
+
+    :param category: one of CATEGORIES
+    :param dice: sequence of five values 1-6
+    :param joker: whether the yahtzee box is filled, making a yahtzee a joker
+    :return: score as int
+    :raises ValueError: if the category or dice are not valid
+    """
+    if category not in CATEGORIES:
+        raise ValueError(f'{category} is not scored from dice')
+    scores = score_rolls([dice], joker)
+    return int(scores[0, CATEGORIES.index(category)])
+
+
+def score_rolls(dice, joker=False):
+    """
+    Score every category for every roll.
+
+    :param dice: integer array of shape (N, 5) with values 1-6
+    :param joker: bool, or bool array of shape (N,), whether the yahtzee box
+        of each roll's scorecard is filled, making a yahtzee a joker
+    :return: int16 array of shape (N, 13), columns in CATEGORIES order
+    :raises ValueError: if dice is not N rolls of five valid dice
+    """
+    scores = SCORE_TABLE[roll_codes(dice)]
+    if not np.any(joker):
+        return scores
+
+    jokers = np.broadcast_to(joker, scores.shape[:1]) \
+        & (scores[:, CATEGORIES.index('yahtzee')] == YAHTZEE)
+    for column, score in JOKER_SCORES.items():
+        scores[jokers, column] = score
+    return scores
+
+
+def score_totals(scorecards):
+    """
+    Derive the total and bonus columns of scorecards.
+
+    :param scorecards: integer array of shape (N, 14), SCORECARD_COLUMNS order
+    :return: int array of shape (N, 6), TOTAL_COLUMNS order
+    """
+    scorecards = np.asarray(scorecards, dtype=np.int64)
+    if scorecards.ndim != 2 or scorecards.shape[1] != len(SCORECARD_COLUMNS):
+        raise ValueError(f'Expected an (N, {len(SCORECARD_COLUMNS)}) array '
+                         f'of scorecards, got shape {scorecards.shape}')
+
+    top = scorecards[:, :6].sum(axis=1)
+    bonus = np.where(top >= UPPER_BONUS_THRESHOLD, UPPER_BONUS, 0)
+    total_top = top + bonus
+    total_bottom = scorecards[:, 6:].sum(axis=1)
+
+    return np.column_stack((
+        top,
+        bonus,
+        np.maximum(0, UPPER_BONUS_THRESHOLD - top),
+        total_top,
+        total_bottom,
+        total_top + total_bottom,
+    ))
+
+
+def valid_scores(scorecards):
+    """
+    Check each category score could have been scored by some roll.
+
+    :param scorecards: integer array of shape (N, 14), SCORECARD_COLUMNS order
+    :return: bool array of shape (N, 14), False where a score is impossible
+    """
+    cards = np.asarray(scorecards, dtype=np.int64)
+    valid = np.zeros(cards.shape, dtype=bool)
+
+    # upper section: face times the number of dice showing it
+    upper = cards[:, :6]
+    valid[:, :6] = (upper >= 0) & (upper <= 5 * FACES) & (upper % FACES == 0)
+
+    # sums of five dice, or a scratch
+    for column in (6, 7, 12):
+        valid[:, column] = (cards[:, column] == 0) \
+            | ((cards[:, column] >= 5) & (cards[:, column] <= 30))
+
+    # fixed scores, or a scratch
+    for column, score in ((8, FULL_HOUSE), (9, SMALL_STRAIGHT),
+                          (10, LARGE_STRAIGHT), (11, YAHTZEE)):
+        valid[:, column] = (cards[:, column] == 0) \
+            | (cards[:, column] == score)
+
+    # bonus yahtzees only count once the yahtzee box holds a yahtzee
+    bonus = cards[:, 13]
+    valid[:, 13] = (bonus >= 0) & (bonus <= MAX_YAHTZEE_BONUS) \
+        & (bonus % YAHTZEE_BONUS == 0) \
+        & ((bonus == 0) | (cards[:, 11] == YAHTZEE))
+    return valid
+
+
+def validate_scorecards(scorecards, totals):
+    """
+    Check submitted scorecards hold possible scores and consistent totals.
+
+    :param scorecards: integer array of shape (N, 14), SCORECARD_COLUMNS order
+    :param totals: integer array of shape (N, 6), TOTAL_COLUMNS order
+    :return: bool array of shape (N,), True where the scorecard is valid
+    """
+    return valid_scores(scorecards).all(axis=1) \
+        & (score_totals(scorecards) == np.asarray(totals)).all(axis=1)
+
+
+def score_roll(dice, joker=False):
+    """
+    Score every category for one roll, one die at a time. This is the plain
+    Python reference for score_rolls.
+
+    :param dice: sequence of five values 1-6
+    :param joker: whether the yahtzee box is filled, making a yahtzee a joker
+    :return: tuple of 13 scores in CATEGORIES order
+    """
+    counts = Counter(dice)
+    total = sum(dice)
+    most = max(counts.values())
+    faces = set(dice)
+    joker = joker and most == 5
+
+    small = joker or any(set(run) <= faces
+                         for run in ((1, 2, 3, 4), (2, 3, 4, 5), (3, 4, 5, 6)))
+    large = joker or faces in ({1, 2, 3, 4, 5}, {2, 3, 4, 5, 6})
+    full_house = joker or sorted(counts.values()) == [2, 3]
+
+    return tuple(face * counts[face] for face in range(1, 7)) + (
+        total if most >= 3 else 0,
+        total if most >= 4 else 0,
+        FULL_HOUSE if full_house else 0,
+        SMALL_STRAIGHT if small else 0,
+        LARGE_STRAIGHT if large else 0,
+        YAHTZEE if most == 5 else 0,
+        total,
+    )
@@ -0,0 +1,173 @@
+"""
+This module serializes rows for the REST API without going through
+Marshmallow for every row. A RowSerializer reads the dump fields of a
+Marshmallow schema once and builds a function making the same dict from a row
+tuple of the matching columns, so listings can query plain tuples instead of
+loading model instances.
+"""
+
+from marshmallow import fields
+
+from yahtzee import db
+from yahtzee.models import GameSchema, UserSchema, UsersGamesSchema
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+# serializers of field subsets kept by each RowSerializer, the oldest is
+# dropped beyond this
+ONLY_CACHE_SIZE = 64
+
+# how a value of a dump field type is written, by its Marshmallow field class
+_CONVERTERS = {
+    fields.Integer: None,
+    fields.String: None,
+    fields.Boolean: None,
+    fields.Float: None,
+    fields.DateTime: _isoformat,
+    fields.Date: _isoformat,
+}
+
+
+def _dump_function(keys, converted):
+    """
+    Make the function dumping a row.
+
+    :param keys: dict key of each column of the row, in order
+    :param converted: (index, key, converter) of the columns not written as
+        they are
+    :return: function of a row tuple (extra trailing columns are ignored)
+    """
+    # zip builds the dict of plain columns in C, only converted columns
+    # cost a call
+    if not converted:
+        def dump(row):
+            return dict(zip(keys, row))
+    else:
+        def dump(row):
+            item = dict(zip(keys, row))
+            for index, key, converter in converted:
+                item[key] = converter(row[index])
+            return item
+    return dump
+
+
+class RowSerializer(object):
+    """
+    Dump rows as the schema would dump the model instances they come from.
+
+    :param schema: Marshmallow SQLAlchemyAutoSchema class of a model
+    :param only: names of the fields to dump, None for all of them
+    """
+    def __init__(self, schema, only=None):
+        self._schema = schema
+        schema = schema(only=only)
+        model = schema.opts.model
+        self.names = tuple(field.data_key or name
+                           for name, field in schema.dump_fields.items())
+        self._field_names = dict(zip(self.names, schema.dump_fields))
+        self._subsets = {}
+        self.columns = tuple(
+            getattr(model, field.attribute or name)
+            for name, field in schema.dump_fields.items()
+        )
+
+        converted = []
+        for index, (name, field) in enumerate(schema.dump_fields.items()):
+            try:
+                converter = _CONVERTERS[type(field)]
+            except KeyError:
+                raise TypeError(f'{type(field).__name__} field {name} of '
+                                f'{type(schema).__name__} has no converter')
+            if converter is not None:
+                converted.append((index, self.names[index], converter))
+        self.dump = _dump_function(self.names, tuple(converted))
+
+    def only(self, names):
+        """
+        Get a serializer of some of the fields, which only selects their
+        columns.
+
+        :param names: iterable of field names, as they are dumped
+        :return: RowSerializer
+        :raises ValueError: if the schema does not dump one of the names
+        """
+        names = frozenset(names)
+        unknown = names.difference(self.names)
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}.')
+        if names == frozenset(self.names):
+            return self
+        return self._only(frozenset(self._field_names[name]
+                                    for name in names))
+
+    def _only(self, field_names):
+        serializer = self._subsets.get(field_names)
+        if serializer is None:
+            serializer = RowSerializer(self._schema, only=field_names)
+            if len(self._subsets) >= ONLY_CACHE_SIZE:
+                self._subsets.pop(next(iter(self._subsets)), None)
+            self._subsets[field_names] = serializer
+        return serializer
+
+    def query(self, *extra):
+        """
+        Query the columns of the dump fields, in order, then the extra
+        columns not among them (e.g. keys needed by the caller).
+
+        :return: query of row tuples to pass to dump
+        """
+        extra = [column for column in extra
+                 if not any(column is own for own in self.columns)]
+        return db.session.query(*self.columns, *extra)
+
+    def dump_many(self, rows):
+        dump = self.dump
+        return [dump(row) for row in rows]
+
+    def dump_instance(self, instance):
+        """
+        Dump a loaded model instance.
+        """
+        return self.dump([getattr(instance, column.key)
+                          for column in self.columns])
+
+
+def parse_fields(fields, relationships=()):
+    """
+    Parse a sparse fieldset, a comma separated list of field names. A name
+    relationship.field selects a field of a nested relationship, and the
+    relationship alone all of its fields.
+
+    :param fields: value of the fields parameter, None or empty for all
+    :param relationships: names of the relationships that can be expanded
+    :return: (top level field names, None for all; dict of each expanded
+        relationship to its field names, None for all)
+    :raises ValueError: if a relationship cannot be expanded
+    """
+    if not fields:
+        return None, {}
+
+    names = set()
+    nested = {}
+    for name in filter(None, (name.strip() for name in fields.split(','))):
+        relationship, _, field = name.partition('.')
+        if relationship in relationships:
+            if not field:
+                nested[relationship] = None
+            elif nested.get(relationship, ()) is not None:
+                nested.setdefault(relationship, set()).add(field)
+        elif field:
+            raise ValueError(f'Cannot expand {relationship}.')
+        else:
+            names.add(name)
+
+    # naming only nested fields keeps every top level field
+    return names or None, nested
+
+
+user_rows = RowSerializer(UserSchema)
+game_rows = RowSerializer(GameSchema)
+users_games_rows = RowSerializer(UsersGamesSchema)
@@ -0,0 +1,23 @@
+"""
+This module checks the bearer token of the REST API operations that write or
+export data, the api_token security definition of swagger.yml
+"""
+
+import hmac
+
+from flask import current_app
+
+
+def token_info(token):
+    """
+    Check the bearer token of a request against the API_TOKEN of the app.
+    No token is valid while API_TOKEN is not set.
+
+    :param token:   token of the Authorization header
+    :return:        dict of the token info, or None if it is not valid
+    """
+    expected = current_app.config['API_TOKEN']
+    if not expected or not hmac.compare_digest(token.encode('utf-8'),
+                                               expected.encode('utf-8')):
+        return None
+    return {'sub': 'api'}
@@ -0,0 +1,50 @@
+"""
+This module contains the bulk export operations as a handler for HTTP requests
+to /api/v1/export
+"""
+
+# import flask modules to create streaming REST API responses
+from flask import (
+    Response,
+    abort,
+    current_app,
+    stream_with_context,
+)
+
+from yahtzee import db
+from yahtzee.export import EXPORTS, FORMATS, stream_export
+
+
+def export(table, extension):
+    """
+    This function responds to a request for api/v1/export/{table}.{extension}
+    with the whole table streamed as NDJSON or CSV. The response has no
+    content length, so it is sent with chunked transfer encoding.
+
+    :param table:       table to export, users or users_games
+    :param extension:   export format, ndjson or csv
+    :return:            streaming response of the table rows
+    """
+    if table not in EXPORTS:
+        abort(404, f'Table {table} cannot be exported.')
+    if extension not in FORMATS:
+        abort(404, f'Export format {extension} is not supported.')
+
+    chunks = stream_export(
+        db.session,
+        table,
+        extension,
+        batch_size=current_app.config['EXPORT_BATCH_SIZE']
+    )
+
+    # keep the app context (and db session) alive while the body streams,
+    # and ask proxies such as NGINX not to buffer the whole response
+    return Response(
+        stream_with_context(chunks),
+        mimetype=FORMATS[extension],
+        headers={
+            'Content-Disposition':
+                f'attachment; filename={table}.{extension}',
+            'X-Accel-Buffering': 'no',
+        }
+    )
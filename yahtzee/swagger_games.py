@@ -0,0 +1,167 @@
+"""
+This module contains the game and scorecard operations as a handler for HTTP
+requests to /api/v1/games and /api/v1/users_games
+"""
+
+# import flask modules to create REST API responses
+from flask import abort
+
+from yahtzee import db
+from yahtzee.conditional import is_fresh, not_modified, validators
+from yahtzee.leaderboard import finish_game, get_leaderboard
+from yahtzee.models import Game, UsersGames
+from yahtzee.rules import SCORECARD_COLUMNS, TOTAL_COLUMNS
+from yahtzee.serializers import game_rows, users_games_rows
+from yahtzee.versioning import (
+    abort_conflict,
+    if_match_versions,
+    version_etag,
+)
+
+
+def read_game(game_id):
+    """
+    This function responds to a request for api/v1/games/{game_id} with the
+    game and the scorecards of its players. Every turn and finish of one of
+    them bumps the version of the game, so the version is a strong ETag of
+    the whole response: with If-None-Match a current copy gets a 304, and
+    with If-Match the game is only read at one of those versions.
+
+    :param game_id:     id of the game to read
+    :return:            200 with the game and its scorecards, and the
+                        version as ETag, 304 if unchanged, or 412 if the
+                        version is not one of If-Match
+    """
+    game = game_rows.query() \
+        .filter(Game.game_id == game_id) \
+        .one_or_none()
+    if game is None:
+        abort(404, f'Game not found for Id: {game_id}')
+
+    versions = if_match_versions()
+    if versions is not None and game.version_id not in versions:
+        abort(412, f'Game {game_id} was changed by another request.')
+    headers = validators(str(game.version_id))
+    if is_fresh(str(game.version_id)):
+        return not_modified(headers)
+
+    body = game_rows.dump(game)
+    body['users_games'] = [
+        dict(users_games_rows.dump(card), user_id=card.user_id)
+        for card in users_games_rows.query(UsersGames.user_id)
+        .filter(UsersGames.game_id == game_id)
+        .order_by(UsersGames.users_games_id)
+    ]
+    return body, 200, headers
+
+
+def _entry_score(category, entry):
+    """
+    Get the score of a turn from its dice, or the score given directly.
+    Dice showing a yahtzee also get the score they make as a joker, which
+    applies if the yahtzee box of the scorecard is filled.
+
+    :param category:    scorecard column being scored
+    :param entry:       dict with either dice or score
+    :return:            (score, joker score or None) as ints, aborts with
+                        400 if the score is not possible
+    """
+    # the score tables load NumPy, the first turn of a worker pays for them
+    from yahtzee.scoring import SCORE_OPTIONS, score_of
+
+    dice = entry.get('dice')
+    score = entry.get('score')
+    joker_score = None
+
+    if (dice is None) == (score is None):
+        abort(400, 'Give either the dice or the score of the turn.')
+    if dice is not None:
+        try:
+            score = score_of(category, dice)
+            if len(set(dice)) == 1:
+                joker_score = score_of(category, dice, joker=True)
+        except (TypeError, ValueError) as e:
+            abort(400, str(e))
+    elif isinstance(score, bool) or not isinstance(score, int):
+        abort(400, 'The score must be an integer.')
+
+    if score not in SCORE_OPTIONS[category]:
+        abort(400, f'{score} is not a possible {category} score.')
+    if joker_score == score:
+        joker_score = None
+    return score, joker_score
+
+
+def _abort_not_updated(users_games_id, versions=None, category=None):
+    """
+    Abort with the reason a scorecard could not be updated.
+    """
+    card = UsersGames.query.get(users_games_id)
+    if card is None:
+        abort(404, f'Scorecard not found for Id: {users_games_id}')
+    if versions is not None and card.version_id not in versions:
+        abort_conflict(
+            f'Scorecard {users_games_id} was changed by another request.',
+            users_games_rows.dump_instance(card),
+            card.version_id
+        )
+    if card.finished_at is not None:
+        abort(409, f'Scorecard {users_games_id} is already finished.')
+    if category == 'yahtzee_bonus':
+        abort(409, 'A yahtzee bonus needs a yahtzee, and can only grow.')
+    abort(409, f'{category} is already scored.')
+
+
+def enter_score(users_games_id, category, entry):
+    """
+    This function responds to a request for
+    api/v1/users_games/{users_games_id}/{category} with the updated totals
+    of the scorecard. The category and its dependent totals are written by
+    one UPDATE statement, whatever other turns run concurrently, and each
+    category is scored once. With an If-Match header the turn only applies
+    to that version of the scorecard.
+
+    :param users_games_id:  id of the scorecard to score
+    :param category:        scorecard column to score
+    :param entry:           dice of the turn, or the score to enter
+    :return:                200 with the category score and totals, and the
+                            new version as ETag
+    """
+    if category not in SCORECARD_COLUMNS:
+        abort(404, f'Unknown score category {category}.')
+    score, joker_score = _entry_score(category, entry)
+    versions = if_match_versions()
+
+    scores = UsersGames.set_score(users_games_id, category, score, versions,
+                                  joker_score)
+    if scores is None:
+        db.session.rollback()
+        _abort_not_updated(users_games_id, versions, category)
+    db.session.commit()
+
+    body = {'category': category, 'score': scores[category]}
+    body.update((column, scores[column]) for column in TOTAL_COLUMNS)
+    return body, 200, {'ETag': version_etag(scores['version_id'])}
+
+
+def finish(users_games_id):
+    """
+    This function responds to a request for
+    api/v1/users_games/{users_games_id}/finish by freezing the scorecard and
+    adding it to the leaderboard stats of its player. With an If-Match
+    header only that version of the scorecard is finished.
+
+    :param users_games_id:  id of the scorecard to finish
+    :return:                200 with the best score of the player
+    """
+    versions = if_match_versions()
+    best = finish_game(users_games_id, versions)
+    if best is None:
+        db.session.rollback()
+        _abort_not_updated(users_games_id, versions)
+    generation = get_leaderboard().generation()
+    db.session.commit()
+
+    old_best, new_best = best
+    get_leaderboard().record(old_best, new_best, generation)
+    return {'best_score': new_best, 'new_best': new_best != old_best}, 200
@@ -0,0 +1,59 @@
+"""
+This module contains the leaderboard operations as a handler for HTTP
+requests to /api/v1/leaderboard
+"""
+
+# import flask modules to create REST API responses
+from flask import abort, current_app
+
+from yahtzee import leaderboard
+
+
+def _size(limit):
+    """
+    Clamp a requested number of users to the configured leaderboard size.
+    """
+    if limit is None:
+        return current_app.config['LEADERBOARD_SIZE']
+    return max(1, min(limit, current_app.config['LEADERBOARD_MAX_SIZE']))
+
+
+def read_top(limit=None):
+    """
+    This function responds to a request for api/v1/leaderboard with the
+    users having the best scores.
+
+    :param limit:   number of users to return
+    :return:        json object with the list of leaders
+    """
+    return {'leaders': leaderboard.top(_size(limit))}
+
+
+def read_rank(user_id):
+    """
+    This function responds to a request for api/v1/leaderboard/{user_id}
+    with the rank and stats of a user.
+
+    :param user_id: id of the user
+    :return:        leaderboard entry of the user
+    """
+    entry = leaderboard.stats_of(user_id)
+    if entry is None:
+        abort(404, f'No finished games for user Id: {user_id}')
+    return entry
+
+
+def read_around(user_id, count=None):
+    """
+    This function responds to a request for
+    api/v1/leaderboard/{user_id}/around with the users ranked next to a
+    user, the user included.
+
+    :param user_id: id of the user
+    :param count:   number of users to return above and below the user
+    :return:        json object with the list of users
+    """
+    leaders = leaderboard.around(user_id, _size(count))
+    if leaders is None:
+        abort(404, f'No finished games for user Id: {user_id}')
+    return {'leaders': leaders}
@@ -7,168 +7,431 @@ This module contains users.CRUD operations as a handler for HTTP requests to
 from flask import (
     make_response,
     abort,
+    current_app,
 )
 
-from yahtzee import db
-
-# import SQLAlchemy User and Marshmallow UserSchema classes to access user
-# database table and serialize the results
-from yahtzee.models import (
-    User,
-    UserSchema,
+from sqlalchemy import bindparam, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+from yahtzee import db, leaderboard
+from yahtzee.conditional import (is_fresh, not_modified, table_version,
+                                 validators)
+
+# import SQLAlchemy User class to access the user database table, and its
+# row serializer (output of the Marshmallow UserSchema) for the results
+from yahtzee.models import User, UsersGames
+from yahtzee.pagination import paginate
+from yahtzee.serializers import parse_fields, user_rows, users_games_rows
+from yahtzee.user_cache import mark_users_changed
+from yahtzee.users.availability import mark_names_added
+from yahtzee.users.hashing import UNUSABLE_PASSWORD
+from yahtzee.versioning import (
+    abort_conflict,
+    if_match_versions,
+    version_etag,
 )
 
+# writable fields of a user and their maximum lengths
+USER_FIELDS = {
+    'username': 32,
+    'first_name': 32,
+    'last_name': 32,
+    'email': 50,
+}
 
-# create handler for read (GET) users
-def read_all():
+# batch items looked up per query, 2 bound parameters each stays below the
+# 999 parameter limit of SQLite
+BATCH_CHUNK = 400
+
+
+def _serializers(fields):
     """
-    This function responds to a request for api/v1/users with the list of users
+    Get the serializers of a sparse fieldset of users, e.g.
+    fields=username,last_name,users_games.grand_total_score
 
-    :return:            sorted list of users
+    :param fields:      fields parameter, None for every user field
+    :return:            (user serializer, users_games serializer or None if
+                        the scorecards are not expanded), aborts with 400
+                        naming an unknown field
+    """
+    try:
+        names, nested = parse_fields(fields, ('users_games',))
+        user_serializer = user_rows.only(names) if names is not None \
+            else user_rows
+        if 'users_games' not in nested:
+            return user_serializer, None
+        card_names = nested['users_games']
+        return user_serializer, users_games_rows.only(card_names) \
+            if card_names is not None else users_games_rows
+    except ValueError as e:
+        abort(400, str(e))
+
+
+def _dump_users(rows, user_serializer, card_serializer):
+    """
+    Dump user rows, which must have an id column, with their scorecards
+    when card_serializer is given, fetched for every user in one query.
     """
-    # create the list of users from our data
-    users = User.query \
-        .order_by(User.last_name) \
-        .all()
+    users = user_serializer.dump_many(rows)
+    if card_serializer is None:
+        return users
 
-    # serialize data for response: many=True tells UserSchema expect iterable
-    user_schema = UserSchema(many=True)
-    # The return result is an object having a data attribute, an object
-    # containing a user list that can be converted to JSON. This is returned
-    # and converted by Connexion to JSON as the response to the REST API call
-    return user_schema.dump(users).data
+    cards = {row.id: [] for row in rows}
+    if cards:
+        card_rows = card_serializer.query(UsersGames.user_id) \
+            .filter(UsersGames.user_id.in_(list(cards)))
+        for row in card_rows:
+            cards[row.user_id].append(card_serializer.dump(row))
+    for user, row in zip(users, rows):
+        user['users_games'] = cards[row.id]
+    return users
 
 
-def create(user):
+# create handler for read (GET) users
+def read_all(cursor=None, limit=None, fields=None):
+    """
+    This function responds to a request for api/v1/users with one page of the
+    list of users, sorted by last name. Only the columns of the requested
+    fields are selected.
+
+    :param cursor:      opaque cursor from a previous page (optional)
+    :param limit:       maximum number of users in the page (optional)
+    :param fields:      comma separated fields of the users, and of their
+                        users_games to expand them (optional)
+    :return:            page of users with next/prev cursors, or 304 if
+                        If-None-Match/If-Modified-Since shows it unchanged
+    """
+    max_per_page = current_app.config['USERS_MAX_PER_PAGE']
+    per_page = current_app.config['USERS_PER_PAGE'] if limit is None \
+        else max(1, min(limit, max_per_page))
+    user_serializer, card_serializer = _serializers(fields)
+
+    # a page only changes with the user table, unless scorecards are
+    # expanded, so a client holding it gets a 304 before the page is read
+    headers = {}
+    version = table_version('user') if card_serializer is None else None
+    if version is not None:
+        etag = f'users-{version.version}'
+        headers = validators(etag, version.changed_at, weak=True)
+        if is_fresh(etag, version.changed_at):
+            return not_modified(headers)
+
+    # fetch the page of users following the cursor, keyed on (last_name, id),
+    # as row tuples of the serialized columns rather than User instances
+    try:
+        page = paginate(user_serializer.query(User.last_name, User.id),
+                        [User.last_name, User.id],
+                        cursor=cursor, per_page=per_page)
+    except ValueError as e:
+        abort(400, str(e))
+
+    return {
+        'users': _dump_users(page.items, user_serializer, card_serializer),
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
+    }, 200, headers
+
+
+def create(user_data):
     """
     This function responds to a post request to api/v1/users and creates a new
     user in the users structure based on the passed-in user data
 
-    :param user:        user to create in the user structure
-    :return:            201 on success, 409 on user exists
+    :param user_data:   user to create in the user structure (connexion
+                        passes the user of the api_token check as user)
+    :return:            201 with the new user, 400 on an invalid field, 409
+                        if the username or email exists
     """
+    errors = _validate_user(user_data)
+    if errors:
+        abort(400, '; '.join(f'{field}: {message}'
+                             for field, message in errors.items()))
+
+    if User.taken(user_data['username'], user_data['email']):
+        abort(409, 'Username or email already exists.')
+
+    # the user sets a password by resetting it
+    new_user = User(password=UNUSABLE_PASSWORD,
+                    **{field: user_data[field] for field in USER_FIELDS})
+    try:
+        db.session.add(new_user)
+        db.session.commit()
 
-    username = user.get('username')
-    first_name = user.get('first_name')
-    last_name = user.get('last_name')
-    email = user.get('email')
+    # another request took the username or email since we looked
+    except IntegrityError:
+        db.session.rollback()
+        abort(409, 'Username or email already exists.')
 
-    existing_user = User.query \
-        .filter(User.username == username) \
-        .filter(User.first_name == first_name) \
-        .filter(User.last_name == last_name) \
-        .filter(User.email == email) \
-        .one_or_none()
+    # serialize and return new user in the response
+    return user_rows.dump_instance(new_user), 201, \
+        {'ETag': version_etag(new_user.version_id)}
 
-    # can we insert this user?
-    if existing_user is None:
 
-        # create a user instance using the schema and passed-in user
-        user_schema = UserSchema()
-        new_user = user_schema.load(user, session=db.session).data
+def _validate_user(item):
+    """
+    Check a user or batch item has every field as a string of acceptable
+    length.
 
-        # add user to database
-        db.session.add(new_user)
+    :return: dict of field name to error message, empty if valid
+    """
+    errors = {}
+    for field, max_length in USER_FIELDS.items():
+        value = item.get(field)
+        if not isinstance(value, str) or not value.strip():
+            errors[field] = 'Missing data for required field.'
+        elif len(value) > max_length:
+            errors[field] = f'Longer than maximum length {max_length}.'
+
+    if 'email' not in errors and '@' not in item['email']:
+        errors['email'] = 'Not a valid email address.'
+    return errors
+
+
+def _chunks(items, size=BATCH_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def create_batch(users, on_conflict='reject'):
+    """
+    This function responds to a post request to api/v1/users:batch and
+    creates (or updates) many users in a single transaction. Existing users
+    are found for the whole batch at once and rows are written with one
+    executemany statement per operation.
+
+    :param users:       list of users to create
+    :param on_conflict: 'reject' to report existing usernames as conflicts,
+                        'update' to update the names/email of those users
+    :return:            200 with a per-item result for every user
+    """
+    results = [None] * len(users)
+    candidates = []
+    usernames, emails = set(), set()
+
+    # validate items, and reject duplicates within the batch itself
+    for index, item in enumerate(users):
+        errors = _validate_user(item)
+        if errors:
+            results[index] = {'index': index, 'status': 'invalid',
+                              'errors': errors}
+        elif item['username'] in usernames or item['email'] in emails:
+            results[index] = {'index': index, 'status': 'conflict',
+                              'message': 'Duplicate user within the batch.'}
+        else:
+            usernames.add(item['username'])
+            emails.add(item['email'])
+            candidates.append((index, item))
+
+    # find every existing user sharing a username or email with the batch
+    by_username, by_email = {}, {}
+    for chunk in _chunks(candidates):
+        rows = db.session.query(User.id, User.username, User.email) \
+            .filter(or_(
+                User.username.in_([item['username'] for _, item in chunk]),
+                User.email.in_([item['email'] for _, item in chunk])
+            )) \
+            .all()
+        for row in rows:
+            by_username[row.username] = row
+            by_email[row.email] = row
+
+    inserts, updates = [], []
+    for index, item in candidates:
+        existing = by_username.get(item['username'])
+        email_owner = by_email.get(item['email'])
+
+        if existing is not None and on_conflict == 'update' \
+                and (email_owner is None or email_owner.id == existing.id):
+            updates.append((index, existing.id, item))
+        elif existing is not None or email_owner is not None:
+            results[index] = {'index': index, 'status': 'conflict',
+                              'message': 'Username or email already exists.'}
+        else:
+            inserts.append((index, item))
+
+    # write everything in one transaction with executemany statements
+    user_table = User.__table__
+    try:
+        if inserts:
+            db.session.execute(user_table.insert(), [
+                dict({field: item[field] for field in USER_FIELDS},
+                     password=UNUSABLE_PASSWORD)
+                for _, item in inserts
+            ])
+        if updates:
+            db.session.execute(
+                user_table.update()
+                .where(user_table.c.id == bindparam('b_id'))
+                .values(first_name=bindparam('b_first_name'),
+                        last_name=bindparam('b_last_name'),
+                        email=bindparam('b_email'),
+                        version_id=user_table.c.version_id + 1),
+                [
+                    {'b_id': user_id,
+                     'b_first_name': item['first_name'],
+                     'b_last_name': item['last_name'],
+                     'b_email': item['email']}
+                    for _, user_id, item in updates
+                ]
+            )
+            mark_users_changed(db.session, [user_id
+                                            for _, user_id, _ in updates])
+        written = [item for _, item in inserts] \
+            + [item for _, _, item in updates]
+        mark_names_added(db.session, [(item['username'], item['email'])
+                                      for item in written])
+
+        # look up the ids the database gave to the new users
+        ids = {}
+        for chunk in _chunks(inserts):
+            ids.update(
+                db.session.query(User.username, User.id)
+                .filter(User.username.in_([item['username']
+                                           for _, item in chunk]))
+                .all()
+            )
         db.session.commit()
 
-        # serialize and return new user in the response
-        return user_schema.dump(new_user).data, 201
+    # another request created one of these users since we looked
+    except IntegrityError:
+        db.session.rollback()
+        abort(409, 'Users changed during the batch, please retry it.')
 
-    # otherwise, no user already exists
-    else:
-        abort(409, f'User {first_name} {last_name} already exists.')
+    for index, item in inserts:
+        results[index] = {'index': index, 'status': 'created',
+                          'id': ids[item['username']]}
+    for index, user_id, _ in updates:
+        results[index] = {'index': index, 'status': 'updated',
+                          'id': user_id}
+
+    return {'results': results}, 200
 
 
-def read_one(user_id):
+def read_one(user_id, fields=None):
     """
     This function responds to a request for api/v1/users/{user_id} with one
     matching user from users
 
     :param user_id:     ID of user to find
-    :return:            user matching ID
+    :param fields:      comma separated fields of the user, and of their
+                        users_games to expand them (optional)
+    :return:            user matching ID, and its version as ETag, or 304
+                        if If-None-Match/If-Modified-Since shows it unchanged
     """
-    # get one_or_none user requested from our data
-    user = User.query \
-        .filter(User.user_id == user_id) \
+    user_serializer, card_serializer = _serializers(fields)
+
+    # get the requested columns of the user, with its version for the ETag
+    # and its timestamp for Last-Modified
+    user = user_serializer.query(User.id, User.version_id, User.timestamp) \
+        .filter(User.id == user_id) \
         .one_or_none()
 
     # did we find person
     if user is not None:
 
+        # the version is a strong ETag of the user, but not of its scorecards
+        if card_serializer is not None:
+            headers = {'ETag': version_etag(user.version_id)}
+        else:
+            headers = validators(str(user.version_id), user.timestamp)
+            if is_fresh(str(user.version_id), user.timestamp):
+                return not_modified(headers)
+
         # serialize data for response
-        user_schema = UserSchema(many=False)
-        return user_schema.dump(user).data
+        return _dump_users([user], user_serializer, card_serializer)[0], \
+            200, headers
 
     # otherwise, no we didn't find user
     else:
         abort(404, f'User not found for Id: {user_id}')
 
-def update(user_id, user):
+
+def update(user_id, user_data):
     """
     This function responds to a PUT api/v1/users/{user_id} to update a user in
     the user structure. Throws an error if the user to update already exists.
+    With an If-Match header the update only applies to that version of the
+    user, and a concurrent update answers 409 with the current user.
 
     :param user_id:     the ID of the user we want to update
-    :param user:        the user data to update with
-    :return:            updated user structure
+    :param user_data:   the user data to update with
+    :return:            updated user structure, and its version as ETag
     """
     # get the user requested from the data
-    update_user = User.query \
-        .filter(User.user_id == user_id) \
-        .one_or_none()
-
-    # try and find an existing user with the same data as user param
-    first_name = user.get("first_name")
-    last_name = user.get("last_name")
-
-    existing_user = User.query \
-        .filter(User.first_name == first_name) \
-        .filter(User.last_name == last_name) \
-        .one_or_none()
+    update_user = User.query.get(user_id)
 
     # are we updating a user that doesn't exist?
     if update_user is None:
         abort(404, f"User not found for Id: {user_id}")
 
-    # does the user to update with already exist (would we create dupe)?
-    elif (existing_user is not None and existing_user.user_id != user_id):
-        abort(409, f"Person {first_name} {last_name} already exists")
+    # was the user changed since the client read it?
+    versions = if_match_versions()
+    if versions is not None and update_user.version_id not in versions:
+        abort_conflict(f'User {user_id} was changed by another request.',
+                       user_rows.dump_instance(update_user),
+                       update_user.version_id)
 
-    # otherwise update user
-    else:
+    # try and find an existing user with the same data as user_data param
+    first_name = user_data.get("first_name")
+    last_name = user_data.get("last_name")
 
-        # create a user instance using the schema and user param
-        user_schema = UserSchema()
-        update = user_schema.load(user, session=db.session)
+    existing_user = User.query \
+        .filter(User.first_name == first_name) \
+        .filter(User.last_name == last_name) \
+        .first()
 
-        # set the id to the user we want to update
-        update.user_id = update_user.user_id
+    # does the user to update with already exist (would we create dupe)?
+    if existing_user is not None and existing_user.id != user_id:
+        abort(409, f"Person {first_name} {last_name} already exists")
 
-        # merge new object into old and commit to db
-        db.session.merge(update)
+    # update the fields of the loaded user, the UPDATE only matches the
+    # version that was loaded
+    for field in USER_FIELDS:
+        if field in user_data:
+            setattr(update_user, field, user_data[field])
+    try:
         db.session.commit()
 
-        # return updated user in response
-        data = user_schema.dump(update_user)
+    # another request updated the user since we loaded it
+    except StaleDataError:
+        db.session.rollback()
+        current = User.query.get(user_id)
+        if current is None:
+            abort(404, f"User not found for Id: {user_id}")
+        abort_conflict(f'User {user_id} was changed by another request.',
+                       user_rows.dump_instance(current),
+                       current.version_id)
 
-        return data, 200
+    # another request took the username or email
+    except IntegrityError:
+        db.session.rollback()
+        abort(409, 'Username or email already exists.')
+
+    # return updated user in response
+    return user_rows.dump_instance(update_user), 200, \
+        {'ETag': version_etag(update_user.version_id)}
 
 
 def delete(user_id):
     """
-    This function deletes the user from the user structure
+    This function deletes the user from the user structure, with their
+    scorecards and leaderboard stats
 
     :param user_id: The user_id of the user
     :return: 200 if successful, 404 if user not found
     """
-    delete_user = User.query \
-        .filter(User.user_id == user_id) \
-        .one_or_none()
+    delete_user = User.query.get(user_id)
 
     # is the user in the database?
     if delete_user is not None:
+        best_score = leaderboard.remove_user(user_id)
         db.session.delete(delete_user)
+        generation = leaderboard.get_leaderboard().generation()
         db.session.commit()
+        if best_score is not None:
+            leaderboard.get_leaderboard().record(best_score, None,
+                                                 generation)
         return make_response(
             f"User {user_id} deleted.", 200
         )
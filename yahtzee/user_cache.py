@@ -0,0 +1,144 @@
+"""
+This module caches the users loaded by Flask-Login for each request. A worker
+keeps the column values of recently loaded users, for USER_CACHE_TTL seconds
+and at most USER_CACHE_SIZE of them, and rebuilds the user from them without
+a query. Only plain values are cached, never an instance of a session. A user
+is dropped from the cache once a transaction changing or deleting it commits;
+other workers see the change when their entry expires, or when a write of
+theirs fails on the version of the cached user and drops it.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from yahtzee import app_extension, db
+
+# ids of the users changed by the transaction of a session, in session.info
+CHANGED_USERS = 'changed_user_ids'
+
+
+class UserCache(object):
+    """
+    A TTL and LRU bounded map of user id to column values, safe to share
+    between threads.
+    """
+    def __init__(self, size, ttl):
+        self._size = size
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = 0
+
+    def get(self, user_id):
+        """
+        Get the cached column values of a user.
+
+        :param user_id: id of the user
+        :return: (values or None, generation to pass to put on a miss)
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                values, expires = entry
+                if expires > time.monotonic():
+                    self._entries.move_to_end(user_id)
+                    return values, self._generation
+                del self._entries[user_id]
+            return None, self._generation
+
+    def put(self, user_id, values, generation):
+        """
+        Cache the column values of a user read from the database, unless a
+        user was invalidated since get returned generation, as the values
+        could then predate that commit.
+        """
+        with self._lock:
+            if generation != self._generation or self._size <= 0:
+                return
+            self._entries[user_id] = (values, time.monotonic() + self._ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        """
+        Drop users from the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+def get_user_cache():
+    """
+    Get the user cache of the current app, creating it from its config.
+    """
+    return app_extension('user_cache', lambda app: UserCache(
+        app.config['USER_CACHE_SIZE'],
+        app.config['USER_CACHE_TTL']
+    ))
+
+
+def column_values(instance):
+    """
+    Get the column attributes of a loaded instance as a plain dict.
+    """
+    mapper = inspect(instance).mapper
+    return {attr.key: getattr(instance, attr.key)
+            for attr in mapper.column_attrs}
+
+
+def from_column_values(model, values):
+    """
+    Add an instance rebuilt from column_values to the current session as if
+    it had been loaded, without querying the database.
+
+    :param model: mapped class of the instance
+    :param values: dict returned by column_values
+    :return: instance attached to db.session
+    """
+    instance = model(**values)
+    make_transient_to_detached(instance)
+    return db.session.merge(instance, load=False)
+
+
+def mark_users_changed(session, user_ids):
+    """
+    Invalidate users when the transaction of session commits. For users
+    changed by Core statements, the ORM ones are found at flush.
+    """
+    session.info.setdefault(CHANGED_USERS, set()).update(user_ids)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    from yahtzee.models import User
+
+    changed = [instance.id for instance in session.dirty | session.deleted
+               if isinstance(instance, User) and instance.id is not None]
+    if changed:
+        mark_users_changed(session, changed)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed_users(session):
+    changed = session.info.pop(CHANGED_USERS, None)
+    cache = current_app.extensions.get('user_cache')
+    if changed and cache is not None:
+        cache.invalidate(changed)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop(CHANGED_USERS, None)
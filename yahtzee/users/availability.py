@@ -0,0 +1,214 @@
+"""
+This module answers whether a username or email is free for the live check of
+the registration page. Each process keeps a Bloom filter of every username and
+email: a name the filter has never seen is free without a query, and only the
+names it may hold (the taken ones and about AVAILABILITY_FALSE_POSITIVE_RATE
+of the free ones) are looked up in the db.
+
+The filter is built from the user table on first use and rebuilt every
+AVAILABILITY_REFRESH seconds, growing with the table. One request builds the
+new filter without holding the lock, the others keep answering from the old
+one, or from the db until there is a filter, and it is swapped in once built.
+Names committed by this process are added at once, also to a filter being
+built; those of other processes show up at the next rebuild. Meanwhile the
+answer may be a stale "available", which the unique checks of the
+registration form still catch.
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event
+
+from yahtzee import app_extension, db
+from yahtzee.models import User
+
+# usernames and emails committed by the transaction of a session, in
+# session.info
+ADDED_NAMES = 'added_user_names'
+
+
+class BloomFilter(object):
+    """
+    A set of strings which may answer that it holds a string it does not,
+    at about false_positive_rate while it holds at most capacity strings,
+    but never that it lacks one it holds.
+    """
+    def __init__(self, capacity, false_positive_rate):
+        capacity = max(capacity, 1)
+        self._bits = max(8, int(-capacity * math.log(false_positive_rate)
+                                / math.log(2) ** 2))
+        self._hashes = max(1, round(self._bits / capacity * math.log(2)))
+        self._array = bytearray((self._bits + 7) // 8)
+        self.capacity = capacity
+        self.count = 0
+
+    def _positions(self, value):
+        # double hashing, two 64 bit halves of one digest give every position
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16)
+        digest = digest.digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self._bits for i in range(self._hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self._array[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+def _key(field, value):
+    return f'{field}:{value}'
+
+
+class AvailabilityIndex(object):
+    """
+    The usernames and emails of every user in a Bloom filter, shared by the
+    threads of this process.
+    """
+    def __init__(self, refresh, false_positive_rate, batch_size=1000):
+        self._refresh = refresh
+        self._false_positive_rate = false_positive_rate
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        self._filter = None
+        self._loaded_at = 0
+        # names added while a new filter is built, None when none is
+        self._pending = None
+
+    def _stale(self):
+        return self._filter is None \
+            or time.monotonic() - self._loaded_at > self._refresh \
+            or self._filter.count > self._filter.capacity
+
+    def _build(self):
+        users = db.session.query(db.func.count(User.id)).scalar()
+        # room for the table to double before the next rebuild
+        bloom = BloomFilter(2 * (2 * users + 1000), self._false_positive_rate)
+        for username, email in db.session.query(User.username, User.email) \
+                .yield_per(self._batch_size):
+            bloom.add(_key('username', username))
+            bloom.add(_key('email', email))
+        return bloom
+
+    def _rebuild(self):
+        """
+        Build a new filter outside the lock and swap it in, with the names
+        added meanwhile.
+        """
+        loaded_at = time.monotonic()
+        try:
+            bloom = self._build()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for username, email in self._pending:
+                bloom.add(_key('username', username))
+                bloom.add(_key('email', email))
+            self._filter, self._pending = bloom, None
+            self._loaded_at = loaded_at
+
+    def might_hold(self, field, value):
+        """
+        Check if a username or email may be taken.
+
+        :param field: 'username' or 'email'
+        :param value: the username or email
+        :return: False if no user has it, True if one may
+        """
+        with self._lock:
+            rebuild = self._pending is None and self._stale()
+            if rebuild:
+                self._pending = []
+        if rebuild:
+            self._rebuild()
+
+        bloom = self._filter
+        if bloom is None:
+            # the first filter is still being built, ask the db
+            return True
+        return _key(field, value) in bloom
+
+    def add(self, names):
+        """
+        Add (username, email) pairs of new or renamed users.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(names)
+            if self._filter is None:
+                return
+            for username, email in names:
+                self._filter.add(_key('username', username))
+                self._filter.add(_key('email', email))
+
+
+def get_availability_index():
+    """
+    Get the availability index of the current app, creating it from its
+    config.
+    """
+    return app_extension('availability_index', lambda app: AvailabilityIndex(
+        app.config['AVAILABILITY_REFRESH'],
+        app.config['AVAILABILITY_FALSE_POSITIVE_RATE']
+    ))
+
+
+def available(username=None, email=None):
+    """
+    Check if a username and an email are free, asking the db only about
+    those the index may hold, in one query.
+
+    :param username: username to check, None to skip
+    :param email: email to check, None to skip
+    :return: dict of field to True if free, for the fields given
+    """
+    index = get_availability_index()
+    asked = {'username': username, 'email': email}
+    asked = {field: value for field, value in asked.items()
+             if value is not None}
+    maybe = {field: value for field, value in asked.items()
+             if index.might_hold(field, value)}
+
+    taken = User.taken(**maybe) if maybe else set()
+    return {field: field not in taken for field in asked}
+
+
+def mark_names_added(session, names):
+    """
+    Add (username, email) pairs to the index when the transaction of
+    session commits. For users written by Core statements, the ORM ones are
+    found at flush.
+    """
+    session.info.setdefault(ADDED_NAMES, []).extend(names)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_added_names(session, flush_context):
+    names = [(instance.username, instance.email)
+             for instance in session.new | session.dirty
+             if isinstance(instance, User)]
+    if names:
+        mark_names_added(session, names)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _add_committed_names(session):
+    names = session.info.pop(ADDED_NAMES, None)
+    index = current_app.extensions.get('availability_index')
+    if names and index is not None:
+        index.add(names)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_added_names(session):
+    session.info.pop(ADDED_NAMES, None)
@@ -4,7 +4,8 @@ from flask_login import current_user
 # StringField enables string attributes in form classes
 # Password enables password attributes in form classes
 # Submit enables a submit button in form classes
-from wtforms import StringField, PasswordField, SubmitField, BooleanField
+from wtforms import (StringField, PasswordField, SubmitField, BooleanField,
+                     HiddenField)
 # DataRequired class ensures the form field must contain data from user
 # Length class validates acceptable length of data
 # Email class validates data as email format
@@ -14,7 +15,45 @@ from wtforms.validators import (DataRequired, Length, Email,
 from yahtzee.models import User
 
 
-class RegistrationForm(FlaskForm):
+class UniqueUserForm(FlaskForm):
+    """
+    Base of the forms choosing a username and email. The first of their
+    validators to run checks both against the db in one query.
+
+    :param FlaskForm: class inheretence from FlaskForm in flask_wtf
+    """
+    _taken_fields = None
+
+    def taken_fields(self):
+        """
+        Get the fields of the form holding a username or email of another
+        user, querying once per form.
+
+        :return: set of field names, of 'username' and 'email'
+        """
+        if self._taken_fields is None:
+            self._taken_fields = User.taken(self.username.data,
+                                            self.email.data)
+        return self._taken_fields
+
+    def validate_username(self, username):
+        """Validates username before add/commit user in route
+
+        :param username: username of form.
+        """
+        if 'username' in self.taken_fields():
+            raise ValidationError(f'Please select a unique username.')
+
+    def validate_email(self, email):
+        """Validates email before add/commit user in route
+
+        :param email: email of form.
+        """
+        if 'email' in self.taken_fields():
+            raise ValidationError(f'Please select a unique email.')
+
+
+class RegistrationForm(UniqueUserForm):
     """
     This is the registration form class utilized in /register route
 
@@ -39,24 +78,6 @@ class RegistrationForm(FlaskForm):
                                                  EqualTo('password')])
     submit = SubmitField('Sign Up')
 
-    def validate_username(self, username):
-        """Validates username before add/commit user in route
-
-        :param username: username of form.
-        """
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError(f'Please select a unique username.')
-
-    def validate_email(self, email):
-        """Validates email before add/commit user in route
-
-        :param email: email of form.
-        """
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError(f'Please select a unique email.')
-
 
 class LoginForm(FlaskForm):
     """
@@ -74,7 +95,7 @@ class LoginForm(FlaskForm):
     submit = SubmitField('Login')
 
 
-class UpdateAccountForm(FlaskForm):
+class UpdateAccountForm(UniqueUserForm):
     """
     This is the update account form class utilized in /account route
 
@@ -94,33 +115,26 @@ class UpdateAccountForm(FlaskForm):
                 'Profile Picture',
                 validators=[FileAllowed(['jpg', 'png'])]
                 )
+    # version_id of the user when the form was rendered
+    version = HiddenField()
     submit = SubmitField('Update')
 
-    def validate_username(self, username):
-        """Validates username before add/commit user in route
-
-        :param username: username in form.
+    def taken_fields(self):
         """
-        # first check if user is updating username before validating unique
-        if username.data != current_user.username:
+        Get the fields of the form changed to a username or email of another
+        user, querying once per form and only if either changed.
 
-            # validate uniqueness of username
-            user = User.query.filter_by(username=username.data).first()
-            if user:
-                raise ValidationError(f'Please select a unique username.')
-
-    def validate_email(self, email):
-        """Validates email before add/commit user in route
-
-        :param email: email of form.
+        :return: set of field names, of 'username' and 'email'
         """
-        # first check if user is updating email before validating unique
-        if email.data != current_user.email:
-
-            # validate uniqueness of email
-            user = User.query.filter_by(email=email.data).first()
-            if user:
-                raise ValidationError(f'Please select a unique email.')
+        if self._taken_fields is None:
+            username = self.username.data
+            email = self.email.data
+            self._taken_fields = User.taken(
+                username if username != current_user.username else None,
+                email if email != current_user.email else None,
+                exclude_id=current_user.id
+            )
+        return self._taken_fields
 
 
 class RequestResetForm(FlaskForm):
@@ -0,0 +1,123 @@
+"""
+This module runs bcrypt password hashing on a bounded pool of worker threads.
+At most BCRYPT_POOL_WORKERS hashes run at once and BCRYPT_QUEUE_DEPTH more may
+wait for a worker; beyond that a request fails fast with a 503 instead of
+queueing behind a burst of logins.
+"""
+
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+
+from yahtzee import app_extension, bcrypt
+from yahtzee.metrics.utils import BCRYPT_DURATION
+
+# stored for accounts without a password yet, no password ever matches it
+UNUSABLE_PASSWORD = '!'
+
+# a bcrypt hash looks like $2b$12$<salt><checksum>, the 2nd field is the cost
+BCRYPT_COST = re.compile(r'^\$2[abxy]?\$(\d\d)\$')
+
+
+class HashingPoolBusy(ServiceUnavailable):
+    """
+    Raised when every worker of the hashing pool is busy and its queue is
+    full. The errors blueprint renders it as a 503 with a Retry-After header.
+    """
+    description = 'The server is busy right now. Please try again shortly.'
+
+    def __init__(self, retry_after=1):
+        super().__init__()
+        self.retry_after = retry_after
+
+
+class HashingPool(object):
+    """
+    A thread pool with a bounded number of running and queued jobs.
+    """
+    def __init__(self, workers, queue_depth):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='bcrypt'
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+
+    def run(self, fn, *args):
+        """
+        Run fn(*args) on the pool and wait for its result.
+
+        :raises HashingPoolBusy: if the pool and its queue are full
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+
+def get_pool():
+    """
+    Get the hashing pool of the current app, creating it from its config on
+    first use, so that each forked worker gets its own.
+    """
+    return app_extension('hashing_pool', lambda app: HashingPool(
+        app.config['BCRYPT_POOL_WORKERS'],
+        app.config['BCRYPT_QUEUE_DEPTH']
+    ))
+
+
+def _check(pw_hash, password):
+    """
+    Check password against pw_hash, treating a malformed hash as no match.
+    """
+    try:
+        return bcrypt.check_password_hash(pw_hash, password)
+    except ValueError:
+        return False
+
+
+def generate_password_hash(password):
+    """
+    Hash a password on the pool with the configured BCRYPT_LOG_ROUNDS.
+
+    :param password: plaintext password
+    :return: bcrypt hash as str
+    """
+    rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+    with BCRYPT_DURATION.time('hash'):
+        return get_pool() \
+            .run(bcrypt.generate_password_hash, password, rounds) \
+            .decode('utf-8')
+
+
+def check_password_hash(pw_hash, password):
+    """
+    Check a password against a bcrypt hash on the pool.
+
+    :param pw_hash: stored bcrypt hash
+    :param password: plaintext password
+    :return: True if the password matches
+    """
+    with BCRYPT_DURATION.time('check'):
+        return get_pool().run(_check, pw_hash, password)
+
+
+def needs_rehash(pw_hash):
+    """
+    Check if a hash was made with a lower cost than BCRYPT_LOG_ROUNDS. A
+    stronger hash is kept, e.g. when a development config with fewer rounds
+    logs in to a copy of the production db.
+
+    :param pw_hash: stored bcrypt hash
+    :return: True if the hash should be replaced
+    """
+    match = BCRYPT_COST.match(pw_hash)
+    return match is None \
+        or int(match.group(1)) < current_app.config['BCRYPT_LOG_ROUNDS']
@@ -0,0 +1,167 @@
+"""
+This module renders uploaded profile pictures on a pool of worker processes.
+Each upload is stored under the hash of its content in several precomputed
+sizes, as JPEG plus a WebP variant, so identical uploads share their files.
+"""
+
+import fcntl
+import glob
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from PIL import Image, ImageOps, features
+
+# image_file of users without a profile picture
+DEFAULT_IMAGE = 'default.jpg'
+
+
+def content_digest(data):
+    """
+    Name an upload by its content, short enough for User.image_file.
+
+    :param data: bytes of the uploaded file
+    :return: 16 hex digit digest
+    """
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def avatar_filename(image_file, size, ext='jpg'):
+    """
+    Get the filename of one variant of a profile picture. Pictures uploaded
+    before variants existed (and the default) keep a single file with its own
+    extension, which is used for every size.
+
+    :param image_file: User.image_file
+    :param size: width/height in pixels, one of AVATAR_SIZES
+    :param ext: 'jpg' or 'webp'
+    :return: filename in static/profile_pics
+    """
+    if os.path.splitext(image_file)[1]:
+        return image_file
+    return f'{image_file}_{size}.{ext}'
+
+
+def render_avatar(data, directory, digest, sizes, webp):
+    """
+    Decode an upload and save every size variant of it. This runs in a
+    worker process.
+
+    :param data: bytes of the uploaded file
+    :param directory: directory to save the variants in
+    :param digest: content digest naming the variants
+    :param sizes: sizes in pixels to render
+    :param webp: also save a WebP variant of every size
+    """
+    image = Image.open(io.BytesIO(data))
+
+    # let the JPEG decoder downscale by up to 1/8 while decoding, so a large
+    # photo is never decoded at full resolution
+    if image.format == 'JPEG':
+        image.draft('RGB', (max(sizes), max(sizes)))
+
+    image = ImageOps.exif_transpose(image).convert('RGB')
+
+    # shrink step by step from the largest size, each step starts from the
+    # previous (already small) image
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size))
+        for ext, fmt in (('jpg', 'JPEG'), ('webp', 'WEBP')):
+            if fmt == 'WEBP' and not webp:
+                continue
+            path = os.path.join(directory, avatar_filename(digest, size, ext))
+
+            # write then rename, so a variant is never served half written
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            image.save(tmp_path, fmt, quality=85)
+            os.replace(tmp_path, path)
+
+
+@contextmanager
+def avatar_lock(directory):
+    """
+    Hold an exclusive lock on the pictures directory, shared by every process
+    of the app, while reusing or removing the files of a picture.
+
+    :param directory: directory the variants are saved in
+    """
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def reuse_avatar(directory, digest, sizes):
+    """
+    Mark the saved variants of a picture as just used, so a removal running
+    before the upload reusing them is committed leaves them alone. Call it
+    under avatar_lock.
+
+    :param directory: directory the variants are saved in
+    :param digest: content digest naming the variants
+    :param sizes: sizes in pixels the upload needs
+    :return: whether every size was saved already
+    """
+    try:
+        for size in sizes:
+            os.utime(os.path.join(directory, avatar_filename(digest, size)))
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def remove_avatar(directory, image_file, unused_for=0):
+    """
+    Delete every variant file of a profile picture, except the default.
+    Call it under avatar_lock.
+
+    :param directory: directory the variants are saved in
+    :param image_file: User.image_file
+    :param unused_for: seconds none of the files may have been used for
+    :return: whether the files were deleted
+    """
+    if image_file == DEFAULT_IMAGE:
+        return False
+
+    if os.path.splitext(image_file)[1]:
+        paths = [os.path.join(directory, image_file)]
+    else:
+        paths = glob.glob(os.path.join(directory, f'{image_file}_*'))
+
+    # files saved or reused lately may belong to an upload not committed yet
+    cutoff = time.time() - unused_for
+    for path in paths:
+        try:
+            if os.stat(path).st_mtime > cutoff:
+                return False
+        except FileNotFoundError:
+            pass
+
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return True
+
+
+class ImagePool(object):
+    """
+    A process pool rendering avatars, created on first use by each app.
+    """
+    def __init__(self, workers):
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+
+    def render(self, data, directory, digest, sizes, webp):
+        """
+        Render an upload on the pool and wait until its files are saved.
+        """
+        self._executor.submit(
+            render_avatar, data, directory, digest, sizes,
+            webp and features.check('webp')
+        ).result()
@@ -1,23 +1,29 @@
-from flask import render_template, url_for, flash, redirect, request, Blueprint
+from flask import (render_template, url_for, flash, redirect, request,
+                   Blueprint, jsonify)
 from flask_login import login_user, current_user, logout_user, login_required
+from sqlalchemy.orm.exc import StaleDataError
 
-from yahtzee import db, bcrypt
+from yahtzee import db
 from yahtzee.users.forms import (RegistrationForm, LoginForm,
                                  UpdateAccountForm, RequestResetForm,
                                  ResetPasswordForm)
 from yahtzee.models import User
-from yahtzee.users.utils import save_picture, send_reset_email
+from yahtzee.ratelimit import limit
+from yahtzee.user_cache import get_user_cache
+from yahtzee.users.availability import available
+from yahtzee.users.utils import (save_picture, delete_unused_picture,
+                                 avatar_urls, send_reset_email)
+from yahtzee.users.hashing import (generate_password_hash,
+                                   check_password_hash, needs_rehash)
 
 import logging
+# queued and written as JSON lines to USERS_LOG_FILE by yahtzee.logs, pass
+# plain values in extra rather than formatting messages here
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
-formatter = logging.Formatter('%(levelname)s:%(name)s:%(message)s')
-
-file_handler = logging.FileHandler('yahtzee/users.log')
-file_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
+# flashed when the account form was rendered from an older version of the user
+STALE_ACCOUNT = ('Your account was changed elsewhere, please review and '
+                 'update it again.')
 
 # create users Blueprint instance to manage app structure
 users = Blueprint('users', __name__)
@@ -38,8 +44,7 @@ def register():
     if form.validate_on_submit():
 
         # hash password and create user from register form submission
-        hashed_password = bcrypt.generate_password_hash(
-                            form.password.data).decode('utf-8')
+        hashed_password = generate_password_hash(form.password.data)
 
         # create user object
         user = User(
@@ -53,11 +58,16 @@ def register():
         # try to create user in db
         try:
             db.session.add(user)
+            # the id is read before commit expires the user
+            db.session.flush()
+            user_id = user.id
             db.session.commit()
             flash(f'Account created for {form.username.data}.', 'success')
-            logger.info(f'User created: "{user}"')
-        except Exception as e:
-            logger.exception(f'{e}')
+            logger.info('User created', extra={'event': 'user_created',
+                                               'user_id': user_id})
+        except Exception:
+            logger.exception('User not created',
+                             extra={'event': 'user_create_failed'})
 
         # redirect user to login page
         return redirect(url_for('users.login'))  # url_for arg is route func not arg
@@ -65,6 +75,22 @@ def register():
     return render_template("register.html", title='Register', form=form)
 
 
+@users.route("/register/available")
+def register_available():
+    """
+    This route tells the registration page if a username and email are free,
+    e.g. /register/available?username=<username>&email=<email>
+    """
+    limit('AVAILABILITY')
+
+    username = request.args.get('username')
+    email = request.args.get('email')
+    if not username and not email:
+        return jsonify(message='Pass a username or an email.'), 400
+
+    return jsonify(available(username or None, email or None))
+
+
 @users.route("/login", methods=['GET', 'POST'])
 def login():
     """
@@ -76,6 +102,10 @@ def login():
 
     form = LoginForm()
 
+    # count attempts by address and account before hashing any password
+    if form.is_submitted():
+        limit('LOGIN', form.email.data)
+
     # add validate on submit to alert user if form submission successful
     if form.validate_on_submit():
 
@@ -83,8 +113,18 @@ def login():
         user = User.query.filter_by(email=form.email.data).first()
 
         # check if user and that form password matches hashed password
-        if user and bcrypt.check_password_hash(user.password,
-                                               form.password.data):
+        if user and check_password_hash(user.password, form.password.data):
+
+            # upgrade hashes made with an older cost now we know the password,
+            # unless a concurrent request changed the user, then next time
+            if needs_rehash(user.password):
+                user.password = generate_password_hash(form.password.data)
+                try:
+                    db.session.commit()
+                except StaleDataError:
+                    db.session.rollback()
+                    # another worker changed the user, drop the copy of ours
+                    get_user_cache().invalidate([user.id])
 
             # login the user with login_user method from flask_login
             login_user(user, remember=form.remember.data)
@@ -120,51 +160,71 @@ def account():
     # create form from class
     form = UpdateAccountForm()
 
+    # the account may have changed (e.g. in another tab) since the form was
+    # rendered, then show the current values instead of overwriting them
+    stale = form.is_submitted() \
+        and form.version.data != str(current_user.version_id)
+    if stale:
+        flash(STALE_ACCOUNT, 'warning')
+
     # if valid form submission, update current_user attributes and flash msg
-    if form.validate_on_submit():
+    elif form.validate_on_submit():
 
-        # log current_user data
-        logger.info(f"current_user({current_user.first_name}, "
-                    f"{current_user.last_name}, {current_user.username}, "
-                    f"{current_user.email}, {current_user.image_file})")
+        # the user and the names of the fields changed, for the log
+        user_id = current_user.id
+        changed = [name for name in ('username', 'email', 'first_name',
+                                     'last_name')
+                   if getattr(form, name).data != getattr(current_user, name)]
 
         # if update form field pic, rename/save pic, and update db image_file
+        old_image_file = current_user.image_file
         if form.picture.data:
             picture_file = save_picture(form.picture.data)
             current_user.image_file = picture_file
-            logger.info(f"Updated {current_user.username} "
-                        f"picture: {picture_file}")
+            changed.append('image_file')
 
         # update current_user with form field data, and commit to db
         current_user.username = form.username.data
         current_user.email = form.email.data
         current_user.first_name = form.first_name.data
         current_user.last_name = form.last_name.data
-        db.session.commit()
-
-        # log updated current_user data
-        logger.info(f"current_user({current_user.first_name}, "
-                    f"{current_user.last_name}, {current_user.username}, "
-                    f"{current_user.email}, {current_user.image_file})")
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            # another worker changed the user, so the cached copy the form
+            # was checked against is stale, reload it on the next request
+            get_user_cache().invalidate([user_id])
+            if form.picture.data:
+                delete_unused_picture(picture_file)
+            flash(STALE_ACCOUNT, 'warning')
+            return redirect(url_for('users.account'))
+
+        # delete the replaced picture's files unless another user shares them
+        if current_user.image_file != old_image_file:
+            delete_unused_picture(old_image_file)
+
+        logger.info('Account updated', extra={'event': 'account_updated',
+                                              'user_id': user_id,
+                                              'changed': changed})
 
         flash('Account update successful', 'success')
 
         # redirect user to account route avoid post/redirect/get pattern issue
         return redirect(url_for('users.account'))
 
-    elif request.method == 'GET':
+    if request.method == 'GET' or stale:
         form.first_name.data = current_user.first_name
         form.last_name.data = current_user.last_name
         form.email.data = current_user.email
         form.username.data = current_user.username
+    form.version.data = current_user.version_id
 
-    image_file = url_for(
-                    'static',
-                    filename='profile_pics/' + current_user.image_file
-                    )
+    image_file, image_webp = avatar_urls(current_user.image_file, 125)
 
     return render_template("account.html", title='Account',
-                           image_file=image_file, form=form)
+                           image_file=image_file, image_webp=image_webp,
+                           form=form)
 
 
 @users.route("/reset_password", methods=['GET', 'POST'])
@@ -178,11 +238,16 @@ def reset_request():  # this func is named _request vs _password in url
 
     form = RequestResetForm()
 
+    # count requests by address and account before sending any email
+    if form.is_submitted():
+        limit('RESET_PASSWORD', form.email.data)
+
     # if rendered form is submitted, get user from email, send reset email
     # with token, and redirect user to the login page
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         send_reset_email(user)
+        db.session.commit()
         flash('Email has been sent to reset your password', 'info')
         return redirect(url_for('users.login'))
 
@@ -214,17 +279,20 @@ def reset_token(token):  # this func is named _token, accepts token param
     if form.validate_on_submit():
 
         # hash password from reset password form submission
-        hashed_password = bcrypt.generate_password_hash(
-                            form.password.data).decode('utf-8')
+        hashed_password = generate_password_hash(form.password.data)
 
         # try to update user password in db
+        user_id = user.id
         try:
             user.password = hashed_password
             db.session.commit()
             flash(f'Your password has been updated.', 'success')
-            logger.info(f'User created: "{user}"')
-        except Exception as e:
-            logger.exception(f'{e}')
+            logger.info('Password reset', extra={'event': 'password_reset',
+                                                 'user_id': user_id})
+        except Exception:
+            logger.exception('Password not reset',
+                             extra={'event': 'password_reset_failed',
+                                    'user_id': user_id})
 
         # redirect user to login page
         return redirect(url_for('users.login'))  # url_for arg is route func not arg
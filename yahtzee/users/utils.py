@@ -1,64 +1,112 @@
 import os
-import secrets
 
-from PIL import Image
-from flask import url_for
-from flask_mail import Message
+from flask import current_app, url_for
+from PIL import features
 
-from yahtzee import app, mail
+from yahtzee import app_extension
+from yahtzee.assets.utils import asset_url
+from yahtzee.metrics.utils import IMAGE_DURATION
+from yahtzee.models import User
+from yahtzee.outbox import queue_message
+from yahtzee.users.images import (ImagePool, avatar_filename, avatar_lock,
+                                  content_digest, remove_avatar,
+                                  reuse_avatar)
+
+
+def _profile_pics_dir():
+    return os.path.join(current_app.root_path, 'static/profile_pics')
+
+
+def get_image_pool():
+    """
+    Get the image pool of the current app, creating it from its config on
+    first use, so that each forked worker gets its own.
+    """
+    return app_extension('image_pool', lambda app: ImagePool(
+        app.config['IMAGE_POOL_WORKERS']
+    ))
 
 
 def save_picture(form_picture):
     """
-    This function renames a form field picture with a unique path.
-    It then saves new filename to filesystem.
+    This function names a form field picture by the hash of its content and
+    renders its size variants on the image pool. An upload identical to an
+    existing picture reuses the files already saved.
+
+    :return picture_filename: The content digest naming the variants.
+    """
+    data = form_picture.read()
+    digest = content_digest(data)
+    directory = _profile_pics_dir()
+    sizes = current_app.config['AVATAR_SIZES']
+
+    # only decode and resize if these exact bytes were not uploaded before,
+    # reusing files under the lock so they are not deleted under this upload
+    with avatar_lock(directory):
+        exists = reuse_avatar(directory, digest, sizes)
+    if not exists:
+        with IMAGE_DURATION.time():
+            get_image_pool().render(
+                data, directory, digest, sizes,
+                current_app.config['AVATAR_WEBP']
+            )
+
+    return digest
+
+
+def delete_unused_picture(image_file):
+    """
+    Delete the files of a replaced picture once no user refers to it. Files
+    saved or reused by an upload in the last AVATAR_REUSE_GRACE seconds are
+    kept, the upload may not be committed yet.
+
+    :param image_file: the User.image_file that was replaced
+    :return: whether the files were deleted
+    """
+    directory = _profile_pics_dir()
+    with avatar_lock(directory):
+        # checked under the lock, a committed upload may refer to it by now
+        if User.query.filter_by(image_file=image_file).first() is not None:
+            return False
+        return remove_avatar(directory, image_file,
+                             current_app.config['AVATAR_REUSE_GRACE'])
+
 
-    :return picture_filename: The new unique filename with basename 8 byte hex.
+def avatar_urls(image_file, size):
     """
-    # create a new unique path for the form_picture to prevent collisions
-    random_hex = secrets.token_hex(8)
-    _, file_ext = os.path.splitext(form_picture.filename)
-    picture_filename = random_hex + file_ext
-    picture_path = os.path.join(
-                        app.root_path,
-                        'static/profile_pics',
-                        picture_filename
-                        )
+    Get the fingerprinted URLs of the JPEG and WebP variants of a profile
+    picture.
 
-    # resize to maximum image size
-    output_size = (125, 125)
-    i = Image.open(form_picture)
-    i.thumbnail(output_size)
+    :return: (jpeg_url, webp_url), webp_url is None if there is no variant
+    """
+    jpeg_url = asset_url('profile_pics/' + avatar_filename(image_file, size))
 
-    # use the save method on the resized i picture at the unique picture_path
-    i.save(picture_path)
+    webp_url = None
+    if not os.path.splitext(image_file)[1] \
+            and current_app.config['AVATAR_WEBP'] and features.check('webp'):
+        webp_url = asset_url('profile_pics/'
+                             + avatar_filename(image_file, size, 'webp'))
 
-    return picture_filename
+    return jpeg_url, webp_url
 
 
 def send_reset_email(user):
     """
-    Gets a token from passed-in user and mail.send a reset password email.
+    Gets a token from passed-in user and queues a reset password email in the
+    outbox. The email is sent by the outbox worker once the caller commits.
 
     :param user: unauthenticated user
     """
     # get token for passed-in user from User model's get_reset_token() method
     token = user.get_reset_token()
 
-    # create a Message instance
-    msg = Message(
-            'Password Reset Request',
-            sender='noreply@demo.com',
-            recipients=[user.email]
-            )
-
     # add msg body with url_for link containing route, token and _external
     # boolean True to make link absolute url (relative works when inside app)
-    msg.body = f"""To reset your password, visit the following link:
+    body = f"""To reset your password, visit the following link:
 {url_for('users.reset_token', token=token, _external=True)}
 
 If you did not maket this request then ignore this email.
 """
 
-    # send the email msg
-    mail.send(msg)
+    # queue the email msg in the outbox
+    queue_message('Password Reset Request', user.email, body)
@@ -0,0 +1,56 @@
+"""
+This module maps the version_id of User, Game and UsersGames rows to HTTP.
+The version is sent as a strong ETag, and a write carrying If-Match only
+applies while the row still has one of the listed versions. A write that
+loses the race gets a 409 with the current state of the row to retry from.
+"""
+
+from flask import abort, jsonify, make_response, request
+from werkzeug.http import quote_etag
+
+
+def version_etag(version_id):
+    """
+    Get the ETag header value of a row version.
+
+    :param version_id: version_id of the row
+    :return: quoted strong ETag
+    """
+    return quote_etag(str(version_id))
+
+
+def if_match_versions():
+    """
+    Get the row versions the If-Match header of the request allows.
+
+    :return: list of version_ids, or None without If-Match or with
+        If-Match: * (any version)
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+
+    # weak tags and tags that are not versions can never match
+    versions = []
+    for etag in if_match.as_set(include_weak=False):
+        try:
+            versions.append(int(etag))
+        except ValueError:
+            pass
+    return versions
+
+
+def abort_conflict(message, current, version_id):
+    """
+    Abort with a 409 carrying the current state and version of the row.
+
+    :param message: reason of the conflict
+    :param current: serialized current state of the row
+    :param version_id: current version_id of the row
+    """
+    response = make_response(
+        jsonify(message=message, current=current),
+        409
+    )
+    response.headers['ETag'] = version_etag(version_id)
+    abort(response)